@@ -1,9 +1,22 @@
 """aiobfd: Asynchronous BFD Daemon"""
 # pylint: disable=I0011,W0401
 
+from .auth import *  # noqa: F403
+from .config import *  # noqa: F403
 from .control import *  # noqa: F403
+from .damping import *  # noqa: F403
+from .echo import *  # noqa: F403
+from .pacing import *  # noqa: F403
 from .packet import *  # noqa: F403
+from .pauses import *  # noqa: F403
+from .persist import *  # noqa: F403
+from .rxqueue import *  # noqa: F403
+from .sbfd import *  # noqa: F403
 from .session import *  # noqa: F403
+from .takeover import *  # noqa: F403
+from .timers import *  # noqa: F403
 from .transport import *  # noqa: F403
 
-__all__ = ['control', 'packet', 'session', 'transport']
+__all__ = ['auth', 'config', 'control', 'damping', 'echo', 'pacing',
+           'packet', 'pauses', 'persist', 'rxqueue', 'sbfd', 'session',
+           'takeover', 'timers', 'transport']
@@ -1,11 +1,19 @@
 """aiobfd: Asynchronous BFD Daemon"""
 
 import argparse
+import importlib.util
+import ipaddress
+import signal
 import socket
 import logging
 import logging.handlers
 import sys
 import aiobfd
+from aiobfd.config import read_file, parse_config, parse_drain, \
+    parse_bind, parse_gc, parse_intake, parse_listen, parse_multihop, \
+    parse_pacing, parse_persist, parse_reflector, parse_resolve_interval, \
+    parse_socket_profile
+log = logging.getLogger(__name__)  # pylint: disable=I0011,C0103
 
 _LOG_LEVELS = ['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG']
 
@@ -14,8 +22,13 @@ def parse_arguments():
     """Parse the user arguments"""
     parser = argparse.ArgumentParser(
         description='Maintain a BFD session with a remote system')
-    parser.add_argument('local', help='Local IP address or hostname')
-    parser.add_argument('remote', help='Remote IP address or hostname')
+    parser.add_argument('local', nargs='?',
+                        help='Local IP address or hostname')
+    parser.add_argument('remote', nargs='?',
+                        help='Remote IP address or hostname')
+    parser.add_argument('-c', '--config',
+                        help='TOML or YAML file describing the sessions, '
+                             'reloaded on SIGHUP')
     family_group = parser.add_mutually_exclusive_group()
     family_group.add_argument('-4', '--ipv4', action='store_const',
                               dest='family', default=socket.AF_UNSPEC,
@@ -29,10 +42,81 @@ def parse_arguments():
                         help='Required minimum Rx interval (ms)')
     parser.add_argument('-t', '--tx-interval', default=1000, type=int,
                         help='Desired minimum Tx interval (ms)')
+    parser.add_argument('-e', '--echo-interval', default=0, type=int,
+                        help='Send Echo packets and loop back those of the '
+                             'remote at this interval (ms), 0 to disable')
+    parser.add_argument('--echo-aiobfd', action='store_true',
+                        help='The remote runs aiobfd, which the Echo function '
+                             'requires')
     parser.add_argument('-m', '--detect-mult', default=1, type=int,
                         help='Detection multiplier')
     parser.add_argument('-p', '--passive', action='store_true',
                         help='Take a passive role in session initialization')
+    parser.add_argument('-D', '--demand', action='store_true',
+                        help='Ask the remote to stop sending packets once '
+                             'the session is Up (Demand mode)')
+    parser.add_argument('-M', '--multihop', action='store_true',
+                        help='Run a multihop session (RFC 5883) on UDP port '
+                             '4784, for remotes that are not directly '
+                             'connected')
+    parser.add_argument('-I', '--sbfd', type=int, metavar='DISCR',
+                        help='Run an S-BFD session (RFC 7880) with the '
+                             'reflector of the remote on UDP port 7784, '
+                             'which answers for this discriminator')
+    parser.add_argument('-R', '--reflector', action='append', type=int,
+                        metavar='DISCR',
+                        help='Reflect S-BFD packets of initiators for this '
+                             'discriminator, may be repeated')
+    parser.add_argument('-L', '--listen', action='append', metavar='PREFIX',
+                        type=ipaddress.ip_network,
+                        help='Create passive sessions on demand for remotes '
+                             'in this prefix, may be repeated')
+    parser.add_argument('-V', '--device', metavar='DEVICE',
+                        help='Bind the session to this interface or VRF '
+                             'device')
+    parser.add_argument('-B', '--bind', action='append',
+                        metavar='LOCAL[@DEVICE]',
+                        help='Also accept packets on this local address, '
+                             'optionally on an interface or VRF device, may '
+                             'be repeated')
+    parser.add_argument('-C', '--connected', action='store_true',
+                        help='Connect the source socket to the remote, '
+                             'avoids a route lookup per packet and reports '
+                             'ICMP unreachables')
+    parser.add_argument('-d', '--drain-hold', type=float, metavar='SECONDS',
+                        help='Keep sending AdminDown packets for this long '
+                             'when terminating')
+    parser.add_argument('-S', '--state-file', metavar='PATH',
+                        help='Save the session state to this file and resume '
+                             'the sessions from it after a quick restart')
+    parser.add_argument('-T', '--takeover-socket', metavar='PATH',
+                        help='Unix socket on which a new process can take '
+                             'over the sessions, for upgrades without flaps')
+    parser.add_argument('--takeover', action='store_true',
+                        help='Take over the sessions from the process '
+                             'listening on --takeover-socket')
+    parser.add_argument('--resolve-interval', type=float, metavar='SECONDS',
+                        help='Look up remotes configured by hostname again '
+                             'at this interval (default %d), the TTL of '
+                             'the records is not known' %
+                        aiobfd.RESOLVE_INTERVAL)
+    parser.add_argument('--loop', default='asyncio', choices=aiobfd.LOOPS,
+                        help='Event loop implementation')
+    parser.add_argument('--timers', default='asyncio', choices=aiobfd.TIMERS,
+                        help='Wake up the sessions on asyncio timers or, on '
+                             'Linux, a timerfd for sub-millisecond accuracy')
+    parser.add_argument('--stagger', action='store_true',
+                        help='Spread the first packets of sessions that '
+                             'start or restart together over their interval')
+    parser.add_argument('--max-pps', type=int, metavar='PPS',
+                        help='Spread the packets of all sessions to stay '
+                             'below this rate where their jitter allows')
+    parser.add_argument('--gc-freeze', action='store_true',
+                        help='Exempt the objects alive after startup and '
+                             'configuration loads from garbage collection')
+    parser.add_argument('--gc-idle', action='store_true',
+                        help='Only run garbage collections while the event '
+                             'loop is idle')
     parser.add_argument('-l', '--log-level', default='WARNING',
                         help='Logging level', choices=_LOG_LEVELS)
     parser.add_argument('-o', '--no-log-to-stdout', action='store_true',
@@ -46,7 +130,42 @@ def parse_arguments():
                         help='Enable logging to a syslog handler')
     parser.add_argument('-y', '--log-sock', default='/dev/log',
                         help='Syslog socket to log to, if enabled')
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not args.config and not (args.local and (args.remote or args.listen or
+                                                args.reflector)):
+        parser.error('either a local and remote address, a local address '
+                     'and --listen or --reflector, or --config is required')
+    if args.takeover and not args.takeover_socket:
+        parser.error('--takeover requires --takeover-socket')
+    if args.echo_interval and not args.echo_aiobfd:
+        parser.error('--echo-interval requires --echo-aiobfd, only remotes '
+                     'that run aiobfd loop back its Echo packets')
+    if args.resolve_interval is not None and args.resolve_interval <= 0:
+        parser.error('--resolve-interval must be positive')
+    if args.loop == 'uvloop' and importlib.util.find_spec('uvloop') is None:
+        parser.error('uvloop is not installed, pip install aiobfd[uvloop]')
+    return args
+
+
+async def reload_config(control, path, pacing=None):
+    """Re-read the configuration file and apply the differences, `pacing`
+       overrides the pacing settings from the file"""
+    log.warning('Reloading configuration from %s.', path)
+    try:
+        data = read_file(path)
+        _, _, sessions = parse_config(data)
+        socket_profile = parse_socket_profile(data)
+        listen = parse_listen(data)
+        reflector = parse_reflector(data)
+        pacing = dict(parse_pacing(data), **(pacing or {}))
+    except (IOError, ValueError) as exc:
+        log.error('Not reloading, invalid configuration: %s', exc)
+        return
+    control.set_socket_profile(socket_profile)
+    control.set_listen(listen)
+    control.set_reflector(reflector)
+    control.set_pacing(pacing)
+    await control.reconfigure(sessions)
 
 
 def main():
@@ -64,11 +183,89 @@ def main():
     log_format = '%(asctime)s %(name)-12s %(levelname)-8s %(message)s'
     logging.basicConfig(handlers=handlers, format=log_format,
                         level=logging.getLevelName(args.log_level))
-    control = aiobfd.Control(args.local, [args.remote], family=args.family,
-                             passive=args.passive,
-                             rx_interval=args.rx_interval*1000,
-                             tx_interval=args.tx_interval*1000,
-                             detect_mult=args.detect_mult)
+    loop = aiobfd.new_event_loop(args.loop)
+    drain = {}
+    if args.drain_hold is not None:
+        drain['hold'] = args.drain_hold
+    persist = {}
+    if args.state_file:
+        persist['path'] = args.state_file
+    gc = {}
+    if args.gc_freeze:
+        gc['freeze'] = True
+    if args.gc_idle:
+        gc['idle'] = True
+    pacing = {}
+    if args.stagger:
+        pacing['stagger'] = True
+    if args.max_pps is not None:
+        pacing['max_pps'] = args.max_pps
+    if args.config:
+        data = read_file(args.config)
+        local, family, sessions = parse_config(data)
+        drain = dict(parse_drain(data), **drain)
+        persist = dict(parse_persist(data), **persist)
+        gc = dict(parse_gc(data), **gc)
+        control = aiobfd.Control(local, [], family=family,
+                                 socket_profile=parse_socket_profile(data),
+                                 intake=parse_intake(data),
+                                 listen=parse_listen(data), drain=drain,
+                                 persist=persist,
+                                 multihop_settings=parse_multihop(data),
+                                 reflector=parse_reflector(data),
+                                 bind=parse_bind(data), gc=gc,
+                                 pacing=dict(parse_pacing(data), **pacing),
+                                 timers=args.timers,
+                                 resolve_interval=args.resolve_interval or
+                                 parse_resolve_interval(data),
+                                 takeover_socket=args.takeover_socket,
+                                 take_over=args.takeover, loop=loop)
+        control.loop.run_until_complete(control.reconfigure(sessions))
+        control.loop.add_signal_handler(
+            signal.SIGHUP,
+            lambda: control.loop.create_task(
+                reload_config(control, args.config, pacing)))
+    else:
+        listen = None
+        bind = []
+        for address in args.bind or ():
+            local, _, device = address.partition('@')
+            bind.append({'local': local, 'device': device or None})
+        if args.listen:
+            listen = {'prefixes': args.listen, 'connected': args.connected,
+                      'rx_interval': args.rx_interval*1000,
+                      'tx_interval': args.tx_interval*1000,
+                      'echo_tx_interval': args.echo_interval*1000,
+                      'echo_rx_interval': args.echo_interval*1000,
+                      'echo_aiobfd': args.echo_aiobfd,
+                      'demand_mode': args.demand,
+                      'detect_mult': args.detect_mult}
+        control = aiobfd.Control(args.local,
+                                 [args.remote] if args.remote else [],
+                                 family=args.family, passive=args.passive,
+                                 connected=args.connected,
+                                 multihop=args.multihop,
+                                 reflector_discr=args.sbfd,
+                                 device=args.device, bind=bind,
+                                 reflector={'discriminators':
+                                            args.reflector or ()},
+                                 demand_mode=args.demand,
+                                 rx_interval=args.rx_interval*1000,
+                                 tx_interval=args.tx_interval*1000,
+                                 echo_tx_interval=args.echo_interval*1000,
+                                 echo_rx_interval=args.echo_interval*1000,
+                                 echo_aiobfd=args.echo_aiobfd,
+                                 detect_mult=args.detect_mult, listen=listen,
+                                 drain=drain, persist=persist, gc=gc,
+                                 pacing=pacing, timers=args.timers,
+                                 resolve_interval=args.resolve_interval or
+                                 aiobfd.RESOLVE_INTERVAL,
+                                 takeover_socket=args.takeover_socket,
+                                 take_over=args.takeover, loop=loop)
+    # Tell the remotes we are going away instead of letting them time out
+    control.loop.add_signal_handler(signal.SIGTERM, control.terminate)
+    # Unless we are about to be restarted and resume the sessions
+    control.loop.add_signal_handler(signal.SIGUSR1, control.terminate, False)
     control.run()
 
 if __name__ == '__main__':
@@ -0,0 +1,127 @@
+"""aiobfd: Keyed MD5 and SHA1 authentication (RFC 5880 section 6.7)"""
+
+import hashlib
+import hmac
+import struct
+
+'''
+ 0                   1                   2                   3
+ 0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+|   Auth Type   |   Auth Len    |  Auth Key ID  |   Reserved    |
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+|                        Sequence Number                        |
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+|                     Auth Key/Digest/Hash...                   |
++-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+'''
+
+AUTH_OFFSET = 24                    # Follows the mandatory section
+AUTH_HEADER = struct.Struct('!BBBBI')
+DIGEST_OFFSET = AUTH_OFFSET + AUTH_HEADER.size
+
+# Authentication Type, hash function, digest length and whether the
+# sequence number is incremented for every packet
+AUTH_KEYED_MD5 = 2
+AUTH_METICULOUS_KEYED_MD5 = 3
+AUTH_KEYED_SHA1 = 4
+AUTH_METICULOUS_KEYED_SHA1 = 5
+AUTH_TYPES = {
+    'keyed-md5': (AUTH_KEYED_MD5, 'md5', 16, False),
+    'meticulous-keyed-md5': (AUTH_METICULOUS_KEYED_MD5, 'md5', 16, True),
+    'keyed-sha1': (AUTH_KEYED_SHA1, 'sha1', 20, False),
+    'meticulous-keyed-sha1': (AUTH_METICULOUS_KEYED_SHA1, 'sha1', 20, True)
+}
+
+
+class Authentication:
+    """A key chain of one authentication type, signs transmitted packets
+       with the selected key and verifies received packets against any of
+       the keys"""
+
+    def __init__(self, type, keys, key_id=None):  # pylint: disable=W0622
+        if type not in AUTH_TYPES:
+            raise ValueError('Authentication type must be one of %s.'
+                             % ', '.join(AUTH_TYPES))
+        if not keys:
+            raise ValueError('No authentication keys configured.')
+        self.settings = {'type': type, 'keys': dict(keys), 'key_id': key_id}
+        self.type, algorithm, self.digest_len, self.meticulous = \
+            AUTH_TYPES[type]
+        self.auth_len = AUTH_HEADER.size + self.digest_len
+        self.length = AUTH_OFFSET + self.auth_len
+
+        # The key is hashed in place of the digest, padded with zeros. Hash
+        # objects are created once and copied for every packet.
+        self._template = hashlib.new(algorithm)
+        self._keys = {}
+        for kid, key in keys.items():
+            if not 0 <= int(kid) <= 255:
+                raise ValueError('Authentication key ID %s out of range.'
+                                 % kid)
+            if isinstance(key, str):
+                key = key.encode()
+            if not 0 < len(key) <= self.digest_len:
+                raise ValueError('Authentication key %s must be 1 to %d '
+                                 'bytes long.' % (kid, self.digest_len))
+            self._keys[int(kid)] = key.ljust(self.digest_len, b'\0')
+        self.key_id = max(self._keys) if key_id is None else int(key_id)
+        if self.key_id not in self._keys:
+            raise ValueError('Authentication key ID %s not configured.'
+                             % key_id)
+
+    def sign(self, buffer, seq):
+        """Fill in the Authentication Section of a packet in a buffer of
+           `length` bytes, of which the mandatory part is already encoded"""
+        AUTH_HEADER.pack_into(buffer, AUTH_OFFSET, self.type, self.auth_len,
+                              self.key_id, 0, seq)
+        digest = self._template.copy()
+        digest.update(memoryview(buffer)[:DIGEST_OFFSET])
+        digest.update(self._keys[self.key_id])
+        buffer[DIGEST_OFFSET:self.length] = digest.digest()
+
+    def verify(self, data, detect_mult, rcv_seq, seq_known):
+        """Check the Authentication Section of a received packet, returns its
+           sequence number or raises IOError"""
+        if len(data) < self.length:
+            raise IOError('Authentication section truncated.')
+        auth_type, auth_len, key_id, _, seq = \
+            AUTH_HEADER.unpack_from(data, AUTH_OFFSET)
+
+        # If the Auth Type field does not match bfd.AuthType, or the Auth Key
+        # ID field does not match the ID of a configured authentication key,
+        # or the Auth Len field is not equal to 24 (MD5) or 28 (SHA1), the
+        # packet MUST be discarded.
+        if auth_type != self.type:
+            raise IOError('Authentication type %d doesn\'t match %d.'
+                          % (auth_type, self.type))
+        key = self._keys.get(key_id)
+        if key is None:
+            raise IOError('Authentication key ID %d not configured.' % key_id)
+        if auth_len != self.auth_len or data[3] != self.length:
+            raise IOError('Authentication length %d doesn\'t match %d.'
+                          % (auth_len, self.auth_len))
+
+        # If bfd.AuthSeqKnown is 1, examine the Sequence Number field. If it
+        # is not within the range bfd.RcvAuthSeq (+1 for the meticulous
+        # types) to bfd.RcvAuthSeq+(3*Detect Mult) inclusive (when treated as
+        # an unsigned 32 bit circular number space), the packet MUST be
+        # discarded.
+        if seq_known:
+            ahead = (seq - rcv_seq) & 0xffffffff
+            if ahead > 3 * detect_mult or (self.meticulous and not ahead):
+                raise IOError('Authentication sequence number %d out of '
+                              'window.' % seq)
+
+        # Replace the contents of the Auth Key/Digest field with the
+        # authentication key selected by the received Auth Key ID field. If
+        # the digest/hash calculated does not match the received value, the
+        # packet MUST be discarded.
+        digest = self._template.copy()
+        view = memoryview(data)
+        digest.update(view[:DIGEST_OFFSET])
+        digest.update(key)
+        if not hmac.compare_digest(digest.digest(),
+                                   view[DIGEST_OFFSET:self.length]):
+            raise IOError('Authentication digest mismatch.')
+        return seq
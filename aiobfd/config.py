@@ -0,0 +1,362 @@
+"""aiobfd: Declarative session configuration"""
+
+import ipaddress
+import socket
+import logging
+from .auth import Authentication
+from .control import DRAIN, MULTIHOP, RESOLVE_INTERVAL
+from .damping import DAMPING, Damping
+from .pacing import PACING
+from .pauses import GC
+from .persist import PERSIST
+from .rxqueue import DROP_POLICIES, INTAKE
+from .sbfd import REFLECTOR
+from .session import session_key
+from .transport import SOCKET_PROFILE
+log = logging.getLogger(__name__)  # pylint: disable=I0011,C0103
+
+FAMILIES = {
+    'any': socket.AF_UNSPEC,
+    'ipv4': socket.AF_INET,
+    'ipv6': socket.AF_INET6
+}
+
+# Timers are configured in milliseconds, like on the command line
+TIMER_KEYS = ('tx_interval', 'rx_interval', 'echo_tx_interval',
+              'echo_rx_interval')
+PEER_KEYS = ('remote', 'local', 'profile', 'passive', 'connected',
+             'multihop', 'damping', 'auth', 'demand_mode', 'detect_mult',
+             'reflector_discr', 'device', 'echo_aiobfd') + TIMER_KEYS
+PROFILE_KEYS = ('passive', 'connected', 'multihop', 'damping', 'auth',
+                'demand_mode', 'detect_mult', 'echo_aiobfd') + TIMER_KEYS
+DAMPING_KEYS = tuple(DAMPING)
+AUTH_KEYS = ('type', 'keys', 'key_id')
+LISTEN_KEYS = ('prefixes', 'profile', 'max_sessions', 'idle_time', 'rate',
+               'connected', 'auth', 'demand_mode',
+               'detect_mult', 'echo_aiobfd') + TIMER_KEYS
+SOCKET_KEYS = tuple(SOCKET_PROFILE)
+INTAKE_KEYS = tuple(INTAKE)
+DRAIN_KEYS = tuple(DRAIN)
+PERSIST_KEYS = tuple(PERSIST)
+MULTIHOP_KEYS = tuple(MULTIHOP)
+REFLECTOR_KEYS = tuple(REFLECTOR)
+BIND_KEYS = ('local', 'device')
+GC_KEYS = tuple(GC)
+PACING_KEYS = tuple(PACING)
+CONFIG_KEYS = ('local', 'family', 'defaults', 'profiles', 'peers', 'socket',
+               'intake', 'listen', 'drain', 'persist', 'multihop',
+               'reflector', 'bind', 'gc', 'pacing', 'resolve_interval')
+
+DEFAULTS = {
+    'passive': False,
+    'connected': False,
+    'multihop': False,
+    'damping': False,
+    'auth': False,
+    'demand_mode': False,
+    'tx_interval': 1000,
+    'rx_interval': 1000,
+    'echo_tx_interval': 0,
+    'echo_rx_interval': 0,
+    'echo_aiobfd': False,
+    'detect_mult': 1
+}
+
+
+def read_file(path):
+    """Read a TOML or YAML configuration file into a dictionary"""
+    if path.endswith('.toml'):
+        try:
+            import tomllib as toml  # pylint: disable=I0011,E0401
+        except ImportError:
+            import tomli as toml  # pylint: disable=I0011,E0401
+        with open(path, 'rb') as config_file:
+            return toml.load(config_file)
+
+    import yaml  # pylint: disable=I0011,E0401
+    with open(path) as config_file:
+        return yaml.safe_load(config_file) or {}
+
+
+def _check_keys(section, allowed, where):
+    """Reject unknown keys so typos don't silently fall back to defaults"""
+    if not isinstance(section, dict):
+        raise ValueError('%s must be a mapping.' % where)
+    unknown = set(section) - set(allowed)
+    if unknown:
+        raise ValueError('Unknown key(s) %s in %s.'
+                         % (', '.join(sorted(unknown)), where))
+
+
+def _profiles(data):
+    """Validate the defaults and profiles sections"""
+    defaults = dict(DEFAULTS)
+    defaults.update(data.get('defaults', {}))
+    _check_keys(defaults, PROFILE_KEYS, 'defaults')
+
+    profiles = data.get('profiles', {})
+    if not isinstance(profiles, dict):
+        raise ValueError('profiles must be a mapping.')
+    for name, profile in profiles.items():
+        _check_keys(profile, PROFILE_KEYS, 'profile %s' % name)
+    return defaults, profiles
+
+
+def _session_settings(section, defaults, profiles, where):
+    """Apply the defaults and the referenced profile to a section describing
+       sessions, converting timers to microseconds"""
+    settings = dict(defaults)
+    if 'profile' in section:
+        if section['profile'] not in profiles:
+            raise ValueError('%s uses unknown profile %s.'
+                             % (where, section['profile']))
+        settings.update(profiles[section['profile']])
+    settings.update(section)
+    settings.pop('profile', None)
+
+    for timer in TIMER_KEYS:
+        settings[timer] = int(settings[timer]) * 1000
+    settings['detect_mult'] = int(settings['detect_mult'])
+    settings['passive'] = bool(settings['passive'])
+    settings['connected'] = bool(settings['connected'])
+    settings['multihop'] = bool(settings['multihop'])
+    settings['demand_mode'] = bool(settings['demand_mode'])
+    settings['echo_aiobfd'] = bool(settings['echo_aiobfd'])
+    settings['damping'] = _damping(settings['damping'], where)
+    settings['auth'] = _auth(settings['auth'], where)
+    return settings
+
+
+def _damping(damping, where):
+    """Damping settings for `Session`, True enables the defaults and False
+       disables damping"""
+    if damping is False or damping is None:
+        return None
+    if damping is True:
+        damping = {}
+    _check_keys(damping, DAMPING_KEYS, 'damping of %s' % where)
+    damping = dict(damping)
+    if 'slow_interval' in damping:
+        damping['slow_interval'] = int(damping['slow_interval']) * 1000
+    Damping(**damping)
+    return damping
+
+
+def _auth(auth, where):
+    """Authentication settings for `Session`, False disables
+       authentication"""
+    if auth is False or auth is None:
+        return None
+    _check_keys(auth, AUTH_KEYS, 'auth of %s' % where)
+    if 'type' not in auth or 'keys' not in auth:
+        raise ValueError('No authentication type or keys configured for %s.'
+                         % where)
+    auth = dict(auth)
+    if not isinstance(auth['keys'], dict):
+        raise ValueError('Authentication keys of %s must be a mapping.'
+                         % where)
+    # Key IDs are strings in TOML
+    auth['keys'] = {int(key_id): str(key)
+                    for key_id, key in auth['keys'].items()}
+    if 'key_id' in auth:
+        auth['key_id'] = int(auth['key_id'])
+    Authentication(**auth)
+    return auth
+
+
+def _discriminator(discr, where):
+    """A nonzero 32 bit discriminator"""
+    discr = int(discr)
+    if not 0 < discr <= 4294967295:
+        raise ValueError('Discriminator %d of %s must be between 1 and '
+                         '4294967295.' % (discr, where))
+    return discr
+
+
+def parse_config(data):
+    """Turn a configuration dictionary into the listener settings and a list
+       of per-session keyword arguments for `Session`"""
+    _check_keys(data, CONFIG_KEYS, 'configuration')
+    if 'local' not in data:
+        raise ValueError('No local address configured.')
+    try:
+        family = FAMILIES[data.get('family', 'any')]
+    except KeyError:
+        raise ValueError('Family must be one of %s.' % ', '.join(FAMILIES))
+    defaults, profiles = _profiles(data)
+
+    sessions = []
+    seen = set()
+    for peer in data.get('peers', []):
+        _check_keys(peer, PEER_KEYS, 'peer')
+        if 'remote' not in peer:
+            raise ValueError('Peer without remote address configured.')
+        settings = _session_settings(peer, defaults, profiles,
+                                     'Peer %s' % peer['remote'])
+        if 'reflector_discr' in settings:
+            settings['reflector_discr'] = _discriminator(
+                settings['reflector_discr'], 'Peer %s' % peer['remote'])
+        settings.setdefault('local', data['local'])
+
+        key = session_key(settings['local'], settings['remote'],
+                          settings.get('device'))
+        if key in seen:
+            raise ValueError('Peer %s configured more than once for local '
+                             '%s%s.' % (key[1], key[0],
+                                        ' on %s' % key[2] if key[2:] else ''))
+        seen.add(key)
+        settings['family'] = family
+        sessions.append(settings)
+
+    return data['local'], family, sessions
+
+
+def parse_listen(data):
+    """Extract the settings for sessions created on demand from a
+       configuration dictionary, None if not enabled"""
+    listen = data.get('listen')
+    if listen is None:
+        return None
+    _check_keys(listen, LISTEN_KEYS, 'listen')
+    if not listen.get('prefixes'):
+        raise ValueError('No prefixes configured to listen for.')
+    for prefix in listen['prefixes']:
+        ipaddress.ip_network(prefix)
+
+    defaults, profiles = _profiles(data)
+    timers = {key: value for key, value in listen.items()
+              if key in PROFILE_KEYS + ('profile',)}
+    settings = _session_settings(timers, defaults, profiles, 'listen')
+    result = {key: value for key, value in listen.items()
+              if key not in PROFILE_KEYS + ('profile',)}
+    result.update({key: settings[key] for key in
+                   ('connected', 'damping', 'auth', 'demand_mode',
+                    'detect_mult', 'echo_aiobfd') + TIMER_KEYS})
+    return result
+
+
+def parse_socket_profile(data):
+    """Extract the socket option overrides from a configuration dictionary"""
+    profile = data.get('socket', {})
+    _check_keys(profile, SOCKET_KEYS, 'socket')
+    return dict(profile)
+
+
+def parse_intake(data):
+    """Extract the receive queue and rate limiting settings from a
+       configuration dictionary"""
+    intake = data.get('intake', {})
+    _check_keys(intake, INTAKE_KEYS, 'intake')
+    if intake.get('policy', INTAKE['policy']) not in DROP_POLICIES:
+        raise ValueError('Drop policy must be one of %s.'
+                         % ', '.join(DROP_POLICIES))
+    return dict(intake)
+
+
+def parse_drain(data):
+    """Extract the settings for draining sessions from a configuration
+       dictionary"""
+    drain = data.get('drain', {})
+    _check_keys(drain, DRAIN_KEYS, 'drain')
+    if drain.get('batch', DRAIN['batch']) < 1:
+        raise ValueError('The drain batch size must be at least 1.')
+    return dict(drain)
+
+
+def parse_persist(data):
+    """Extract the settings for saving session state from a configuration
+       dictionary"""
+    persist = data.get('persist', {})
+    _check_keys(persist, PERSIST_KEYS, 'persist')
+    if persist.get('interval', PERSIST['interval']) <= 0:
+        raise ValueError('The persist interval must be positive.')
+    return dict(persist)
+
+
+def parse_multihop(data):
+    """Extract the TTL and hop check of multihop sessions from a
+       configuration dictionary"""
+    multihop = data.get('multihop', {})
+    _check_keys(multihop, MULTIHOP_KEYS, 'multihop')
+    if not 1 <= multihop.get('ttl', MULTIHOP['ttl']) <= 255:
+        raise ValueError('The multihop TTL must be between 1 and 255.')
+    if not 0 <= multihop.get('max_hops', MULTIHOP['max_hops']) <= 254:
+        raise ValueError('The multihop max_hops must be between 0 and 254.')
+    return dict(multihop)
+
+
+def parse_reflector(data):
+    """Extract the S-BFD reflector settings from a configuration dictionary,
+       converting the interval to microseconds"""
+    reflector = data.get('reflector', {})
+    _check_keys(reflector, REFLECTOR_KEYS, 'reflector')
+    reflector = dict(reflector)
+    reflector['discriminators'] = [
+        _discriminator(discr, 'reflector')
+        for discr in reflector.get('discriminators', ())]
+    if 'rx_interval' in reflector:
+        reflector['rx_interval'] = int(reflector['rx_interval']) * 1000
+        if reflector['rx_interval'] <= 0:
+            raise ValueError('The reflector rx_interval must be positive.')
+    if reflector.get('batch', REFLECTOR['batch']) < 1:
+        raise ValueError('The reflector batch size must be at least 1.')
+    return reflector
+
+
+def parse_bind(data):
+    """Extract the additional listeners, on other local addresses or
+       devices, from a configuration dictionary"""
+    binds = data.get('bind', [])
+    if not isinstance(binds, list):
+        raise ValueError('bind must be a list.')
+    for bind in binds:
+        _check_keys(bind, BIND_KEYS, 'bind')
+        if 'local' not in bind:
+            raise ValueError('Listener without local address configured.')
+    return [dict(bind) for bind in binds]
+
+
+def parse_gc(data):
+    """Extract the garbage collection settings from a configuration
+       dictionary"""
+    settings = data.get('gc', {})
+    _check_keys(settings, GC_KEYS, 'gc')
+    settings = dict(settings)
+    if settings.get('thresholds') is not None:
+        thresholds = [int(threshold) for threshold in settings['thresholds']]
+        if not 1 <= len(thresholds) <= 3 or min(thresholds) < 0:
+            raise ValueError('The gc thresholds must be one to three '
+                             'numbers of at least 0.')
+        settings['thresholds'] = thresholds
+    for key in ('interval', 'window', 'max_delay'):
+        if settings.get(key, GC[key]) <= 0:
+            raise ValueError('The gc %s must be positive.' % key)
+    return settings
+
+
+def parse_pacing(data):
+    """Extract the settings for spreading the packets of all sessions from a
+       configuration dictionary"""
+    pacing = data.get('pacing', {})
+    _check_keys(pacing, PACING_KEYS, 'pacing')
+    pacing = dict(pacing)
+    if 'stagger' in pacing:
+        pacing['stagger'] = bool(pacing['stagger'])
+    if pacing.get('max_pps', PACING['max_pps']) < 0:
+        raise ValueError('The pacing max_pps must be at least 0.')
+    return pacing
+
+
+def parse_resolve_interval(data):
+    """Extract the seconds between lookups of remotes configured by
+       hostname from a configuration dictionary"""
+    interval = data.get('resolve_interval', RESOLVE_INTERVAL)
+    if interval <= 0:
+        raise ValueError('The resolve_interval must be positive.')
+    return interval
+
+
+def load_config(path):
+    """Load and parse a configuration file"""
+    log.debug('Loading configuration from %s.', path)
+    return parse_config(read_file(path))
@@ -2,14 +2,96 @@
 # pylint: disable=I0011,R0913
 
 import asyncio
+import collections
+import ipaddress
 import logging
 import socket
-from .transport import Server
-from .session import Session
+import time
+from .transport import MAX_TTL, Server, SOCKET_PROFILE, SO_RCVBUFFORCE, \
+    apply_socket_profile, bind_device, buffer_size, protect_socket, \
+    set_buffer, set_max_ttl, socket_inode, udp_socket_stats
+from .echo import ECHO_PORT, Echo
+from .pacing import PACING, Pacer
+from .pauses import GC, Pauses
+from .persist import PERSIST, read_snapshot, write_snapshot
+from .timers import TIMERS, TimerFd
+from .takeover import check_peer, connect_takeover, hand_over, \
+    handover_messages, listen_takeover, recv_message
+from .rxqueue import INTAKE, RxQueue, SourceLimiter, TokenBucket
+from .sbfd import Initiator, REFLECTOR, Reflector, SBFD_PORT
+from .session import MULTIHOP_PORT, Session, STATE_ADMIN_DOWN, STATE_UP, \
+    resolve, session_key
 from .packet import Packet
 log = logging.getLogger(__name__)  # pylint: disable=I0011,C0103
 
 CONTROL_PORT = 3784
+# getaddrinfo() doesn't expose the TTL of the records, so remotes configured
+# by hostname are looked up again at a fixed interval instead
+RESOLVE_INTERVAL = 60               # Seconds between hostname lookups
+DROP_LOG_INTERVAL = 10              # Seconds between drop log messages
+EXPIRE_INTERVAL = 5                 # Seconds between idle session checks
+
+# Defaults for sessions created on demand for unknown remotes
+LISTEN = {
+    'prefixes': (),                 # Remotes allowed to bring up a session
+    'max_sessions': 1024,           # Size of the dynamic session table
+    'idle_time': 300,               # Seconds a dynamic session may be down
+    'rate': 10,                     # New dynamic sessions per second
+    'connected': False,
+    'damping': None,
+    'auth': None,
+    'demand_mode': False,
+    'tx_interval': 1000000,
+    'rx_interval': 1000000,
+    'echo_tx_interval': 0,
+    'echo_rx_interval': 0,
+    'echo_aiobfd': False,
+    'detect_mult': 3
+}
+
+# Defaults for multihop sessions (RFC 5883), which share a socket
+MULTIHOP = {
+    'ttl': MAX_TTL,                 # TTL/Hop Limit packets are sent with
+    'max_hops': MAX_TTL - 1         # Routers a received packet may cross
+}
+
+# Defaults for taking sessions administratively down
+DRAIN = {
+    'hold': 0.5,                    # Seconds to keep repeating AdminDown
+    'interval': 0.05,               # Seconds between the repetitions
+    'batch': 256                    # Packets sent before yielding the loop
+}
+
+# Defaults for applying new timers to many sessions at once
+RETIME = {
+    'rate': 100,                    # Poll Sequences started per second
+    'timeout': 10                   # Seconds to wait for the Final (F) bit
+}
+
+# Wildcard addresses, a listener bound to one receives for every address
+WILDCARDS = ('', '0.0.0.0', '::')
+
+# Event loop implementations to choose from
+LOOPS = ('asyncio', 'uvloop')
+
+# asyncio.Task.all_tasks() moved to asyncio.all_tasks() in Python 3.7
+all_tasks = getattr(asyncio, 'all_tasks', None) or \
+    asyncio.Task.all_tasks  # pylint: disable=I0011,C0103
+
+
+def new_event_loop(name='asyncio'):
+    """Install the event loop policy of the given implementation and create
+       the event loop to run on, before any control process is created"""
+    if name not in LOOPS:
+        raise ValueError('Event loop must be one of %s.' % ', '.join(LOOPS))
+    if name == 'uvloop':
+        import uvloop  # pylint: disable=I0011,E0401
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    else:
+        asyncio.set_event_loop_policy(None)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    return loop
 
 
 class Control:
@@ -17,94 +99,1220 @@ class Control:
 
     def __init__(self, local, remotes, family=socket.AF_UNSPEC, passive=False,
                  tx_interval=1000000, rx_interval=1000000, detect_mult=3,
-                 loop=asyncio.get_event_loop()):
-        self.loop = loop
-        self.rx_queue = asyncio.Queue()
+                 connected=False, demand_mode=False, echo_tx_interval=0,
+                 echo_rx_interval=0, echo_aiobfd=False, multihop=False,
+                 reflector_discr=None,
+                 device=None, loop=None, start=True,
+                 resolve_interval=RESOLVE_INTERVAL, socket_profile=None,
+                 intake=None, listen=None, drain=None, persist=None,
+                 multihop_settings=None, reflector=None, bind=None, gc=None,
+                 pacing=None, timers='asyncio', takeover_socket=None,
+                 take_over=False):
+        # The loop is looked up when the control process is created, not
+        # when this module is imported, so a different loop can be installed
+        self.loop = loop or asyncio.get_event_loop()
+        self.local = local
+        self.device = device  # Of `local` and the sessions by default
+        self.family = family
+        self.intake = dict(INTAKE)
+        self.intake.update(intake or {})
+        self.rx_queue = RxQueue(self.intake['size'], self.intake['policy'],
+                                on_drop=self._queue_drop, loop=self.loop)
+        self._unmatched = SourceLimiter(self.intake['unmatched_rate'],
+                                        self.intake['unmatched_burst'],
+                                        self.intake['unmatched_total'],
+                                        self.intake['max_sources'])
+        self._drop_log = dict()
+        self.drain_settings = dict(DRAIN)
+        self.drain_settings.update(drain or {})
+        self.multihop_settings = dict(MULTIHOP)
+        self.multihop_settings.update(multihop_settings or {})
+        self._terminating = None
 
-        # Initialize client sessions
+        # Session state saved by a previous process, resumed as the sessions
+        # are added
+        self.persist = dict(PERSIST)
+        self.persist.update(persist or {})
+        self._saved = None
+        self._saved_time = None
+        self._persist_state = None
+        self._saving = asyncio.Lock()
+        if self.persist['path']:
+            self._load_state()
+
+        # Handing the sockets and sessions over to a new process
+        self.takeover_socket = takeover_socket
+        self.take_over = take_over
+        self._handover = None
+        self._takeover_listener = None
+        self._handed_over = False
+        self._paused = False  # Packets left to the process taking over
+
+        # Sessions created on demand, least recently active first
+        self.listen = None
+        self._dynamic = collections.OrderedDict()
+        self._dynamic_pending = set()
+        self._admit_dynamic = None
+        self._expire_dynamic = None
+        self.set_listen(listen)
         self.sessions = list()
-        for remote in remotes:
-            log.debug('Creating BFD session for remote %s.', remote)
-            self.sessions.append(
-                Session(local, remote, family=family, passive=passive,
-                        tx_interval=tx_interval, rx_interval=rx_interval,
-                        detect_mult=detect_mult))
-
-        # Initialize server
-        log.debug('Setting up UDP server on %s:%s.', local, CONTROL_PORT)
-        task = self.loop.create_datagram_endpoint(
-            lambda: Server(self.rx_queue),
-            local_addr=(local, CONTROL_PORT),
-            family=family)
-        self.server, _ = self.loop.run_until_complete(task)
-        log.info('Accepting traffic on %s:%s.',
-                 self.server.get_extra_info('sockname')[0],
-                 self.server.get_extra_info('sockname')[1])
+        self.listeners = list()  # Told about state changes of all sessions
+        # Listeners by device, local address and whether multihop, opened
+        # with the first session that needs them or as configured in `bind`
+        self.bind = list(bind or [])
+        self._listeners = dict()
+        self._listener_starts = dict()
+        self.server = None          # Listener on `local`
+        self.multihop_server = None  # Opened with the first multihop session
+        self.resolve_interval = resolve_interval
+        self.counters = collections.Counter()
+        self.socket_profile = dict(SOCKET_PROFILE)
+        self.socket_profile.update(socket_profile or {})
+        # Delay in seconds between the kernel receiving a packet and its
+        # processing, as last seen, smoothed and worst case
+        self.rx_delay = {'last': 0.0, 'avg': 0.0, 'max': 0.0}
+        # How late the loop runs and how long garbage collections stop it,
+        # collections may be held back until the loop is idle
+        self.gc_settings = dict(GC)
+        self.gc_settings.update(gc or {})
+        self.pauses = Pauses(self.loop,
+                             busy=lambda: not self.rx_queue.empty(),
+                             **self.gc_settings)
+        # Control packets of all sessions are spread over time
+        self.pacing = dict(PACING)
+        self.pacing.update(pacing or {})
+        self.pacer = Pacer(self.loop, **self.pacing)
+        # Sessions sleep on asyncio's timers or share a timerfd, set up on
+        # start
+        if timers not in TIMERS:
+            raise ValueError('Timers must be one of %s.' % ', '.join(TIMERS))
+        self.timers = timers
+        self.timer = None
 
-    async def rx_packets(self):
-        """Process a received BFD Control packets"""
-        log.debug('Control process ready to receive packets.')
+        # Index used to demultiplex received packets to their session, by
+        # My Discriminator and by the listener they arrive on (device, local
+        # address and whether multihop) together with the remote address
+        self._demux = dict()
+        self._refresh_remotes = None
+
+        # Echo packets of all sessions share a single socket
+        self.echo = Echo(self.loop, self._demux.get, self._reflect)
+
+        # S-BFD packets of initiators are answered without sessions, on a
+        # socket opened when reflector discriminators are configured
+        self.reflector_settings = dict(REFLECTOR)
+        self.reflector_settings.update(reflector or {})
+        self.reflector = Reflector(self.loop,
+                                   self.reflector_settings['discriminators'],
+                                   self.reflector_settings['rx_interval'],
+                                   self.reflector_settings['batch'])
+
+        if start:
+            self.loop.run_until_complete(
+                self.start(remotes, passive=passive, tx_interval=tx_interval,
+                           rx_interval=rx_interval, detect_mult=detect_mult,
+                           connected=connected, demand_mode=demand_mode,
+                           echo_tx_interval=echo_tx_interval,
+                           echo_rx_interval=echo_rx_interval,
+                           echo_aiobfd=echo_aiobfd, multihop=multihop,
+                           reflector_discr=reflector_discr, device=device))
+
+    @classmethod
+    async def create(cls, local, remotes, family=socket.AF_UNSPEC,
+                     loop=None, resolve_interval=RESOLVE_INTERVAL,
+                     socket_profile=None, intake=None, listen=None,
+                     drain=None, persist=None, multihop_settings=None,
+                     reflector=None, bind=None, device=None, gc=None,
+                     pacing=None, timers='asyncio', takeover_socket=None,
+                     take_over=False, **kwargs):
+        """Create a control process from within a running event loop"""
+        control = cls(local, [], family=family,
+                      loop=loop or asyncio.get_event_loop(), start=False,
+                      resolve_interval=resolve_interval,
+                      socket_profile=socket_profile, intake=intake,
+                      listen=listen, drain=drain, persist=persist,
+                      multihop_settings=multihop_settings,
+                      reflector=reflector, bind=bind, device=device, gc=gc,
+                      pacing=pacing, timers=timers,
+                      takeover_socket=takeover_socket, take_over=take_over)
+        await control.start(remotes, device=device, **kwargs)
+        return control
+
+    async def start(self, remotes, **kwargs):
+        """Bring up the server and the client sessions concurrently"""
+        self.pauses.start()
+        self.start_timer()
+        if self.take_over:
+            await self.receive_handover()
+        # Before the sessions, so resumed sessions pick up the Echo function
+        await self.start_echo()
+        if self.reflector.discriminators:
+            await self.start_reflector()
+        await asyncio.gather(
+            *[self.add_session(self.local, remote, family=self.family,
+                               **kwargs) for remote in remotes],
+            self.start_server(),
+            *[self.start_listener(bind['local'], bind.get('device'))
+              for bind in self.bind])
+        self.size_buffers()
+        self._refresh_remotes = \
+            self.loop.create_task(self.refresh_remotes())
+        self._expire_dynamic = self.loop.create_task(self.expire_dynamic())
+        if self.persist['path']:
+            self._persist_state = \
+                self.loop.create_task(self.persist_state())
+        # Most objects live as long as the sessions
+        self.pauses.freeze()
+
+    def start_timer(self):
+        """Set up the timerfd the sessions sleep on, if configured"""
+        if self.timers != 'timerfd' or self.timer is not None:
+            return
+        timer = TimerFd(self.loop)
+        try:
+            timer.start()
+        except OSError as exc:
+            log.warning('Unable to use timerfd timers, falling back to '
+                        'asyncio: %s', exc)
+            return
+        self.timer = timer
+
+    async def start_server(self):
+        """Set up the UDP server for receiving BFD Control packets"""
+        await self.start_listener(self.local, self.device)
+
+    def _ingress(self, local, device=None, multihop=False):
+        """Key of the listener receiving the packets of sessions on a local
+           address and device"""
+        # A listener on a wildcard address receives for every address
+        if device == self.device and self.local in WILDCARDS:
+            local = self.local
+        return (device, local, multihop)
+
+    async def start_listener(self, local, device=None, multihop=False):
+        """Set up the UDP server receiving the BFD Control packets of the
+           sessions on a local address and device, once for all of them.
+           Returns its key, the ingress of its sessions."""
+        ingress = self._ingress(local, device, multihop)
+        start = self._listener_starts.get(ingress)
+        if start is None:
+            start = self.loop.create_task(
+                self._serve(ingress, self._handover_listener(ingress)))
+            self._listener_starts[ingress] = start
+        try:
+            server = await asyncio.shield(start)
+        except OSError:
+            # Try again with the next session
+            if self._listener_starts.get(ingress) is start:
+                del self._listener_starts[ingress]
+            raise
+        self._listeners[ingress] = server
+        if ingress == self._ingress(self.local, self.device):
+            self.server = server
+        elif ingress == self._ingress(self.local, self.device, True):
+            self.multihop_server = server
+        return ingress
+
+    def _handover_listener(self, ingress):
+        """Socket of a listener handed over by the previous process"""
+        if self._handover is None:
+            return None
+        if ingress == self._ingress(self.local, self.device):
+            sock, self._handover.server = self._handover.server, None
+        elif ingress == self._ingress(self.local, self.device, True):
+            sock, self._handover.multihop = self._handover.multihop, None
+        else:
+            sock = self._handover.listeners.pop(ingress, None)
+        return sock
+
+    async def _serve(self, ingress, sock=None):
+        """Open a UDP server feeding the receive queue, for multihop
+           sessions packets may have crossed `max_hops` routers"""
+        device, local, multihop = ingress
+        port = MULTIHOP_PORT if multihop else CONTROL_PORT
+        log.debug('Setting up UDP server on %s:%s.', local, port)
+        if sock is None and device is not None:
+            # Bound to the device first, the address may be in use in
+            # other VRFs
+            fam, addr = await resolve(self.loop, local, port, self.family)
+            sock = socket.socket(family=fam, type=socket.SOCK_DGRAM)
+            try:
+                bind_device(sock, device)
+                sock.bind(addr)
+            except OSError:
+                sock.close()
+                raise
+        if sock is not None:
+            endpoint = {'sock': sock}
+        else:
+            endpoint = {'local_addr': (local, port), 'family': self.family}
+        server, _ = await self.loop.create_datagram_endpoint(
+            lambda: Server(self.rx_queue, self.admit, ingress), **endpoint)
+        min_ttl = MAX_TTL
+        if multihop:
+            min_ttl -= self.multihop_settings['max_hops']
+        try:
+            protect_socket(server.get_extra_info('socket'), min_ttl)
+        except OSError as exc:
+            log.warning('Unable to set up kernel packet filtering, make sure '
+                        'to drop packets with a TTL/HL below %d: %s',
+                        min_ttl, exc)
+        failed = apply_socket_profile(server.get_extra_info('socket'),
+                                      self.socket_profile)
+        if failed:
+            log.warning('Unable to set socket options %s on the control '
+                        'socket.', ', '.join(failed))
+        sockname = server.get_extra_info('sockname')
+        if device is None:
+            log.info('Accepting traffic on %s:%s.', sockname[0], sockname[1])
+        else:
+            log.info('Accepting traffic on %s:%s on %s.', sockname[0],
+                     sockname[1], device)
+        return server
+
+    def _servers(self):
+        """UDP servers receiving BFD Control packets"""
+        return list(self._listeners.values())
+
+    async def start_echo(self):
+        """Set up the UDP socket for sending Echo packets and looping back
+           those of the remotes. Sessions run without the Echo function if
+           it can't be set up."""
+        try:
+            if self._handover is not None and \
+                    self._handover.echo is not None:
+                sock = self._handover.echo
+                self._handover.echo = None
+            else:
+                fam, addr = await resolve(self.loop, self.local, ECHO_PORT,
+                                          self.family)
+                sock = socket.socket(family=fam, type=socket.SOCK_DGRAM)
+                try:
+                    set_max_ttl(sock)
+                    sock.bind(addr)
+                except OSError:
+                    sock.close()
+                    raise
+            apply_socket_profile(sock, self.socket_profile)
+            await self.loop.create_datagram_endpoint(lambda: self.echo,
+                                                     sock=sock)
+        except OSError as exc:
+            log.warning('Unable to set up the Echo function on %s:%s: %s',
+                        self.local, ECHO_PORT, exc)
+            return
+        log.debug('Accepting Echo packets on %s:%s.',
+                  self.echo.sock.getsockname()[0],
+                  self.echo.sock.getsockname()[1])
+
+    async def start_reflector(self):
+        """Set up the UDP socket on which the S-BFD reflector answers
+           initiators. Nothing is reflected if it can't be set up."""
+        try:
+            if self._handover is not None and \
+                    self._handover.reflector is not None:
+                sock = self._handover.reflector
+                self._handover.reflector = None
+            else:
+                fam, addr = await resolve(self.loop, self.local, SBFD_PORT,
+                                          self.family)
+                sock = socket.socket(family=fam, type=socket.SOCK_DGRAM)
+                try:
+                    set_max_ttl(sock)
+                    sock.bind(addr)
+                except OSError:
+                    sock.close()
+                    raise
+            apply_socket_profile(sock, self.socket_profile)
+        except OSError as exc:
+            log.error('Unable to set up the S-BFD reflector on %s:%s: %s',
+                      self.local, SBFD_PORT, exc)
+            return
+        try:
+            # Initiators may be any number of hops away
+            protect_socket(sock, 1)
+        except OSError as exc:
+            log.warning('Unable to set up kernel packet filtering for S-BFD '
+                        'packets: %s', exc)
+        self.reflector.open(sock)
+        log.info('Reflecting S-BFD packets on %s:%s.',
+                 sock.getsockname()[0], sock.getsockname()[1])
+
+    def set_reflector(self, reflector):
+        """Apply changed reflector settings, the discriminators and the
+           advertised interval take effect with the next packet"""
+        settings = dict(REFLECTOR)
+        settings.update(reflector or {})
+        self.reflector_settings = settings
+        self.reflector.discriminators = set(settings['discriminators'])
+        self.reflector.rx_interval = settings['rx_interval']
+        self.reflector.batch = settings['batch']
+        if self.reflector.discriminators and not self.reflector.running:
+            self.loop.create_task(self.start_reflector())
+
+    def set_pacing(self, pacing):
+        """Apply changed pacing settings, they take effect with the next
+           packet of every session"""
+        settings = dict(PACING)
+        settings.update(pacing or {})
+        self.pacing = settings
+        self.pacer.stagger = settings['stagger']
+        self.pacer.max_pps = settings['max_pps']
+
+    def _reflect(self, source):
+        """Whether to loop back an Echo packet, only for remotes that have
+           an Up session and were told we loop back their Echo packets"""
+        key = self._ingress(self.local, self.device) + (source,)
+        session = self._demux.get(key)
+        return session is not None and session.state == STATE_UP and \
+            session.required_min_echo_rx_interval > 0
+
+    async def add_session(self, local, remote, **kwargs):
+        """Create a new session and start maintaining it, returns None if
+           its packets can't be told apart from those of another session"""
+        log.debug('Creating BFD session for remote %s.', remote)
+        kwargs.setdefault('socket_profile', self.socket_profile)
+        kwargs.setdefault('echo', self.echo)
+        kwargs.setdefault('pacer', self.pacer)
+        kwargs.setdefault('timer', self.timer)
+        kwargs.setdefault('loop', self.loop)
+        device = kwargs.get('device')
+        if kwargs.get('multihop'):
+            kwargs.setdefault('ttl', self.multihop_settings['ttl'])
+        if self._handover is not None:
+            kwargs['sock'] = self._handover.sockets.pop(
+                session_key(local, remote, device), None)
+        ingress = None
+        if kwargs.get('reflector_discr') is not None:
+            # Replies to S-BFD initiators arrive on their source socket
+            session = await Initiator.create(local, remote, **kwargs)
+        else:
+            kwargs.pop('reflector_discr', None)
+            ingress = await self.start_listener(local, device,
+                                                kwargs.get('multihop', False))
+            # The Echo socket is on the local address of the process
+            if ingress != self._ingress(self.local, self.device):
+                kwargs['echo'] = None
+            session = await Session.create(local, remote, **kwargs)
+        session.ingress = ingress
+        other = self._demux.get(self._addr_key(session)) \
+            if ingress is not None else None
+        if other is not None and other in self.sessions:
+            # A wildcard listener doesn't tell which local address a packet
+            # was sent to, so only the remote address is left to match
+            # packets with a zero Your Discriminator by
+            log.error('Not creating a BFD session for %s from %s, its '
+                      'packets arrive on the same socket as those of the '
+                      'session from %s.', remote, local, other.local)
+            session.shutdown()
+            return None
+        session.listeners = self.listeners
+        if self._saved:
+            self._resume(session)
+        self.sessions.append(session)
+        if ingress is not None:
+            self._demux[session.local_discr] = session
+            self._demux[self._addr_key(session)] = session
+        return session
+
+    @staticmethod
+    def _addr_key(session):
+        """Key of a session in the demultiplexing index by address"""
+        # Multihop sessions MUST be demultiplexed by the source and
+        # destination address pair, as the source address alone may be
+        # shared with other multihop sessions (RFC 5883 section 3). The
+        # listener stands in for the destination address, sessions it
+        # can't tell apart are refused by `add_session()`. The same
+        # addresses may be in use in several VRFs.
+        return session.ingress + (session.remote_addr[0],)
+
+    def _load_state(self):
+        """Read the session state saved by a previous process"""
+        snapshot = read_snapshot(self.persist['path'])
+        if snapshot is None:
+            return
+        age, self._saved = snapshot
+        # Wall clock time, monotonic time doesn't carry over between processes
+        self._saved_time = time.time() - age
+        log.info('Read the state of %d BFD sessions saved %d ms ago.',
+                 len(self._saved), age * 1000)
+
+    def _resume(self, session):
+        """Resume a new session from the saved state of its remote"""
+        state = self._saved.pop(
+            session_key(session.local, session.remote, session.device), None)
+        if state is None:
+            return
+        age = time.time() - self._saved_time
+        if state['local_discr'] in self._demux:
+            return
+        if session.resume(state, age):
+            self.counters['resumed_sessions'] += 1
+            log.info('Resumed BFD session with %s, saved %d ms ago.',
+                     session.remote, age * 1000)
+        else:
+            log.info('Not resuming BFD session with %s, it wasn\'t up or its '
+                     'saved state is too old.', session.remote)
+
+    async def save_state(self):
+        """Write the state of all sessions to the snapshot file"""
+        states = [s.snapshot() for s in self.sessions]
+        # Serializing is cheap compared to writing and syncing the file, keep
+        # the latter out of the event loop. The lock keeps an older snapshot
+        # from replacing a newer one.
+        async with self._saving:
+            try:
+                await self.loop.run_in_executor(
+                    None, write_snapshot, self.persist['path'], states)
+            except OSError as exc:
+                log.error('Unable to save the session state to %s: %s',
+                          self.persist['path'], exc)
+
+    async def persist_state(self):
+        """Periodically save the session state, so a restart after a crash
+           can still resume the sessions if it is quick enough"""
         while True:
-            packet, source = await self.rx_queue.get()
-            log.debug('Received a new packet from %s.', source)
-            self.process_packet(packet, source)
-            self.rx_queue.task_done()
+            await asyncio.sleep(self.persist['interval'])
+            await self.save_state()
 
-    def process_packet(self, data, source):
-        """Process a received packet"""
+    async def receive_handover(self):
+        """Take over the sockets and sessions of the running process"""
+        log.warning('Taking over from the process listening on %s.',
+                    self.takeover_socket)
+        self._handover = await self.loop.run_in_executor(
+            None, connect_takeover, self.takeover_socket)
+        # Handed over state is always the most recent
+        self._saved = self._handover.states
+        self._saved_time = self._handover.time
+        log.info('Received %d BFD sessions to take over.',
+                 len(self._saved))
+
+    def finish_takeover(self):
+        """Tell the process taken over to exit once our sessions are
+           transmitting, and take its place for the next takeover"""
+        if self._handover is not None:
+            unused = len(self._handover.sockets)
+            try:
+                self._handover.finish()
+            except OSError as exc:
+                log.error('Unable to tell the previous process to exit: %s',
+                          exc)
+            self._handover = None
+            log.warning('Took over from the previous process, %d sessions '
+                        'not configured here were left behind.', unused)
+        if self.takeover_socket:
+            try:
+                self._takeover_listener = listen_takeover(
+                    self.takeover_socket)
+            except OSError as exc:
+                log.error('Unable to accept takeovers on %s: %s',
+                          self.takeover_socket, exc)
+                return
+            self.loop.add_reader(self._takeover_listener.fileno(),
+                                 self._takeover_accept)
+
+    def _takeover_accept(self):
+        """Accept a connection from a process that wants to take over"""
         try:
-            packet = Packet(data, source)
-        except IOError as exc:
-            log.info('Dropping packet: %s', exc)
+            conn, _ = self._takeover_listener.accept()
+        except BlockingIOError:
             return
+        try:
+            check_peer(conn)
+        except OSError as exc:
+            log.error('Takeover by a new process failed: %s', exc)
+            conn.close()
+            return
+        conn.setblocking(False)
+        self.loop.add_reader(conn.fileno(), self._takeover_request, conn)
+
+    def _takeover_request(self, conn):
+        """Hand everything over, and exit once the new process reports it is
+           transmitting. If anything fails this process simply carries on."""
+        try:
+            request, socks = recv_message(conn)
+            for sock in socks:
+                sock.close()
+            if request.get('takeover'):
+                self.loop.remove_reader(conn.fileno())
+                self.loop.create_task(self._hand_over(conn))
+                return
+            if not request.get('started'):
+                raise IOError('Unexpected takeover request %s.' % request)
+        except (IOError, ValueError) as exc:
+            log.error('Takeover by a new process failed: %s', exc)
+            self.loop.remove_reader(conn.fileno())
+            conn.close()
+            self._resume_receiving()
+            return
+        self.loop.remove_reader(conn.fileno())
+        conn.close()
+        log.warning('The new process took over, exiting.')
+        self._handed_over = True
+        self.terminate(drain=False)
+
+    async def _hand_over(self, conn):
+        """Stop receiving and send the sockets and sessions from a thread,
+           so the sessions keep transmitting meanwhile"""
+        log.warning('Handing over %d BFD sessions to a new process.',
+                    len(self.sessions))
+        self._pause_receiving()
+        multihop = None
+        if self.multihop_server is not None:
+            multihop = self.multihop_server.get_extra_info('socket')
+        listeners = {
+            ingress: server.get_extra_info('socket')
+            for ingress, server in self._listeners.items()
+            if server not in (self.server, self.multihop_server)}
+        messages = handover_messages(
+            self.server.get_extra_info('socket'), self.sessions,
+            echo=self.echo.sock, multihop=multihop,
+            reflector=self.reflector.sock, listeners=listeners)
+        try:
+            await self.loop.run_in_executor(None, hand_over, conn, messages)
+        except (IOError, ValueError) as exc:
+            log.error('Takeover by a new process failed: %s', exc)
+            conn.close()
+            self._resume_receiving()
+            return
+        conn.setblocking(False)
+        self.loop.add_reader(conn.fileno(), self._takeover_request, conn)
+
+    def _pause_receiving(self):
+        """Leave the Control packets in the kernel for the process taking
+           over, the sessions stop detecting failures until it reports"""
+        self._paused = True
+        for server in self._servers():
+            server.pause_reading()
+        for session in self.sessions:
+            session.suspend_detection()
+
+    def _resume_receiving(self):
+        """Carry on receiving after a takeover failed"""
+        if not self._paused:
+            return
+        self._paused = False
+        for server in self._servers():
+            server.resume_reading()
+        for session in self.sessions:
+            session.resume_detection()
+
+    def remove_session(self, session):
+        """Tear down a session and release its resources"""
+        log.debug('Removing BFD session for remote %s.', session.remote)
+        self.sessions.remove(session)
+        if session.ingress is not None:
+            key = self._addr_key(session)
+            if self._dynamic.get(key, (None,))[0] is session:
+                del self._dynamic[key]
+            if self._demux.get(session.local_discr) is session:
+                del self._demux[session.local_discr]
+            if self._demux.get(key) is session:
+                del self._demux[key]
+        session.shutdown()
 
+    def set_listen(self, listen):
+        """Configure which remotes may bring up a passive session on demand,
+           dynamic sessions that are no longer allowed are removed"""
+        settings = dict(LISTEN)
+        settings.update(listen or {})
+        settings['prefixes'] = [ipaddress.ip_network(prefix)
+                                for prefix in settings['prefixes']]
+        self.listen = settings
+        self._admit_dynamic = TokenBucket(settings['rate'],
+                                          max(settings['rate'], 1), 0)
+        for session, _ in list(self._dynamic.values()):
+            if not self.listening(session.remote):
+                log.info('Removing dynamic BFD session for %s, it is no '
+                         'longer allowed.', session.remote)
+                self.remove_session(session)
+                continue
+            if (session.tx_interval, session.rx_interval,
+                    session.detect_mult) != (settings['tx_interval'],
+                                             settings['rx_interval'],
+                                             settings['detect_mult']):
+                session.retime(settings['tx_interval'],
+                               settings['rx_interval'],
+                               settings['detect_mult'])
+            session.set_echo(settings['echo_tx_interval'],
+                             settings['echo_rx_interval'],
+                             settings['echo_aiobfd'])
+            session.demand_mode = settings['demand_mode']
+            session.set_auth(settings['auth'])
+
+    def listening(self, source):
+        """Check whether a remote may bring up a session on demand"""
+        if not self.listen['prefixes']:
+            return False
+        try:
+            address = ipaddress.ip_address(source)
+        except ValueError:
+            return False
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        return any(address in prefix for prefix in self.listen['prefixes'])
+
+    def create_dynamic(self, packet, ingress):
+        """Bring up a passive session for the remote that sent a packet to a
+           listener, within the limits of the dynamic session table"""
+        if ingress + (packet.source,) in self._dynamic_pending:
+            return
+        if not self._admit_dynamic.consume(time.monotonic()):
+            self._log_drop('admission_drops', 'Not creating a BFD session for '
+                           '%s, too many new sessions.', packet.source)
+            return
+        if len(self._dynamic) + len(self._dynamic_pending) >= \
+                self.listen['max_sessions'] and not self.evict_dynamic():
+            self._log_drop('table_full_drops', 'Not creating a BFD session '
+                           'for %s, the session table is full.',
+                           packet.source)
+            return
+        self._dynamic_pending.add(ingress + (packet.source,))
+        self.loop.create_task(self._add_dynamic(packet, ingress))
+
+    async def _add_dynamic(self, packet, ingress):
+        """Create a dynamic session and hand it the packet that triggered it"""
+        device, local, multihop = ingress
+        try:
+            session = await self.add_session(
+                local, packet.source, family=self.family, passive=True,
+                multihop=multihop, device=device,
+                connected=self.listen['connected'],
+                damping=self.listen['damping'],
+                auth=self.listen['auth'],
+                demand_mode=self.listen['demand_mode'],
+                tx_interval=self.listen['tx_interval'],
+                rx_interval=self.listen['rx_interval'],
+                echo_tx_interval=self.listen['echo_tx_interval'],
+                echo_rx_interval=self.listen['echo_rx_interval'],
+                echo_aiobfd=self.listen['echo_aiobfd'],
+                detect_mult=self.listen['detect_mult'])
+        except OSError as exc:
+            log.error('Unable to create a BFD session for %s: %s',
+                      packet.source, exc)
+            return
+        finally:
+            self._dynamic_pending.discard(ingress + (packet.source,))
+        if session is None:
+            return
+        self._dynamic[self._addr_key(session)] = (session, time.monotonic())
+        log.warning('Created dynamic BFD session for remote %s.',
+                    packet.source)
+        self._deliver(session, packet)
+
+    def _idle_since(self, key):
+        """Time a dynamic session last heard from its remote"""
+        session, created = self._dynamic[key]
+        return max(created, session.last_rx_packet_time or 0)
+
+    def evict_dynamic(self):
+        """Remove the least recently active dynamic session that isn't Up to
+           make room for a new one, returns whether one was found"""
+        for key, (session, _) in self._dynamic.items():
+            if session.state != STATE_UP:
+                break
+        else:
+            return False
+        log.info('Evicting dynamic BFD session for %s, idle for %d seconds.',
+                 session.remote, time.monotonic() - self._idle_since(key))
+        self.remove_session(session)
+        return True
+
+    async def expire_dynamic(self):
+        """Periodically remove dynamic sessions that stayed down too long"""
+        while True:
+            await asyncio.sleep(EXPIRE_INTERVAL)
+            now = time.monotonic()
+            expired = [session for key, (session, _)
+                       in self._dynamic.items()
+                       if session.state != STATE_UP and
+                       now - self._idle_since(key) >
+                       self.listen['idle_time']]
+            for session in expired:
+                log.info('Expiring dynamic BFD session for %s.',
+                         session.remote)
+                self.remove_session(session)
+
+    def size_buffers(self):
+        """Grow the control socket buffers to absorb bursts from all sessions
+           at the highest rate they may send at"""
+        for ingress, server in self._listeners.items():
+            sessions = [s for s in self.sessions if s.ingress == ingress]
+            rate = sum(1000000 / s.rx_interval for s in sessions)
+            size = self.socket_profile['rcvbuf'] or \
+                buffer_size(rate, self.socket_profile)
+            log.debug('Sizing control socket buffers for %d sessions at %d '
+                      'packets per second.', len(sessions), rate)
+            try:
+                set_buffer(server.get_extra_info('socket'), socket.SO_RCVBUF,
+                           SO_RCVBUFFORCE, size)
+            except OSError as exc:
+                log.warning('Unable to grow the control socket receive buffer '
+                            'to %d bytes: %s', size, exc)
+
+    def set_socket_profile(self, socket_profile):
+        """Apply a changed socket profile to all sockets"""
+        profile = dict(SOCKET_PROFILE)
+        profile.update(socket_profile or {})
+        if profile == self.socket_profile:
+            return
+        log.info('Applying new socket profile.')
+        # Sessions share this dictionary, update it in place
+        self.socket_profile.update(profile)
+        for sock in [s.get_extra_info('socket') for s in self._servers()] + \
+                [s.client.get_extra_info('socket') for s in self.sessions]:
+            apply_socket_profile(sock, self.socket_profile)
+        self.size_buffers()
+
+    async def refresh_remotes(self):
+        """Periodically re-resolve remotes configured by hostname, every
+           `resolve_interval` seconds as the record TTL is not known"""
+        while True:
+            await asyncio.sleep(self.resolve_interval)
+            sessions = [s for s in self.sessions if not s.remote_numeric]
+            results = await asyncio.gather(
+                *[s.resolve_remote() for s in sessions],
+                return_exceptions=True)
+            changed = False
+            for session, result in zip(sessions, results):
+                if isinstance(result, Exception):
+                    log.warning('Unable to resolve remote %s, keeping %s: %s',
+                                session.remote, session.remote_addr[0],
+                                result)
+                changed = changed or result is True
+            if changed:
+                demux = {key: session for key, session in self._demux.items()
+                         if not isinstance(key, tuple)}
+                demux.update({self._addr_key(s): s for s in self.sessions
+                              if s.ingress is not None})
+                # The Echo socket looks sessions up in the same dictionary
+                self._demux.clear()
+                self._demux.update(demux)
+
+    async def reconfigure(self, configs):
+        """Bring the running sessions in line with a list of session
+           configurations, leaving unchanged sessions untouched"""
+        wanted = {session_key(c['local'], c['remote'], c.get('device')): c
+                  for c in configs}
+        dynamic = {s for s, _ in self._dynamic.values()}
+        running = {session_key(s.local, s.remote, s.device): s
+                   for s in self.sessions if s not in dynamic}
+        removed = retimed = 0
+
+        # A configured peer takes over from a session created on demand
+        for session in dynamic:
+            if session_key(session.local, session.remote,
+                           session.device) in wanted:
+                self.remove_session(session)
+
+        for key, session in running.items():
+            config = wanted.get(key)
+            if config is None or config['family'] != session.family or \
+                    config.get('connected', False) != session.connected or \
+                    config.get('multihop', False) != session.multihop or \
+                    config.get('reflector_discr') != \
+                    getattr(session, 'reflector_discr', None):
+                self.remove_session(session)
+                removed += 1
+                continue
+            session.passive = config['passive']
+            session.demand_mode = config.get('demand_mode', False)
+            session.set_damping(config.get('damping'))
+            session.set_auth(config.get('auth'))
+            if (session.tx_interval, session.rx_interval,
+                    session.detect_mult) != (config['tx_interval'],
+                                             config['rx_interval'],
+                                             config['detect_mult']):
+                log.info('Retiming BFD session with %s.', session.remote)
+                session.retime(config['tx_interval'], config['rx_interval'],
+                               config['detect_mult'])
+                retimed += 1
+            session.set_echo(config.get('echo_tx_interval', 0),
+                             config.get('echo_rx_interval', 0),
+                             config.get('echo_aiobfd', False))
+
+        additions = []
+        for key, config in wanted.items():
+            if key not in running or running[key] not in self.sessions:
+                config = dict(config)
+                additions.append(self.add_session(config.pop('local'),
+                                                  config.pop('remote'),
+                                                  **config))
+        added = sum(1 for session in await asyncio.gather(*additions)
+                    if session is not None)
+        self.size_buffers()
+
+        self.pauses.freeze()
+        log.warning('Configuration applied: %d sessions added, %d removed, '
+                    '%d retimed.', added, removed, retimed)
+
+    def stats(self):
+        """Received packet counters, in userspace and in the kernel"""
+        stats = {'rx_packets': self.counters['rx_packets'],
+                 'unchanged_packets': self.counters['unchanged_packets'],
+                 'invalid_drops': self.counters['invalid_drops'],
+                 'unmatched_drops': self.counters['unmatched_drops'],
+                 'auth_drops': self.counters['auth_drops'],
+                 'kernel_drops': None,
+                 'kernel_rx_queue': None,
+                 'session_drops': None,
+                 'queue_drops': self.counters['queue_drops'],
+                 'rate_limited_drops': self.counters['rate_limited_drops'],
+                 'admission_drops': self.counters['admission_drops'],
+                 'table_full_drops': self.counters['table_full_drops'],
+                 'dynamic_sessions': len(self._dynamic),
+                 'listeners': len(self._listeners),
+                 'suppressed_sessions': sum(
+                     1 for s in self.sessions
+                     if s.damping is not None and s.damping.suppressed),
+                 'drained_sessions': sum(
+                     1 for s in self.sessions if s.state == STATE_ADMIN_DOWN),
+                 'resumed_sessions': self.counters['resumed_sessions'],
+                 'demand_sessions': sum(
+                     1 for s in self.sessions if s.demand_active),
+                 'multihop_sessions': sum(
+                     1 for s in self.sessions if s.multihop),
+                 'echo_sessions': sum(
+                     1 for s in self.sessions if s.echo_active),
+                 'echo_tx_packets': self.echo.counters['echo_tx_packets'],
+                 'echo_rx_packets': self.echo.counters['echo_rx_packets'],
+                 'echo_reflected_packets':
+                     self.echo.counters['echo_reflected_packets'],
+                 'echo_unmatched_drops':
+                     self.echo.counters['echo_unmatched_drops'],
+                 'sbfd_sessions': sum(
+                     1 for s in self.sessions if isinstance(s, Initiator)),
+                 'reflected_packets':
+                     self.reflector.counters['reflected_packets'],
+                 'reflector_invalid_drops':
+                     self.reflector.counters['reflector_invalid_drops'],
+                 'reflector_unmatched_drops':
+                     self.reflector.counters['reflector_unmatched_drops'],
+                 'reflector_tx_drops':
+                     self.reflector.counters['reflector_tx_drops'],
+                 'rx_delay': dict(self.rx_delay)}
+        stats['loop_lag'], stats['gc_pause'] = self.pauses.stats()
+        stats.update(self.pacer.stats())
+        kernel = udp_socket_stats()
+        for server in self._servers():
+            counters = kernel.get(
+                socket_inode(server.get_extra_info('socket')))
+            if counters:
+                stats['kernel_drops'] = (stats['kernel_drops'] or 0) + \
+                    counters['drops']
+                stats['kernel_rx_queue'] = (stats['kernel_rx_queue'] or 0) + \
+                    counters['rx_queue']
+        if kernel:
+            stats['session_drops'] = sum(
+                kernel.get(socket_inode(s.client.get_extra_info('socket')),
+                           {}).get('drops', 0) for s in self.sessions)
+        return stats
+
+    def damping_state(self):
+        """Flap damping state of the sessions that have damping enabled"""
+        return {session.remote: session.damping.state()
+                for session in self.sessions if session.damping is not None}
+
+    def echo_rtt(self):
+        """Round trip time of the Echo packets of the sessions that have the
+           Echo function active"""
+        return {session.remote: dict(session.echo_rtt)
+                for session in self.sessions if session.echo_active}
+
+    def _select(self, remotes):
+        """Sessions with the given remotes, all sessions if None"""
+        if remotes is None:
+            return list(self.sessions)
+        remotes = set(remotes)
+        return [s for s in self.sessions
+                if s.remote in remotes or s.remote_addr[0] in remotes]
+
+    async def drain(self, remotes=None, hold=None):
+        """Take sessions administratively down so their remotes converge
+           right away instead of after the Detection Time, all sessions unless
+           a list of remotes is given. The AdminDown packets are sent in
+           batches and repeated for `hold` seconds to make up for loss."""
+        settings = self.drain_settings
+        if hold is None:
+            hold = settings['hold']
+        sessions = self._select(remotes)
+        for session in sessions:
+            session.admin_down()
+        if remotes is None:
+            # Initiators of the remotes are answered with AdminDown too
+            self.reflector.admin_down()
+
+        # A system taking the Passive role MUST NOT transmit BFD Control
+        # packets before it heard from the remote
+        sessions = [s for s in sessions
+                    if not (s.passive and s.remote_discr == 0)]
+        deadline = self.loop.time() + hold
+        while True:
+            for i in range(0, len(sessions), settings['batch']):
+                for session in sessions[i:i + settings['batch']]:
+                    session.tx_packet()
+                # Let the event loop flush the sockets between batches
+                await asyncio.sleep(0)
+            if self.loop.time() >= deadline:
+                break
+            await asyncio.sleep(settings['interval'])
+        log.warning('Drained %d BFD sessions.', len(sessions))
+
+    async def _paced(self, sessions, rate, start):
+        """Start a Poll Sequence on each session through a function returning
+           an awaitable, at most `rate` per second, returns their results"""
+        begin = self.loop.time()
+        waiters = []
+        for i, session in enumerate(sessions):
+            # Spread the Poll Sequences evenly instead of in one burst
+            delay = begin + i / rate - self.loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            waiters.append(self.loop.create_task(start(session)))
+        return await asyncio.gather(*waiters, return_exceptions=True)
+
+    async def apply_timers(self, tx_interval, rx_interval, detect_mult,
+                           remotes=None, rate=RETIME['rate'],
+                           timeout=RETIME['timeout']):
+        """Apply a timer profile to sessions, all of them unless a list of
+           remotes is given. The Poll Sequences are started at most `rate`
+           per second, returns the remotes that didn't confirm the new
+           timers within `timeout` seconds."""
+        if rate <= 0:
+            raise ValueError('Rate must be positive.')
+        timers = (tx_interval, rx_interval, detect_mult)
+        sessions = [s for s in self._select(remotes)
+                    if (s.tx_interval, s.rx_interval, s.detect_mult) != timers]
+        log.info('Applying new timers to %d BFD sessions at %d per second.',
+                 len(sessions), rate)
+
+        def retime(session):
+            """Retime a session and wait for the Final (F) bit"""
+            session.retime(*timers)
+            return asyncio.wait_for(session.wait_poll(), timeout)
+
+        results = await self._paced(sessions, rate, retime)
+        unconfirmed = [session.remote for session, result
+                       in zip(sessions, results)
+                       if isinstance(result, asyncio.TimeoutError)]
+        if unconfirmed:
+            log.warning('New timers applied to %d BFD sessions, not '
+                        'confirmed by %s.', len(sessions),
+                        ', '.join(unconfirmed))
+        else:
+            log.warning('New timers applied to %d BFD sessions.',
+                        len(sessions))
+        return unconfirmed
+
+    async def verify(self, remotes=None, rate=RETIME['rate']):
+        """Verify with a Poll Sequence that the remotes of Up sessions are
+           still there, all of them unless a list of remotes is given. Meant
+           for sessions in Demand mode, which don't notice a remote going
+           away otherwise. The Poll Sequences are started at most `rate` per
+           second, returns the remotes that didn't answer in time."""
+        if rate <= 0:
+            raise ValueError('Rate must be positive.')
+        sessions = [s for s in self._select(remotes) if s.state == STATE_UP]
+        results = await self._paced(sessions, rate,
+                                    lambda session: session.verify())
+        failed = [session.remote for session, result
+                  in zip(sessions, results) if result is not True]
+        if failed:
+            log.warning('Verified %d BFD sessions, no answer from %s.',
+                        len(sessions), ', '.join(failed))
+        else:
+            log.info('Verified %d BFD sessions.', len(sessions))
+        return failed
+
+    def undrain(self, remotes=None):
+        """Return drained sessions to service, all of them unless a list of
+           remotes is given"""
+        for session in self._select(remotes):
+            session.admin_up()
+        if remotes is None:
+            self.reflector.admin_up()
+
+    def terminate(self, drain=True):
+        """Stop the event loop, after draining all sessions unless the
+           sessions are to be resumed by the next process"""
+        if self._terminating is not None:
+            return
+        if drain:
+            log.warning('Terminating, draining all BFD sessions.')
+            self._terminating = self.loop.create_task(self.drain())
+        else:
+            log.warning('Terminating for a restart, leaving the BFD sessions '
+                        'as they are.')
+            self._terminating = self.loop.create_task(asyncio.sleep(0))
+        self._terminating.add_done_callback(lambda _: self.loop.stop())
+
+    def close(self):
+        """Tear down all sessions and stop accepting traffic"""
+        log.info('Packet counters: %s', self.stats())
+        for session in list(self.sessions):
+            self.remove_session(session)
+        if self._refresh_remotes:
+            self._refresh_remotes.cancel()
+        if self._expire_dynamic:
+            self._expire_dynamic.cancel()
+        if self._persist_state:
+            self._persist_state.cancel()
+        if self._takeover_listener is not None:
+            # The path may belong to the process that took over by now
+            self.loop.remove_reader(self._takeover_listener.fileno())
+            self._takeover_listener.close()
+            self._takeover_listener = None
+        self.echo.close()
+        self.reflector.close()
+        self.pauses.close()
+        if self.timer is not None:
+            self.timer.close()
+            self.timer = None
+        for start in self._listener_starts.values():
+            start.cancel()
+        for server in self._servers():
+            server.close()
+
+    async def rx_packets(self):
+        """Process a received BFD Control packets"""
+        log.debug('Control process ready to receive packets.')
+        while True:
+            item = await self.rx_queue.get()
+            log.debug('Received a new packet from %s.', item[1])
+            self.process_packet(*item)
+
+    def _match(self, your_discr, source, ingress=None):
+        """Select the session a packet belongs to, `ingress` is the key of
+           the listener it was received on, None for the one on `local`"""
+        if ingress is None:
+            ingress = self._ingress(self.local, self.device)
         # If the Your Discriminator field is nonzero, it MUST be used to select
         # the session with which this BFD packet is associated.  If no session
         # is found, the packet MUST be discarded.
-        if packet.your_discr:
-            for session in self.sessions:
-                if session.local_discr == packet.your_discr:
-                    session.rx_packet(packet)
-                    return
+        if your_discr:
+            session = self._demux.get(your_discr)
         else:
             # If the Your Discriminator field is zero, the session MUST be
             # selected based on some combination of other fields ...
-            for session in self.sessions:
-                if session.remote == packet.source:
-                    session.rx_packet(packet)
-                    return
+            session = self._demux.get(ingress + (source,))
+        # Sessions only accept packets from their own listener, single-hop
+        # and multihop sessions each have their own port
+        if session is not None and session.ingress != ingress:
+            return None
+        return session
+
+    def admit(self, data, source, ingress=None):
+        """Decide on a received datagram before it is queued: returns None to
+           drop it, or whether it belongs to an Up session and should be
+           processed before anything else"""
+        session = self._match(int.from_bytes(data[8:12], 'big'), source,
+                              ingress)
+        if session is not None:
+            return session.state == STATE_UP
+
+        # Packets that match no session are cheap to send and expensive to
+        # process, limit them per source so they can't crowd out sessions
+        if self._unmatched.allow(source):
+            return False
+        self._log_drop('rate_limited_drops', 'Rate limiting packets from %s '
+                       'as they don\'t match any configured remote.', source)
+        return None
+
+    def _queue_drop(self, item):
+        """Account for a packet pushed out of the full receive queue"""
+        self._log_drop('queue_drops', 'Receive queue full, dropping packet '
+                       'from %s.', item[1])
+
+    def _log_drop(self, counter, msg, *args):
+        """Count a dropped packet and log about it, at most once every
+           DROP_LOG_INTERVAL seconds for each kind of drop"""
+        self.counters[counter] += 1
+        now = time.monotonic()
+        last, suppressed = self._drop_log.get(counter, (None, 0))
+        if last is not None and now - last < DROP_LOG_INTERVAL:
+            self._drop_log[counter] = (last, suppressed + 1)
+            return
+        if suppressed:
+            log.info('Suppressed %d similar messages in the last %d seconds.',
+                     suppressed, now - last)
+        log.info(msg, *args)
+        self._drop_log[counter] = (now, 0)
+
+    def _deliver(self, session, packet):
+        """Hand a packet to its session, dropping it if it fails
+           authentication"""
+        try:
+            session.rx_packet(packet)
+        except IOError as exc:
+            self._log_drop('auth_drops', 'Dropping packet from %s: %s',
+                           packet.source, exc)
+
+    def process_packet(self, data, source, rx_time=None, ingress=None):
+        """Process a received packet"""
+        self.counters['rx_packets'] += 1
+        if rx_time is not None:
+            delay = time.monotonic() - rx_time
+            self.rx_delay['last'] = delay
+            self.rx_delay['avg'] += (delay - self.rx_delay['avg']) / 8
+            self.rx_delay['max'] = max(self.rx_delay['max'], delay)
+        if ingress is None:
+            ingress = self._ingress(self.local, self.device)
+        key = ingress + (source,)
+
+        # In steady state the remote sends the same packet over and over,
+        # which carries our discriminator and so can only be for the session
+        # of its address. It is compared with the last one, not decoded.
+        session = self._demux.get(key)
+        if session is not None and session.rx_unchanged(data, rx_time):
+            self.counters['unchanged_packets'] += 1
+            if key in self._dynamic:
+                self._dynamic.move_to_end(key)
+            return
+
+        try:
+            packet = Packet(data, source, rx_time)
+        except IOError as exc:
+            self._log_drop('invalid_drops', 'Dropping packet: %s', exc)
+            return
+
+        session = self._match(packet.your_discr, packet.source, ingress)
+        if session is not None:
+            if key in self._dynamic:
+                self._dynamic.move_to_end(key)
+            self._deliver(session, packet)
+            return
 
         # If a matching session is not found, a new session MAY be created,
-        # or the packet MAY be discarded. Note: We discard for now.
-        log.info('Dropping packet from %s as it doesn\'t match any '
-                 'configured remote.', packet.source)
+        # or the packet MAY be discarded.
+        if not packet.your_discr and self.listening(packet.source):
+            self.create_dynamic(packet, ingress)
+            return
+        self._log_drop('unmatched_drops', 'Dropping packet from %s as it '
+                       'doesn\'t match any configured remote.', packet.source)
 
     def run(self):
         """Main function"""
 
-        asyncio.ensure_future(self.rx_packets())
+        self.loop.create_task(self.rx_packets())
+        # Runs after the sessions queued their first packets
+        self.loop.call_soon(self.finish_takeover)
 
         try:
             log.warning('BFD Daemon fully configured.')
-            self.loop.run_forever()
-        except KeyboardInterrupt:
-            def shutdown_exception_handler(loop, context):  # pragma: no cover
-                """Do not show `asyncio.CancelledError` exceptions"""
-                if "exception" not in context or not \
-                   isinstance(context["exception"], asyncio.CancelledError):
-                    loop.default_exception_handler(context)
-            self.loop.set_exception_handler(shutdown_exception_handler)
-            log.info('Keyboard interrupt detected.')
+            try:
+                self.loop.run_forever()
+            except KeyboardInterrupt:
+                log.info('Keyboard interrupt detected.')
+                self.loop.run_until_complete(self.drain())
+            if self.persist['path'] and not self._handed_over:
+                self.loop.run_until_complete(self.save_state())
+            self.close()
 
             # Wait for all tasks to be cancelled
-            tasks = asyncio.gather(*asyncio.Task.all_tasks(loop=self.loop),
-                                   loop=self.loop, return_exceptions=True)
-            tasks.add_done_callback(lambda t: self.loop.stop())
-            tasks.cancel()
-
-            # Keep the event loop running until it is either destroyed or all
-            # tasks have really terminated
-            while not tasks.done() and not self.loop.is_closed():
-                self.loop.run_forever()  # pragma: no cover
+            tasks = all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                self.loop.run_until_complete(
+                    asyncio.gather(*tasks, return_exceptions=True))
         finally:
             self.loop.close()
@@ -0,0 +1,85 @@
+"""aiobfd: Flap damping of unstable sessions"""
+
+import math
+import time
+
+# Defaults, modelled after BGP route flap damping (RFC 2439)
+DAMPING = {
+    'penalty': 1000,                # Added every time the session goes Down
+    'suppress': 2000,               # Suppress once the penalty exceeds this
+    'reuse': 750,                   # Release once the penalty decays below
+    'half_life': 15,                # Seconds for the penalty to halve
+    'max_suppress': 60,             # Longest time a session stays suppressed
+    'slow_interval': 0              # Intervals while suppressed, 0 to keep
+}
+
+
+class Damping:
+    """Exponentially decaying flap penalty of a session"""
+
+    def __init__(self, penalty=DAMPING['penalty'],
+                 suppress=DAMPING['suppress'], reuse=DAMPING['reuse'],
+                 half_life=DAMPING['half_life'],
+                 max_suppress=DAMPING['max_suppress'],
+                 slow_interval=DAMPING['slow_interval']):
+        # pylint: disable=I0011,R0913
+        if not 0 < reuse < suppress:
+            raise ValueError('The reuse threshold must be positive and below '
+                             'the suppress threshold.')
+        if half_life <= 0:
+            raise ValueError('The half-life must be positive.')
+        self.settings = {'penalty': penalty, 'suppress': suppress,
+                         'reuse': reuse, 'half_life': half_life,
+                         'max_suppress': max_suppress,
+                         'slow_interval': slow_interval}
+        self.half_life = half_life
+        self.slow_interval = slow_interval
+        # The penalty never exceeds the value that decays to the reuse
+        # threshold within the maximum suppress time
+        self.ceiling = reuse * 2 ** (max_suppress / half_life)
+        self.flaps = 0
+        self.suppressed = False
+        self._penalty = 0
+        self._updated = time.monotonic()
+
+    def penalty(self, now=None):
+        """Current penalty, decayed up to now"""
+        if now is None:
+            now = time.monotonic()
+        return self._penalty * 2 ** (-(now - self._updated) / self.half_life)
+
+    def flap(self, now=None):
+        """Penalize a flap, returns whether this starts suppression"""
+        if now is None:
+            now = time.monotonic()
+        self._penalty = min(self.penalty(now) + self.settings['penalty'],
+                            self.ceiling)
+        self._updated = now
+        self.flaps += 1
+        if self.suppressed or self._penalty <= self.settings['suppress']:
+            return False
+        self.suppressed = True
+        return True
+
+    def update(self, now=None):
+        """Check whether the penalty decayed enough to stop suppression,
+           returns whether suppression ended"""
+        if not self.suppressed or \
+                self.penalty(now) > self.settings['reuse']:
+            return False
+        self.suppressed = False
+        return True
+
+    def reuse_in(self, now=None):
+        """Seconds until the penalty decays to the reuse threshold"""
+        penalty = self.penalty(now)
+        if penalty <= self.settings['reuse']:
+            return 0
+        return self.half_life * math.log2(penalty / self.settings['reuse'])
+
+    def state(self, now=None):
+        """Damping state for export"""
+        return {'penalty': round(self.penalty(now)),
+                'flaps': self.flaps,
+                'suppressed': self.suppressed,
+                'reuse_in': self.reuse_in(now) if self.suppressed else 0}
@@ -0,0 +1,158 @@
+"""aiobfd: BFD Echo function"""
+
+import collections
+import heapq
+import itertools
+import random
+import struct
+import time
+import logging
+from .transport import enable_timestamps, rx_timestamp
+log = logging.getLogger(__name__)  # pylint: disable=I0011,C0103
+
+ECHO_PORT = 3785
+ECHO_BATCH = 0.001                  # Seconds to send Echo packets early
+
+# The payload of a BFD Echo packet is a local matter (RFC 5880 section 4.2),
+# ours identifies the process and session that sent it and when
+ECHO_MAGIC = b'aBFe'
+ECHO_FORMAT = '!4sIIQ'              # Magic, token, My Discriminator, tx time
+ECHO_LENGTH = struct.calcsize(ECHO_FORMAT)
+
+
+class Echo:
+    """Echo packets for all sessions of a control process, sent from and
+       received on a single socket. Echo packets of remotes are looped back
+       to them."""
+
+    def __init__(self, loop, lookup, reflect):
+        self.loop = loop
+        self.lookup = lookup        # Returns the session by My Discriminator
+        self.reflect = reflect      # Returns whether to loop back for a source
+        self.token = random.randint(1, 4294967295)  # Tells our packets apart
+        self.transport = None
+        self.sock = None
+        self.timestamps = False
+        self.counters = collections.Counter()
+        self._schedule = []         # Heap of due time, token, session
+        self._scheduled = dict()    # Token of the valid entry by session
+        self._tokens = itertools.count()
+        self._timer = None
+
+    @property
+    def running(self):
+        """Whether Echo packets can be sent and received"""
+        return self.transport is not None
+
+    def connection_made(self, transport):
+        """Socket setup correctly"""
+        self.transport = transport
+        self.sock = transport.get_extra_info('socket')
+        try:
+            self.timestamps = enable_timestamps(self.sock)
+        except OSError as exc:
+            log.warning('Kernel receive timestamps unavailable for Echo '
+                        'packets: %s', exc)
+
+    def connection_lost(self, _):
+        """Socket closed"""
+        self.transport = None
+
+    def schedule(self, session):
+        """Start sending Echo packets for a session, the first one right away.
+           Sessions stop being scheduled once their Echo function is no longer
+           active."""
+        if session in self._scheduled:
+            return
+        token = next(self._tokens)
+        self._scheduled[session] = token
+        self._push(self.loop.time(), token, session)
+
+    def unschedule(self, session):
+        """Stop sending Echo packets for a session"""
+        self._scheduled.pop(session, None)
+
+    def _push(self, due, token, session):
+        """Queue the next Echo packet of a session and make sure the timer
+           fires in time for it"""
+        heapq.heappush(self._schedule, (due, token, session))
+        if self._timer is not None and self._timer.when() <= due:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self.loop.call_at(due, self._transmit)
+
+    def _transmit(self):
+        """Send the Echo packets that are due, together with those due within
+           ECHO_BATCH so that sessions share a wakeup of the event loop"""
+        self._timer = None
+        now = self.loop.time()
+        due_sessions = []
+        while self._schedule and self._schedule[0][0] <= now + ECHO_BATCH:
+            due, token, session = heapq.heappop(self._schedule)
+            if self._scheduled.get(session) != token:
+                continue
+            if not session.echo_active:
+                del self._scheduled[session]
+                continue
+            due_sessions.append((due, token, session))
+        for due, token, session in due_sessions:
+            self.send(session)
+            # A late wakeup doesn't turn into a burst to catch up
+            interval = session.echo_interval / 1000000
+            heapq.heappush(self._schedule,
+                           (max(due + interval, now), token, session))
+        if self._schedule:
+            self._timer = self.loop.call_at(self._schedule[0][0],
+                                            self._transmit)
+
+    def send(self, session):
+        """Send a single Echo packet for a session"""
+        if self.transport is None:
+            return
+        data = struct.pack(ECHO_FORMAT, ECHO_MAGIC, self.token,
+                           session.local_discr,
+                           int(time.monotonic() * 1000000000))
+        self.transport.sendto(data, (session.remote_addr[0], ECHO_PORT) +
+                              tuple(session.remote_addr[2:]))
+        self.counters['echo_tx_packets'] += 1
+
+    def datagram_received(self, data, addr):
+        """Received an Echo packet, either one of ours coming back or one of
+           a remote to loop back"""
+        if len(data) == ECHO_LENGTH and data[:4] == ECHO_MAGIC:
+            _, token, discr, tx_time = struct.unpack(ECHO_FORMAT, data)
+            if token == self.token:
+                session = self.lookup(discr)
+                if session is None:
+                    self.counters['echo_unmatched_drops'] += 1
+                    return
+                rx_time = time.monotonic()
+                if self.timestamps:
+                    try:
+                        rx_time = rx_timestamp(self.sock)
+                    except OSError:
+                        pass
+                self.counters['echo_rx_packets'] += 1
+                session.echo_received(tx_time / 1000000000, rx_time)
+                return
+        if self.reflect(addr[0]):
+            self.transport.sendto(data, addr)
+            self.counters['echo_reflected_packets'] += 1
+        else:
+            self.counters['echo_unmatched_drops'] += 1
+
+    @staticmethod
+    def error_received(exc):
+        """Error occurred"""
+        log.debug('Socket error received for Echo packets: %s', exc)
+
+    def close(self):
+        """Stop sending Echo packets and release the socket"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._schedule = []
+        self._scheduled = dict()
+        if self.transport is not None:
+            self.transport.close()
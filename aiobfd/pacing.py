@@ -0,0 +1,105 @@
+"""aiobfd: Spreading the Control packets of all sessions over time"""
+
+import collections
+import logging
+import random
+from .pauses import smooth
+log = logging.getLogger(__name__)  # pylint: disable=I0011,C0103
+
+# Defaults for pacing the packets of all sessions
+PACING = {
+    'stagger': False,               # Spread (re)started sessions over a period
+    'max_pps': 0                    # Packets per second of all sessions, or 0
+}
+
+SLOT = 0.001                        # Seconds of the shortest slot
+PRUNE_SLOTS = 10000                 # Slots between dropping past reservations
+
+
+class Pacer:
+    """Schedules the Control packets of all sessions. Sessions that start or
+       restart together send their first packet at a random point of their
+       interval instead of all at once, and packets are moved to slots that
+       are below the packets per second ceiling. Packets are only moved
+       within the interval the session would have waited anyway, so the
+       jitter stays within the bounds of RFC 5880 section 6.8.7."""
+
+    def __init__(self, loop, stagger=PACING['stagger'],
+                 max_pps=PACING['max_pps']):
+        self.loop = loop
+        self.stagger = stagger
+        self.max_pps = max_pps
+        self.counters = collections.Counter()
+        # Packets sent back to back in one iteration of the event loop, as
+        # last seen, smoothed and worst case
+        self.burst = {'last': 0, 'avg': 0.0, 'max': 0}
+        self._slots = collections.Counter()  # Reserved packets by slot
+        self._pruned = 0
+        self._sent = 0
+
+    @property
+    def max_pps(self):
+        """Ceiling on the packets sent per second, 0 for none"""
+        return self._max_pps
+
+    @max_pps.setter
+    def max_pps(self, value):
+        self._max_pps = value
+        # Slots hold a whole number of packets, at least one
+        self.capacity = max(int(value * SLOT), 1) if value else None
+        self.slot = self.capacity / value if value else SLOT
+
+    def first(self, interval):
+        """Delay in seconds before the first packet of a session that
+           (re)starts with a jittered `interval`"""
+        if not self.stagger:
+            return 0
+        return self.delay(random.uniform(0, interval), interval)
+
+    def delay(self, earliest, latest):
+        """Reserve a slot for a packet due in `earliest` seconds that must
+           be sent within `latest` seconds, returns the delay until it"""
+        if not self.capacity:
+            return earliest
+        now = self.loop.time()
+        first = int((now + earliest) / self.slot)
+        last = int((now + latest) / self.slot)
+        if first - self._pruned >= PRUNE_SLOTS:
+            current = int(now / self.slot)
+            self._slots = collections.Counter(
+                {slot: count for slot, count in self._slots.items()
+                 if slot >= current})
+            self._pruned = current
+        for slot in range(first, last + 1):
+            if self._slots[slot] < self.capacity:
+                break
+        else:
+            # Sending late could take the session down at the remote, the
+            # ceiling gives way
+            self.counters['tx_overruns'] += 1
+            log.debug('Sending over the ceiling of %d packets per second.',
+                      self.max_pps)
+            slot = first
+        self._slots[slot] += 1
+        if slot == first:
+            return earliest
+        self.counters['tx_deferred'] += 1
+        return slot * self.slot - now
+
+    def sent(self):
+        """Account for a packet sent, for the burst size"""
+        self._sent += 1
+        if self._sent == 1:
+            # Runs after the callbacks that are ready now
+            self.loop.call_soon(self._end_burst)
+
+    def _end_burst(self):
+        """The loop got to the end of an iteration"""
+        smooth(self.burst, self._sent)
+        self._sent = 0
+
+    def stats(self):
+        """Burst size and packets moved or sent over the ceiling"""
+        return {'tx_burst': dict(self.burst),
+                'tx_deferred': self.counters['tx_deferred'],
+                'tx_overruns': self.counters['tx_overruns']}
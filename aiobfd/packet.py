@@ -2,6 +2,7 @@
 # pylint: disable=I0011,E0632,R0902
 
 import logging
+import time
 import bitstring
 log = logging.getLogger(__name__)  # pylint: disable=I0011,C0103
 
@@ -47,6 +48,34 @@ PACKET_FORMAT = (
     'uint:32=required_min_echo_rx_interval'
 )
 
+
+def _layout(packet_format):
+    """Bit offset and width of every field of a bitstring format"""
+    layout, offset = {}, 0
+    for token in packet_format.split(','):
+        kind, name = token.split('=')
+        width = 1 if kind == 'bool' else int(kind.split(':')[1])
+        layout[name] = (offset, width)
+        offset += width
+    return layout
+
+
+# Where the fields of PACKET_FORMAT are, for code that checks and rewrites
+# packets in place rather than decoding them
+FIELDS = _layout(PACKET_FORMAT)
+
+
+def field_offset(name):
+    """Offset of the byte a field starts in"""
+    return FIELDS[name][0] // 8
+
+
+def field_shift(name):
+    """Shift of the bits of a field that fits in a single byte"""
+    offset, width = FIELDS[name]
+    return 8 - offset % 8 - width
+
+
 PACKET_DEBUG_MSG = '\n|--------------------------------------------------\n' \
                    '| Vers: %d Diag: %d State: %d Poll: %d Final: %d\n' \
                    '| CPI: %d Auth: %d Demand: %d Multi: %d DetectMult: %d\n' \
@@ -58,8 +87,11 @@ PACKET_DEBUG_MSG = '\n|--------------------------------------------------\n' \
 class Packet:  # pylint: disable=I0011,R0903
     """A BFD Control Packet"""
 
-    def __init__(self, data, source):
+    def __init__(self, data, source, rx_time=None):
         self.source = source
+        self.data = data  # Needed to verify the Authentication Section
+        # Monotonic time the packet arrived, as close to the wire as known
+        self.rx_time = time.monotonic() if rx_time is None else rx_time
 
         packet = bitstring.BitString(data)
         packet_length = packet.len / 8
@@ -0,0 +1,161 @@
+"""aiobfd: Garbage collection control and event loop pause measurement"""
+# pylint: disable=I0011,R0902
+
+import asyncio
+import gc
+import time
+import logging
+log = logging.getLogger(__name__)  # pylint: disable=I0011,C0103
+
+# Defaults for garbage collection, which stops the event loop while it runs
+GC = {
+    'freeze': False,                # Exempt the objects alive after startup
+    'thresholds': None,             # Generation thresholds, Python's if None
+    'idle': False,                  # Only collect while the loop is idle
+    'interval': 0.1,                # Seconds between checks for collections
+    'window': 0.005,                # Seconds until the next timer when idle
+    'max_delay': 1.0                # Seconds a collection may be put off
+}
+
+LAG_INTERVAL = 0.1                  # Seconds between loop lag samples
+
+
+def smooth(stats, value):
+    """Update the last, smoothed and worst case of a measurement"""
+    stats['last'] = value
+    stats['avg'] += (value - stats['avg']) / 8
+    stats['max'] = max(stats['max'], value)
+
+
+class Pauses:
+    """Measures how late the event loop runs its callbacks and how long
+       garbage collections stop it, and controls when collections run.
+       Full collections of many sessions can take longer than a short
+       Detection Time."""
+
+    def __init__(self, loop, freeze=GC['freeze'], thresholds=GC['thresholds'],
+                 idle=GC['idle'], interval=GC['interval'],
+                 window=GC['window'], max_delay=GC['max_delay'], busy=None):
+        self.loop = loop
+        self.freeze_objects = freeze
+        self.thresholds = thresholds
+        self.idle = idle
+        self.interval = interval
+        self.window = window
+        self.max_delay = max_delay
+        self.busy = busy  # Returns whether work is waiting, if given
+        self.loop_lag = {'last': 0.0, 'avg': 0.0, 'max': 0.0}
+        self.gc_pause = {'last': 0.0, 'avg': 0.0, 'max': 0.0, 'total': 0.0,
+                         'collections': [0, 0, 0], 'frozen': 0}
+        self._gc_start = None
+        self._saved_thresholds = None
+        self._gc_enabled = None
+        self._tasks = []
+
+    def start(self):
+        """Start measuring and apply the collection settings"""
+        gc.callbacks.append(self._gc_callback)
+        self._tasks.append(self.loop.create_task(self.measure_lag()))
+        if self.thresholds:
+            self._saved_thresholds = gc.get_threshold()
+            gc.set_threshold(*self.thresholds)
+            log.info('Garbage collection thresholds set to %s.',
+                     ', '.join(str(t) for t in self.thresholds))
+        if self.idle:
+            # Collections that would have run on allocation wait for an
+            # idle window instead
+            self._gc_enabled = gc.isenabled()
+            gc.disable()
+            self._tasks.append(self.loop.create_task(self.collect_idle()))
+
+    def freeze(self):
+        """Move the objects that are alive to the permanent generation, so
+           later collections don't go through them again"""
+        if not self.freeze_objects:
+            return
+        if not hasattr(gc, 'freeze'):
+            log.warning('Unable to freeze objects, gc.freeze() requires '
+                        'Python 3.7.')
+            return
+        # Leave no garbage behind in the permanent generation
+        gc.collect()
+        gc.freeze()
+        self.gc_pause['frozen'] = gc.get_freeze_count()
+        log.info('Froze %d objects for garbage collection.',
+                 self.gc_pause['frozen'])
+
+    def _gc_callback(self, phase, info):
+        """Time every collection, whoever triggered it"""
+        if phase == 'start':
+            self._gc_start = time.perf_counter()
+        elif self._gc_start is not None:
+            pause = time.perf_counter() - self._gc_start
+            self._gc_start = None
+            smooth(self.gc_pause, pause)
+            self.gc_pause['total'] += pause
+            self.gc_pause['collections'][info['generation']] += 1
+
+    async def measure_lag(self):
+        """Periodically measure how late the loop wakes up a sleeper"""
+        while True:
+            start = self.loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            smooth(self.loop_lag,
+                   max(self.loop.time() - start - LAG_INTERVAL, 0.0))
+
+    def _idle_window(self):
+        """Whether nothing is due soon, so a collection delays nothing"""
+        if self.busy is not None and self.busy():
+            return False
+        # Only the default event loop exposes its timers
+        scheduled = getattr(self.loop, '_scheduled', None)
+        if scheduled:
+            return scheduled[0].when() - self.loop.time() >= self.window
+        return True
+
+    @staticmethod
+    def _due_generation():
+        """Oldest generation whose threshold is exceeded, None if none is"""
+        due = None
+        for generation, (count, threshold) in enumerate(
+                zip(gc.get_count(), gc.get_threshold())):
+            if threshold and count > threshold:
+                due = generation
+        return due
+
+    async def collect_idle(self):
+        """Run the collections that are due in idle windows of the loop,
+           or after `max_delay` seconds at the latest"""
+        waiting = None
+        while True:
+            await asyncio.sleep(self.interval)
+            generation = self._due_generation()
+            if generation is None:
+                waiting = None
+                continue
+            now = self.loop.time()
+            if waiting is None:
+                waiting = now
+            if self._idle_window() or now - waiting >= self.max_delay:
+                gc.collect(generation)
+                waiting = None
+
+    def stats(self):
+        """Loop lag and garbage collection pauses, in seconds"""
+        gc_pause = dict(self.gc_pause)
+        gc_pause['collections'] = list(self.gc_pause['collections'])
+        return dict(self.loop_lag), gc_pause
+
+    def close(self):
+        """Stop measuring and restore the collection settings"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._gc_callback in gc.callbacks:
+            gc.callbacks.remove(self._gc_callback)
+        if self._saved_thresholds is not None:
+            gc.set_threshold(*self._saved_thresholds)
+            self._saved_thresholds = None
+        if self._gc_enabled:
+            gc.enable()
+        self._gc_enabled = None
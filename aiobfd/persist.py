@@ -0,0 +1,86 @@
+"""aiobfd: Session state snapshots to resume sessions across restarts"""
+
+import json
+import os
+import tempfile
+import time
+import logging
+from .session import session_key
+log = logging.getLogger(__name__)  # pylint: disable=I0011,C0103
+
+SNAPSHOT_VERSION = 1
+
+# Fields every session state needs to be resumed, all integers
+SNAPSHOT_FIELDS = ('local_discr', 'remote_discr', 'state', 'remote_state',
+                   'local_diag', 'detect_mult', 'desired_min_tx_interval',
+                   'required_min_rx_interval', 'remote_min_rx_interval',
+                   'rcv_auth_seq', 'xmit_auth_seq', 'auth_seq_known')
+# Integers as well, or None until the remote was heard from
+SNAPSHOT_REMOTE_FIELDS = ('remote_min_tx_interval', 'remote_detect_mult')
+
+# Defaults for persisting session state
+PERSIST = {
+    'path': None,                   # Snapshot file, None to disable
+    'interval': 5                   # Seconds between periodic snapshots
+}
+
+
+def write_snapshot(path, states, now=None):
+    """Atomically replace the snapshot file with a list of session states,
+       readers see either the previous or the new snapshot in full"""
+    data = {'version': SNAPSHOT_VERSION,
+            'time': time.time() if now is None else now,
+            'sessions': states}
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, tmp_path = tempfile.mkstemp(dir=directory, prefix='.aiobfd-')
+    try:
+        with os.fdopen(handle, 'w') as tmp_file:
+            json.dump(data, tmp_file)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_snapshot(path, now=None):
+    """Read a snapshot file, returns its age in seconds and the session
+       states by local and remote, or None if there is no usable snapshot"""
+    try:
+        with open(path) as snapshot_file:
+            data = json.load(snapshot_file)
+    except FileNotFoundError:
+        return None
+    except (IOError, ValueError) as exc:
+        log.warning('Ignoring unreadable session state in %s: %s', path, exc)
+        return None
+    if not isinstance(data, dict) or \
+            data.get('version') != SNAPSHOT_VERSION:
+        log.warning('Ignoring session state in %s, unknown version.', path)
+        return None
+    try:
+        age = (time.time() if now is None else now) - float(data['time'])
+        states = {}
+        for state in data['sessions']:
+            _check_state(state)
+            states[session_key(state['local'], state['remote'],
+                               state.get('device'))] = state
+    except (KeyError, TypeError, ValueError) as exc:
+        log.warning('Ignoring malformed session state in %s: %s', path, exc)
+        return None
+    return age, states
+
+
+def _check_state(state):
+    """Raise ValueError unless a session state has all fields to resume"""
+    if not isinstance(state, dict):
+        raise ValueError('session state is not a mapping')
+    for field in ('local', 'remote') + SNAPSHOT_FIELDS + \
+            SNAPSHOT_REMOTE_FIELDS:
+        if field not in state:
+            raise ValueError('session state without %s' % field)
+    for field in SNAPSHOT_FIELDS + SNAPSHOT_REMOTE_FIELDS:
+        if not isinstance(state[field], int) and \
+                not (field in SNAPSHOT_REMOTE_FIELDS and state[field] is None):
+            raise ValueError('session state with a non-integer %s' % field)
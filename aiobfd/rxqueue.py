@@ -0,0 +1,139 @@
+"""aiobfd: Bounded receive queue and rate limiting of ingress packets"""
+# pylint: disable=I0011,R0903
+
+import asyncio
+import collections
+import time
+import logging
+log = logging.getLogger(__name__)  # pylint: disable=I0011,C0103
+
+DROP_TAIL = 'tail'                  # Drop arriving packets when full
+DROP_HEAD = 'head'                  # Drop the oldest packets when full
+DROP_POLICIES = (DROP_TAIL, DROP_HEAD)
+
+# Defaults for the intake of packets from the control socket
+INTAKE = {
+    'size': 4096,                   # Packets queued for processing
+    'policy': DROP_TAIL,
+    'unmatched_rate': 5,            # Packets/s from a source without session
+    'unmatched_burst': 10,
+    'unmatched_total': 100,         # Packets/s from all those sources
+    'max_sources': 4096             # Sources tracked for rate limiting
+}
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` events per second in bursts of `burst`"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'last')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = now
+
+    def consume(self, now):
+        """Take a token if available"""
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class SourceLimiter:
+    """Token buckets for each source and one shared by all sources, the least
+       recently seen source is forgotten once `max_sources` are tracked"""
+
+    def __init__(self, rate, burst, total_rate, max_sources):
+        self.rate = rate
+        self.burst = burst
+        self.max_sources = max_sources
+        self.total = TokenBucket(total_rate, total_rate, 0)
+        self.buckets = collections.OrderedDict()
+
+    def allow(self, source, now=None):
+        """Check whether a packet from a source is within the limits"""
+        if now is None:
+            now = time.monotonic()
+        bucket = self.buckets.get(source)
+        if bucket is None:
+            if len(self.buckets) >= self.max_sources:
+                self.buckets.popitem(last=False)
+            bucket = self.buckets[source] = TokenBucket(self.rate, self.burst,
+                                                        now)
+        else:
+            self.buckets.move_to_end(source)
+        return bucket.consume(now) and self.total.consume(now)
+
+
+class RxQueue:
+    """Bounded receive queue, priority packets are always taken first and
+       push out normal packets when the queue is full"""
+
+    def __init__(self, maxsize=INTAKE['size'], policy=DROP_TAIL, on_drop=None,
+                 loop=None):
+        if policy not in DROP_POLICIES:
+            raise ValueError('Drop policy must be one of %s.'
+                             % ', '.join(DROP_POLICIES))
+        self.maxsize = maxsize
+        self.policy = policy
+        self.on_drop = on_drop
+        self.loop = loop
+        self.drops = 0
+        self._priority = collections.deque()
+        self._normal = collections.deque()
+        self._waiter = None
+
+    def qsize(self):
+        """Number of queued packets"""
+        return len(self._priority) + len(self._normal)
+
+    def empty(self):
+        """Check whether no packets are queued"""
+        return not (self._priority or self._normal)
+
+    def _drop(self, item):
+        """Account for a dropped packet"""
+        self.drops += 1
+        if self.on_drop:
+            self.on_drop(item)
+
+    def put_nowait(self, item, priority=False):
+        """Queue a packet, returns False if it had to be dropped"""
+        queue = self._priority if priority else self._normal
+        if self.qsize() >= self.maxsize:
+            # Normal packets never push out priority packets
+            if self._normal and (priority or self.policy == DROP_HEAD):
+                self._drop(self._normal.popleft())
+            elif priority and self.policy == DROP_HEAD:
+                self._drop(self._priority.popleft())
+            else:
+                self._drop(item)
+                return False
+        queue.append(item)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+        return True
+
+    def get_nowait(self):
+        """Take the next packet, raises `asyncio.QueueEmpty` if none"""
+        if self._priority:
+            return self._priority.popleft()
+        if self._normal:
+            return self._normal.popleft()
+        raise asyncio.QueueEmpty
+
+    async def get(self):
+        """Take the next packet, waiting for one if needed"""
+        while self.empty():
+            loop = self.loop or asyncio.get_event_loop()
+            self._waiter = loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        return self.get_nowait()
@@ -0,0 +1,212 @@
+"""aiobfd: Seamless BFD (S-BFD, RFC 7880)"""
+# pylint: disable=I0011,R0902
+
+import collections
+import errno
+import logging
+import struct
+from .packet import MIN_PACKET_SIZE, Packet, field_offset, field_shift
+from .session import Session, DESIRED_MIN_TX_INTERVAL, \
+    DIAG_NEIGHBOR_SIGNAL_DOWN, STATE_ADMIN_DOWN, STATE_DOWN, STATE_UP, VERSION
+log = logging.getLogger(__name__)  # pylint: disable=I0011,C0103
+
+SBFD_PORT = 7784
+
+# Defaults for the reflector, which answers the initiators of any remote
+REFLECTOR = {
+    'discriminators': (),           # Reflector discriminators to answer for
+    'rx_interval': 10000,           # Required Min RX Interval advertised
+    'batch': 64                     # Packets handled per event loop wakeup
+}
+
+# The reflector doesn't decode packets with `Packet`, it checks and rewrites
+# the mandatory section in place, where PACKET_FORMAT has its fields
+VERSION_OFFSET = field_offset('version')
+VERSION_SHIFT = field_shift('version')
+FLAGS_OFFSET = field_offset('state')    # Sta, P, F, C, A, D and M bits
+STATE_SHIFT = field_shift('state')
+LENGTH_OFFSET = field_offset('length')
+DISCRS_OFFSET = field_offset('my_discr')  # My and Your Discriminator
+RX_OFFSET = field_offset('required_min_rx_interval')
+DISCRS = struct.Struct('!II')
+INTERVALS = struct.Struct('!II')    # Required Min (Echo) RX Interval
+POLL_BIT = 1 << field_shift('poll')
+FINAL_BIT = 1 << field_shift('final')
+# Authentication (A) and Multipoint (M)
+REJECT_BITS = 1 << field_shift('authentication_present') | \
+    1 << field_shift('multipoint')
+RECV_SIZE = 256                     # The Length field is a single byte
+
+
+class Reflector:
+    """Stateless S-BFD reflector, answers the packets of initiators for
+       its discriminators by rewriting them in place. It has no sessions
+       and doesn't allocate per packet beyond the socket address."""
+
+    def __init__(self, loop, discriminators,
+                 rx_interval=REFLECTOR['rx_interval'],
+                 batch=REFLECTOR['batch']):
+        self.loop = loop
+        self.discriminators = set(discriminators)
+        self.rx_interval = rx_interval
+        self.batch = batch
+        self.state = STATE_UP       # AdminDown while out of service
+        self.sock = None
+        self.counters = collections.Counter()
+        self._buffer = bytearray(RECV_SIZE)
+        self._reply = memoryview(self._buffer)[:MIN_PACKET_SIZE]
+
+    @property
+    def running(self):
+        """Whether packets are reflected"""
+        return self.sock is not None
+
+    def open(self, sock):
+        """Start answering the packets received on a bound UDP socket"""
+        sock.setblocking(False)
+        self.sock = sock
+        self.loop.add_reader(sock.fileno(), self._receive)
+
+    def reflect(self, buffer, size):
+        """Turn a received packet of `size` bytes into the reply in place,
+           returns whether it is to be sent back (RFC 7880 section 7.2.2)"""
+        flags = buffer[FLAGS_OFFSET]
+        if size < MIN_PACKET_SIZE or \
+                buffer[VERSION_OFFSET] >> VERSION_SHIFT != VERSION or \
+                flags & REJECT_BITS or \
+                not MIN_PACKET_SIZE <= buffer[LENGTH_OFFSET] <= size:
+            self.counters['reflector_invalid_drops'] += 1
+            return False
+        my_discr, your_discr = DISCRS.unpack_from(buffer, DISCRS_OFFSET)
+        if not my_discr:
+            self.counters['reflector_invalid_drops'] += 1
+            return False
+        if your_discr not in self.discriminators:
+            self.counters['reflector_unmatched_drops'] += 1
+            return False
+
+        # The Detect Mult and Desired Min TX Interval are those of the
+        # initiator, a Poll (P) bit is answered with the Final (F) bit
+        buffer[VERSION_OFFSET] = VERSION << VERSION_SHIFT  # Diag is zero
+        buffer[FLAGS_OFFSET] = self.state << STATE_SHIFT | \
+            (FINAL_BIT if flags & POLL_BIT else 0)
+        buffer[LENGTH_OFFSET] = MIN_PACKET_SIZE
+        DISCRS.pack_into(buffer, DISCRS_OFFSET, your_discr, my_discr)
+        INTERVALS.pack_into(buffer, RX_OFFSET, self.rx_interval, 0)
+        return True
+
+    def _receive(self):
+        """Answer the packets waiting on the socket, up to a batch at a time
+           so the sessions get their turn"""
+        buffer, reply, sock = self._buffer, self._reply, self.sock
+        reflected = 0
+        for _ in range(self.batch):
+            try:
+                size, addr = sock.recvfrom_into(buffer)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as exc:
+                log.debug('Socket error received for S-BFD packets: %s', exc)
+                break
+            if not self.reflect(buffer, size):
+                continue
+            try:
+                sock.sendto(reply, addr)
+            except OSError as exc:
+                if exc.errno not in (errno.EAGAIN, errno.ENOBUFS):
+                    log.debug('Unable to answer S-BFD packet from %s: %s',
+                              addr[0], exc)
+                self.counters['reflector_tx_drops'] += 1
+                continue
+            reflected += 1
+        self.counters['reflected_packets'] += reflected
+
+    def admin_down(self):
+        """Take the reflector out of service, initiators are answered with
+           AdminDown so their sessions go down right away"""
+        self.state = STATE_ADMIN_DOWN
+
+    def admin_up(self):
+        """Return the reflector to service"""
+        self.state = STATE_UP
+
+    def close(self):
+        """Stop answering packets and release the socket"""
+        if self.sock is not None:
+            self.loop.remove_reader(self.sock.fileno())
+            self.sock.close()
+            self.sock = None
+
+
+class Initiator(Session):
+    """S-BFD initiator, a session with the reflector discriminator of a
+       remote. The reflector has no state of its own, the session goes Up
+       once its packets are reflected with the state Up."""
+
+    def __init__(self, local, remote, reflector_discr, **kwargs):
+        start = kwargs.pop('start', True)
+        if kwargs.get('auth') is not None:
+            raise ValueError('S-BFD sessions are not authenticated.')
+        super().__init__(local, remote, start=False, **kwargs)
+        self.reflector_discr = reflector_discr
+        self.port = SBFD_PORT
+        self.remote_discr = reflector_discr
+        self.echo = None
+        self.rx_packets = 0
+        self.rx_drops = 0
+        if start:
+            self.loop.run_until_complete(self.start())
+
+    def _client_protocol(self):
+        """Protocol of the source socket, which receives the replies"""
+        protocol = super()._client_protocol()
+        protocol.rx_callback = self.datagram_received
+        return protocol
+
+    def datagram_received(self, data, addr):
+        """Received a reply on the source socket"""
+        try:
+            self.rx_packet(Packet(data, addr[0]))
+        except IOError as exc:
+            self.rx_drops += 1
+            log.debug('Dropping S-BFD packet from %s: %s', addr[0], exc)
+
+    def rx_packet(self, packet):
+        """Receive a reflected packet"""
+        if packet.your_discr != self.local_discr or \
+                packet.my_discr != self.reflector_discr:
+            raise IOError('Discriminators don\'t match the S-BFD session.')
+        if packet.authentication_present:
+            raise IOError('Received packet with authentication.')
+        self.rx_packets += 1
+
+        # The reflector returns our Detect Mult and Desired Min TX Interval,
+        # so the Detection Time follows our own transmit interval
+        self.remote_state = packet.state
+        self.remote_min_rx_interval = packet.required_min_rx_interval
+        self.remote_detect_mult = packet.detect_mult
+        self.remote_min_tx_interval = packet.desired_min_tx_interval
+
+        if self.state == STATE_ADMIN_DOWN:
+            return
+        if packet.state == STATE_UP:
+            if self.state != STATE_UP:
+                self.state = STATE_UP
+                tx_interval = self._async_tx_interval
+                self._apply_intervals()
+                # The Detection Time follows the faster interval with the
+                # next reply, don't wait out the one second of Down
+                if self._async_tx_interval < tx_interval:
+                    self._restart_tx_packets()
+                log.error('S-BFD session with %s going to UP state.',
+                          self.remote)
+        elif self.state != STATE_DOWN:
+            self.local_diag = DIAG_NEIGHBOR_SIGNAL_DOWN
+            self.state = STATE_DOWN
+            self.desired_min_tx_interval = DESIRED_MIN_TX_INTERVAL
+            log.error('S-BFD reflector %s signaled going ADMIN_DOWN.',
+                      self.remote)
+
+        if packet.final:
+            self._end_poll_sequence()
+        self.last_rx_packet_time = packet.rx_time
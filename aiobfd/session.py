@@ -4,18 +4,24 @@
 # socket.IPPROTO_IPV6 missing on Windows
 
 import asyncio
+import errno
 import random
 import socket
 import time
 import logging
 import bitstring
-from .transport import Client
+from .auth import AUTH_OFFSET, Authentication
+from .damping import Damping
+from .transport import Client, MAX_TTL, SOCKET_PROFILE, \
+    apply_socket_profile, bind_device, set_max_ttl, set_ttl
 from .packet import PACKET_FORMAT, PACKET_DEBUG_MSG
 log = logging.getLogger(__name__)  # pylint: disable=I0011,C0103
 
 SOURCE_PORT_MIN = 49152
 SOURCE_PORT_MAX = 65535
+SOURCE_PORT_ATTEMPTS = 64
 CONTROL_PORT = 3784
+MULTIHOP_PORT = 4784                # RFC 5883
 
 VERSION = 1
 
@@ -36,32 +42,94 @@ STATE_UP = 3                        # Up
 
 CONTROL_PLANE_INDEPENDENT = False   # Control Plane Independent
 
+# Socket errors reported through ICMP that signal a broken path
+PATH_DOWN_ERRORS = (errno.ECONNREFUSED, errno.EHOSTUNREACH,
+                    errno.ENETUNREACH)
+
 # Default timers
 DESIRED_MIN_TX_INTERVAL = 1000000   # Minimum initial value
+DEMAND_CHECK_INTERVAL = 60          # Seconds between checks while idle
+ECHO_CONTROL_RX_INTERVAL = 1000000  # Minimum while the Echo function is active
 
 # Keep these fields statically disabled as they're not implemented
-AUTH_TYPE = None                    # Authentication disabled
-DEMAND_MODE = False                 # Demand Mode
 MULTIPOINT = False                  # Multipoint
-REQUIRED_MIN_ECHO_RX_INTERVAL = 0   # Do not support echo packet
+
+
+async def resolve(loop, host, port, family=socket.AF_UNSPEC):
+    """Resolve a host into an address family and socket address without
+       blocking the event loop"""
+    try:
+        # Numeric addresses never need the resolver, skip the thread pool
+        info = socket.getaddrinfo(host, port, family, socket.SOCK_DGRAM, 0,
+                                  socket.AI_NUMERICHOST)
+    except socket.gaierror:
+        info = await loop.getaddrinfo(host, port, family=family,
+                                      type=socket.SOCK_DGRAM)
+    fam, _, _, _, addr = info[0]
+    return fam, addr
+
+
+def session_key(local, remote, device=None):
+    """Identity of a configured session, a remote is configured once for
+       each local address and device"""
+    if device is None:
+        return (local, remote)
+    return (local, remote, device)
+
+
+def is_numeric(host):
+    """Check whether a host is an IP address rather than a hostname"""
+    try:
+        socket.getaddrinfo(host, None, 0, 0, 0, socket.AI_NUMERICHOST)
+    except socket.gaierror:
+        return False
+    return True
 
 
 class Session:
     """BFD session with a remote"""
 
     def __init__(self, local, remote, family=socket.AF_UNSPEC, passive=False,
-                 tx_interval=1000000, rx_interval=1000000, detect_mult=3):
+                 tx_interval=1000000, rx_interval=1000000, detect_mult=3,
+                 connected=False, socket_profile=None, damping=None,
+                 auth=None, demand_mode=False, echo_tx_interval=0,
+                 echo_rx_interval=0, echo_aiobfd=False, echo=None,
+                 multihop=False, ttl=MAX_TTL, device=None, pacer=None,
+                 timer=None, sock=None, loop=None, start=True):
         # Argument variables
         self.local = local
         self.remote = remote
         self.family = family
         self.passive = passive
-        self.loop = asyncio.get_event_loop()
+        self.connected = connected  # connect() the source socket to remote
+        self.socket_profile = socket_profile or SOCKET_PROFILE
+        self.loop = loop or asyncio.get_event_loop()
         self.rx_interval = rx_interval  # User selectable value
         self.tx_interval = tx_interval  # User selectable value
+        self.echo_tx_interval = echo_tx_interval  # User selectable, 0 is off
+        self.echo_rx_interval = echo_rx_interval  # User selectable, 0 is off
+        # Our Echo packets are addressed to the remote and only aiobfd loops
+        # them back, other systems expect them to be addressed to ourselves
+        self.echo_aiobfd = echo_aiobfd
+        if (echo_tx_interval or echo_rx_interval) and not echo_aiobfd:
+            log.warning('Not using the Echo function with %s, it only works '
+                        'with remotes that run aiobfd (echo_aiobfd).', remote)
+        self.echo = echo  # Echo function shared by the sessions of a process
+        # Multihop sessions (RFC 5883) run on their own port, may be any
+        # number of hops away and don't use the Echo function
+        self.multihop = multihop
+        self.port = MULTIHOP_PORT if multihop else CONTROL_PORT
+        self.ttl = ttl if multihop else MAX_TTL
+        if multihop:
+            self.echo = None
+        self.device = device  # Interface or VRF device, None for any
+        self.pacer = pacer  # Shared with the other sessions, if any
+        self.timer = timer  # Shared timerfd timers, asyncio's if None
+        # Listener the packets of the remote arrive on, set by `Control`
+        self.ingress = None
 
         # As per 6.8.1. State Variables
-        self.state = STATE_DOWN
+        self._state = STATE_DOWN
         self.remote_state = STATE_DOWN
         self.local_discr = random.randint(0, 4294967295)  # 32-bit value
         self.remote_discr = 0
@@ -69,10 +137,11 @@ class Session:
         self._desired_min_tx_interval = DESIRED_MIN_TX_INTERVAL
         self._required_min_rx_interval = rx_interval
         self._remote_min_rx_interval = 1
-        self.demand_mode = DEMAND_MODE
+        self._demand_mode = demand_mode
         self.remote_demand_mode = False
         self.detect_mult = detect_mult
-        self.auth_type = AUTH_TYPE
+        self.auth = Authentication(**auth) if auth is not None else None
+        self.auth_type = self.auth.type if self.auth is not None else 0
         self.rcv_auth_seq = 0
         self.xmit_auth_seq = random.randint(0, 4294967295)  # 32-bit value
         self.auth_seq_known = False
@@ -81,35 +150,543 @@ class Session:
         self._async_tx_interval = 1000000
         self._final_async_tx_interval = None  # Used to delay timer changes
         self.last_rx_packet_time = None
+        self._rx_header = None  # Last packet that left the session Up as is
         self._async_detect_time = None
         self._final_async_detect_time = None  # Used to delay timer changes
-        self.poll_sequence = False
+        self._poll_sequence = False
+        self._poll_start_time = None
+        self._poll_waiter = None
+        self._tx_buffer = None  # Reused to sign packets when authenticating
+        self._tx_signed = None  # Mandatory section of the last signed packet
+        self._tx_idle = False  # Not transmitting, the remote is in Demand mode
+        self._detect_idle = False  # Not detecting, we're in Demand mode
         self._remote_detect_mult = None
         self._remote_min_tx_interval = None
         self._tx_packets = None
+        self._detect_async_failure = None
+        self._detect_suspended = False  # While handing over
+        self._detect_deadline = None  # Slept until on precise timers
+        self.client = None
+        self._family = family
+        self.remote_addr = None  # Numeric socket address of the remote
+        self.remote_numeric = is_numeric(remote)
+        self._sock = sock  # Source socket taken over from another process
+        self._sock_connected = False  # Connected to `remote_addr`
+        self.socket_errors = 0
 
-        # Create the local client and run it once to grab a port
-        log.debug('Setting up UDP client for %s:%s.', remote, CONTROL_PORT)
-        src_port = random.randint(SOURCE_PORT_MIN, SOURCE_PORT_MAX)
-        fam, _, _, _, addr = socket.getaddrinfo(self.local, src_port)[0]
-        sock = socket.socket(family=fam, type=socket.SOCK_DGRAM)
-        if fam == socket.AF_INET:
-            sock.setsockopt(socket.SOL_IP, socket.IP_TTL, 255)
-        elif fam == socket.AF_INET6:
-            # Under Windows the IPv6 socket constant is somehow missing
-            # https://bugs.python.org/issue29515
-            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_UNICAST_HOPS, 255)
-        sock.bind(addr)
-        task = self.loop.create_datagram_endpoint(Client, sock=sock)
-        self.client, _ = self.loop.run_until_complete(task)
+        # Echo function, active while the session is Up and the remote is
+        # willing to loop back Echo packets
+        self.remote_min_echo_rx_interval = 0
+        self._echo_active = False
+        self.last_echo_rx_time = None
+        # Round trip time of Echo packets in seconds, as last seen, smoothed,
+        # best and worst case
+        self.echo_rtt = {'last': None, 'avg': None, 'min': None, 'max': None}
+
+        # Called with the session and its new state whenever the state
+        # reported to the outside world changes
+        self.listeners = []
+        self.reported_state = STATE_DOWN
+        self.damping = Damping(**damping) if damping is not None else None
+        self._damping_timer = None
+
+        if start:
+            self.loop.run_until_complete(self.start())
+
+    @classmethod
+    async def create(cls, *args, **kwargs):
+        """Create a session from within a running event loop"""
+        session = cls(*args, start=False, **kwargs)
+        await session.start()
+        return session
+
+    async def start(self):
+        """Set up the source socket and start the session coroutines"""
+
+        if self._sock is None:
+            self._sock = await self._open_socket()
+        else:
+            apply_socket_profile(self._sock, self.socket_profile)
+        self._family = self._sock.family
+        await self.resolve_remote()
+        task = self.loop.create_datagram_endpoint(self._client_protocol,
+                                                  sock=self._sock)
+        self.client, _ = await task
         log.info('Sourcing traffic for %s:%s from %s:%s.',
-                 remote, CONTROL_PORT,
+                 self.remote, self.port,
                  self.client.get_extra_info('sockname')[0],
                  self.client.get_extra_info('sockname')[1])
 
         # Schedule the coroutines to transmit packets and detect failures
-        self._tx_packets = asyncio.ensure_future(self.async_tx_packets())
-        asyncio.ensure_future(self.detect_async_failure())
+        self._tx_packets = self.loop.create_task(self.async_tx_packets())
+        self._detect_async_failure = \
+            self.loop.create_task(self.detect_async_failure())
+
+    def _client_protocol(self):
+        """Protocol of the source socket, which receives nothing"""
+        return Client(self.error_received)
+
+    async def _open_socket(self):
+        """Create the source socket and grab a port"""
+        log.debug('Setting up UDP client for %s:%s.',
+                  self.remote, self.port)
+        fam, addr = await resolve(self.loop, self.local, 0, self.family)
+        sock = socket.socket(family=fam, type=socket.SOCK_DGRAM)
+        if self.device is not None:
+            try:
+                bind_device(sock, self.device)
+            except OSError:
+                sock.close()
+                raise
+        if self.multihop:
+            set_ttl(sock, self.ttl)
+        else:
+            set_max_ttl(sock)
+        failed = apply_socket_profile(sock, self.socket_profile)
+        if failed:
+            log.debug('Unable to set socket options %s for %s.',
+                      ', '.join(failed), self.remote)
+        self._bind_source_port(sock, addr)
+        return sock
+
+    async def resolve_remote(self):
+        """(Re-)resolve the remote into the numeric socket address packets are
+           sent to, returns whether the address changed"""
+        _, addr = await resolve(self.loop, self.remote, self.port,
+                                self._family)
+        if addr == self.remote_addr:
+            return False
+        if self.remote_addr is not None:
+            log.info('Remote %s now resolves to %s.', self.remote, addr[0])
+        self.remote_addr = addr
+        if self.connected:
+            self._connect()
+        return True
+
+    def _connect(self):
+        """Connect the source socket to the remote, packets are sent to its
+           address instead as long as that fails"""
+        # Connecting a UDP socket only sets the default destination and
+        # caches the route, this never blocks. It fails without a route.
+        try:
+            self._sock.connect(self.remote_addr)
+        except OSError as exc:
+            log.warning('Unable to connect the socket for %s, sending to '
+                        'its address until it resolves again: %s',
+                        self.remote, exc)
+            self._sock_connected = False
+            return
+        self._sock_connected = True
+
+    def error_received(self, exc):
+        """Handle errors reported on the source socket. On a connected socket
+           ICMP unreachables are reported here, which signals the path to
+           the remote is broken well before the Detection Time expires."""
+        self.socket_errors += 1
+        if getattr(exc, 'errno', None) not in PATH_DOWN_ERRORS:
+            log.error('Socket error received for %s: %s', self.remote, exc)
+            return
+        if self.state in (STATE_INIT, STATE_UP):
+            self.state = STATE_DOWN
+            self.local_diag = DIAG_PATH_DOWN
+            self.desired_min_tx_interval = DESIRED_MIN_TX_INTERVAL
+            log.critical('Path to BFD remote %s failed (%s), going DOWN!',
+                         self.remote, exc)
+        if self.connected:
+            # Force a fresh route lookup in case the routing table changed
+            self._connect()
+
+    @staticmethod
+    def _bind_source_port(sock, addr):
+        """Bind to a random source port in the range required by RFC 5881,
+           retrying when the port is already taken by another session"""
+        for _ in range(SOURCE_PORT_ATTEMPTS):
+            src_port = random.randint(SOURCE_PORT_MIN, SOURCE_PORT_MAX)
+            try:
+                sock.bind((addr[0], src_port) + tuple(addr[2:]))
+                return
+            except OSError as exc:
+                if exc.errno != errno.EADDRINUSE:
+                    sock.close()
+                    raise
+        sock.close()
+        raise OSError(errno.EADDRINUSE, 'No free BFD source port found.')
+
+    def retime(self, tx_interval, rx_interval, detect_mult):
+        """Apply new user selected timers to a running session"""
+        self.tx_interval = tx_interval
+        self.rx_interval = rx_interval
+        self.detect_mult = detect_mult
+        self._apply_intervals()
+        self._detect_sooner()
+
+    def set_echo(self, echo_tx_interval, echo_rx_interval,
+                 echo_aiobfd=False):
+        """Apply new user selected Echo intervals to a running session"""
+        self.echo_tx_interval = echo_tx_interval
+        self.echo_rx_interval = echo_rx_interval
+        self.echo_aiobfd = echo_aiobfd
+        self._update_echo()
+        self._update_demand()
+        self._detect_sooner()
+
+    def wait_poll(self):
+        """Future that completes once the remote confirmed the current Poll
+           Sequence with the Final (F) bit"""
+        if self._poll_waiter is None or self._poll_waiter.done():
+            self._poll_waiter = self.loop.create_future()
+            if not self.poll_sequence:
+                self._poll_waiter.set_result(None)
+        return self._poll_waiter
+
+    async def verify(self):
+        """Check that the remote is still there with a Poll Sequence, which a
+           session in Demand mode doesn't learn otherwise. Returns whether
+           the remote answered within the Detection Time."""
+        self.poll_sequence = True
+        try:
+            await asyncio.wait_for(asyncio.shield(self.wait_poll()),
+                                   self.demand_detect_time / 1000000)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def _apply_intervals(self):
+        """Apply the user selected timers, slowed down while suppressed"""
+        tx_interval, rx_interval = self.tx_interval, self.rx_interval
+        if self.damping is not None and self.damping.suppressed:
+            tx_interval = max(tx_interval, self.damping.slow_interval)
+            rx_interval = max(rx_interval, self.damping.slow_interval)
+        # When the Echo function is active, a system SHOULD set
+        # bfd.RequiredMinRxInterval to a value of not less than one second
+        # (section 6.8.3).
+        if self._echo_active:
+            rx_interval = max(rx_interval, ECHO_CONTROL_RX_INTERVAL)
+
+        # bfd.DesiredMinTxInterval is held at one second until the session
+        # comes Up, the FSM applies tx_interval at that point.
+        if self.state == STATE_UP:
+            self.desired_min_tx_interval = tx_interval
+        self.required_min_rx_interval = rx_interval
+
+    def set_damping(self, damping):
+        """Enable, change or disable flap damping, given its settings"""
+        current = self.damping.settings if self.damping else None
+        # Settings left out are the defaults, not the ones set before
+        if damping is not None and current is not None and \
+                Damping(**damping).settings == current:
+            return
+        if damping is None and current is None:
+            return
+        if self._damping_timer is not None:
+            self._damping_timer.cancel()
+            self._damping_timer = None
+        self.damping = Damping(**damping) if damping is not None else None
+        self._apply_intervals()
+        self._report_state()
+
+    def set_auth(self, auth):
+        """Enable, change or disable authentication, given its settings"""
+        auth = Authentication(**auth) if auth is not None else None
+        if (auth and auth.settings) == (self.auth and self.auth.settings):
+            return
+        self.auth = auth
+        auth_type = self.auth.type if self.auth is not None else 0
+        if auth_type != self.auth_type:
+            self.auth_type = auth_type
+            self.auth_seq_known = False
+        self._tx_buffer = self._tx_signed = None
+
+    def snapshot(self):
+        """Session state needed to resume the session in another process"""
+        return {'local': self.local,
+                'remote': self.remote,
+                'device': self.device,
+                'local_discr': self.local_discr,
+                'remote_discr': self.remote_discr,
+                'state': self.state,
+                'remote_state': self.remote_state,
+                'local_diag': self.local_diag,
+                'detect_mult': self.detect_mult,
+                'desired_min_tx_interval': self.desired_min_tx_interval,
+                'required_min_rx_interval': self.required_min_rx_interval,
+                'remote_min_rx_interval': self.remote_min_rx_interval,
+                'remote_min_tx_interval': self.remote_min_tx_interval,
+                'remote_detect_mult': self.remote_detect_mult,
+                'remote_demand_mode': self.remote_demand_mode,
+                'remote_min_echo_rx_interval':
+                    self.remote_min_echo_rx_interval,
+                'rcv_auth_seq': self.rcv_auth_seq,
+                'xmit_auth_seq': self.xmit_auth_seq,
+                'auth_seq_known': self.auth_seq_known}
+
+    def resume(self, state, age):
+        """Continue a session from the state another process saved `age`
+           seconds ago, returns whether the session was resumed"""
+        if state['state'] not in (STATE_INIT, STATE_UP):
+            return False
+
+        # The remote declares the session down once it hasn't heard from us
+        # for its Detection Time, there is nothing left to resume after that
+        detect_time = state['detect_mult'] * max(
+            state['desired_min_tx_interval'], state['remote_min_rx_interval'])
+        if not 0 <= age * 1000000 < detect_time:
+            return False
+
+        self.local_discr = state['local_discr']
+        self.remote_discr = state['remote_discr']
+        self.remote_state = state['remote_state']
+        self.local_diag = state['local_diag']
+
+        # Take over the negotiated timers as they were, without a Poll
+        # Sequence as nothing changed for the remote
+        self._desired_min_tx_interval = state['desired_min_tx_interval']
+        self._required_min_rx_interval = state['required_min_rx_interval']
+        self._remote_min_rx_interval = state['remote_min_rx_interval']
+        self._remote_min_tx_interval = state['remote_min_tx_interval']
+        self._remote_detect_mult = state['remote_detect_mult']
+        self.remote_demand_mode = state.get('remote_demand_mode', False)
+        self.remote_min_echo_rx_interval = \
+            state.get('remote_min_echo_rx_interval', 0)
+        self._async_tx_interval = max(self._desired_min_tx_interval,
+                                      self._remote_min_rx_interval)
+        self._async_detect_time = self.calc_detect_time(
+            self._remote_detect_mult, self._required_min_rx_interval,
+            self._remote_min_tx_interval)
+        self.last_rx_packet_time = time.monotonic() - age
+
+        # The sequence number must keep increasing, skip over the packets
+        # the other process may have sent after saving its state
+        self.rcv_auth_seq = state['rcv_auth_seq']
+        self.auth_seq_known = state['auth_seq_known']
+        self.xmit_auth_seq = (state['xmit_auth_seq'] + 1 + int(
+            age * 1000000 / self._async_tx_interval)) % 4294967296
+
+        self.state = state['state']
+        # Timers configured differently in the meantime are negotiated as usual
+        self._apply_intervals()
+        return True
+
+    def admin_down(self):
+        """Take the session administratively down, the remote is told so in
+           every packet sent from now on"""
+        if self.state == STATE_ADMIN_DOWN:
+            return
+        # When a system wishes to take a session down administratively, it
+        # sets bfd.SessionState to AdminDown and bfd.LocalDiag to an
+        # appropriate value (section 6.8.16).
+        self.local_diag = DIAG_ADMIN_DOWN
+        self.state = STATE_ADMIN_DOWN
+        self.desired_min_tx_interval = DESIRED_MIN_TX_INTERVAL
+        log.warning('BFD session with %s going to ADMIN_DOWN state.',
+                    self.remote)
+
+    def admin_up(self):
+        """Return an administratively down session to service"""
+        if self.state != STATE_ADMIN_DOWN:
+            return
+        # Once administratively enabled, the session goes to Down and is
+        # brought up again by the remote.
+        self.state = STATE_DOWN
+        log.warning('BFD session with %s leaving ADMIN_DOWN state.',
+                    self.remote)
+
+    def shutdown(self):
+        """Stop the session coroutines and release the source socket"""
+        log.debug('Shutting down BFD session with %s.', self.remote)
+        if self._damping_timer is not None:
+            self._damping_timer.cancel()
+        if self.echo is not None:
+            self.echo.unschedule(self)
+        self._tx_packets.cancel()
+        self._detect_async_failure.cancel()
+        self.client.close()
+
+    @property
+    def state(self):
+        """bfd.SessionState"""
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        if value == self._state:
+            return
+        # Taking a session down administratively is not a flap
+        flapped = self._state == STATE_UP and value != STATE_ADMIN_DOWN and \
+            self.damping is not None
+        self._state = value
+        if flapped:
+            if self.damping.flap():
+                log.warning('Suppressing flapping BFD session with %s for %d '
+                            'seconds.', self.remote, self.damping.reuse_in())
+                self._apply_intervals()
+            if self.damping.suppressed:
+                self._schedule_reuse()
+        self._update_echo()
+        self._update_demand()
+        self._report_state()
+
+    def _schedule_reuse(self):
+        """(Re)schedule the end of suppression as the penalty changed"""
+        if self._damping_timer is not None:
+            self._damping_timer.cancel()
+        self._damping_timer = self.loop.call_later(self.damping.reuse_in(),
+                                                   self._damping_reuse)
+
+    def _damping_reuse(self):
+        """End suppression once the penalty decayed enough"""
+        self._damping_timer = None
+        if not self.damping.update():
+            self._schedule_reuse()
+            return
+        log.warning('BFD session with %s is no longer suppressed.',
+                    self.remote)
+        self._apply_intervals()
+        self._report_state()
+
+    def _report_state(self):
+        """Tell the listeners about a state change, holding back Up while the
+           session is suppressed"""
+        state = self._state
+        if state == STATE_UP and self.damping is not None and \
+                self.damping.suppressed:
+            state = STATE_DOWN
+        if state == self.reported_state:
+            return
+        self.reported_state = state
+        for listener in self.listeners:
+            listener(self, state)
+
+    @property
+    def demand_mode(self):
+        """bfd.DemandMode"""
+        return self._demand_mode
+
+    @demand_mode.setter
+    def demand_mode(self, value):
+        if value == self._demand_mode:
+            return
+        self._demand_mode = value
+        # A remote in Demand mode doesn't get periodic packets from us, a
+        # Poll Sequence tells it about the changed Demand (D) bit
+        if self.state == STATE_UP:
+            self.poll_sequence = True
+        self._update_demand()
+
+    @property
+    def demand_active(self):
+        """Whether the remote stopped sending periodic Control packets as we
+           asked it to with the Demand (D) bit"""
+        return bool(self._demand_mode and self._state == STATE_UP and
+                    self.remote_state == STATE_UP)
+
+    @property
+    def remote_demand_active(self):
+        """Whether we stopped sending periodic Control packets as the remote
+           asked us to with the Demand (D) bit"""
+        return bool(self.remote_demand_mode and self._state == STATE_UP and
+                    self.remote_state == STATE_UP)
+
+    @property
+    def demand_detect_time(self):
+        """Detection Time while in Demand mode"""
+        # In Demand mode, the Detection Time calculated in the local system
+        # is equal to bfd.DetectMult, multiplied by the agreed transmit
+        # interval of the local system (the greater of
+        # bfd.DesiredMinTxInterval and bfd.RemoteMinRxInterval).
+        return self.detect_mult * self._async_tx_interval
+
+    @property
+    def poll_sequence(self):
+        """Whether a Poll Sequence is being transmitted"""
+        return self._poll_sequence
+
+    @poll_sequence.setter
+    def poll_sequence(self, value):
+        if value != self._poll_sequence:
+            self._poll_start_time = None
+        self._poll_sequence = value
+        self._update_demand()
+
+    def _update_demand(self):
+        """Wake up transmission and failure detection as soon as they are
+           needed again after idling in Demand mode"""
+        tx_idle = self.remote_demand_active and not self._poll_sequence
+        detect_idle = self.demand_active and not self._poll_sequence and \
+            not self._echo_active
+        if self._tx_idle and not tx_idle and self._tx_packets is not None:
+            # When Demand mode ends on the remote, or a Poll Sequence needs to
+            # be sent, transmission MUST resume right away
+            self._restart_tx_packets()
+        if self._detect_idle and not detect_idle:
+            if not self.demand_active:
+                # The remote resumes periodic packets once it gets one with
+                # the Demand (D) bit clear, give it the Detection Time
+                self.last_rx_packet_time = time.monotonic()
+            if self._detect_async_failure is not None:
+                self._restart_detect_async_failure()
+        self._tx_idle = tx_idle
+        self._detect_idle = detect_idle
+
+    @property
+    def echo_active(self):
+        """Whether Echo packets are being sent to the remote"""
+        return self._echo_active
+
+    @property
+    def echo_interval(self):
+        """Interval between Echo packets sent to the remote"""
+        # Echo packets MUST NOT be transmitted faster than the remote's
+        # Required Min Echo RX Interval allows
+        return max(self.echo_tx_interval, self.remote_min_echo_rx_interval)
+
+    @property
+    def required_min_echo_rx_interval(self):
+        """Required Min Echo RX Interval advertised to the remote, zero when
+           Echo packets can't be looped back"""
+        if self.echo is None or not self.echo.running or \
+                not self.echo_aiobfd:
+            return 0
+        return self.echo_rx_interval
+
+    def _update_echo(self):
+        """Start or stop the Echo function as the session state, the remote
+           or the user selected intervals change"""
+        # The Echo function is only used while the session is Up, and only
+        # if the remote advertised a nonzero Required Min Echo RX Interval.
+        # The remote loops back Echo packets once its session is Up too.
+        active = bool(self.echo is not None and self.echo.running and
+                      self.echo_aiobfd and self.echo_tx_interval and
+                      self.remote_min_echo_rx_interval and
+                      self._state == STATE_UP and
+                      self.remote_state == STATE_UP)
+        if active == self._echo_active:
+            return
+        self._echo_active = active
+        if active:
+            log.info('Echo function active with %s, sending every %d us.',
+                     self.remote, self.echo_interval)
+            self.last_echo_rx_time = time.monotonic()
+            self.echo.schedule(self)
+            self._detect_sooner()
+        else:
+            log.info('Echo function no longer active with %s.', self.remote)
+            self.echo.unschedule(self)
+        self._apply_intervals()
+
+    def echo_received(self, tx_time, rx_time):
+        """One of our Echo packets was looped back by the remote"""
+        if not self._echo_active:
+            return
+        self.last_echo_rx_time = rx_time
+        rtt = rx_time - tx_time
+        self.echo_rtt['last'] = rtt
+        if self.echo_rtt['avg'] is None:
+            self.echo_rtt.update({'avg': rtt, 'min': rtt, 'max': rtt})
+            return
+        self.echo_rtt['avg'] += (rtt - self.echo_rtt['avg']) / 8
+        self.echo_rtt['min'] = min(self.echo_rtt['min'], rtt)
+        self.echo_rtt['max'] = max(self.echo_rtt['max'], rtt)
 
     # The transmit interval MUST be recalculated whenever
     # bfd.DesiredMinTxInterval changes, or whenever bfd.RemoteMinRxInterval
@@ -163,6 +740,7 @@ class Session:
                      self._async_detect_time, self._final_async_detect_time)
         else:
             self._async_detect_time = detect_time
+            self._detect_sooner()
         self._required_min_rx_interval = value
         self.poll_sequence = True
 
@@ -204,6 +782,7 @@ class Session:
             self.calc_detect_time(self.remote_detect_mult,
                                   self.required_min_rx_interval, value)
         self._remote_min_tx_interval = value
+        self._detect_sooner()
 
     @property
     def remote_detect_mult(self):
@@ -219,6 +798,7 @@ class Session:
             self.calc_detect_time(value, self.required_min_rx_interval,
                                   self.remote_min_tx_interval)
         self._remote_detect_mult = value
+        self._detect_sooner()
 
     @staticmethod
     def calc_detect_time(detect_mult, rx_interval, tx_interval):
@@ -251,6 +831,11 @@ class Session:
         # bits set. We'll give the F bit priority, the P bit will still be set
         # in the next outgoing packet if needed.
         poll = self.poll_sequence if not final else False
+        # In Demand mode the Detection Time of a Poll Sequence runs from its
+        # first packet
+        if poll and self._poll_start_time is None:
+            self._poll_start_time = time.monotonic()
+        length = self.auth.length if self.auth is not None else 24
 
         data = {
             'version': VERSION,
@@ -259,36 +844,82 @@ class Session:
             'poll': poll,
             'final': final,
             'control_plane_independent': CONTROL_PLANE_INDEPENDENT,
-            'authentication_present': bool(self.auth_type),
+            'authentication_present': self.auth is not None,
             'demand_mode': demand,
             'multipoint': MULTIPOINT,
             'detect_mult': self.detect_mult,
-            'length': 24,
+            'length': length,
             'my_discr': self.local_discr,
             'your_discr': self.remote_discr,
             'desired_min_tx_interval': self.desired_min_tx_interval,
             'required_min_rx_interval': self.required_min_rx_interval,
-            'required_min_echo_rx_interval': REQUIRED_MIN_ECHO_RX_INTERVAL
+            'required_min_echo_rx_interval':
+                self.required_min_echo_rx_interval
         }
 
         log.debug(PACKET_DEBUG_MSG, VERSION, self.local_diag, self.state,
-                  poll, final, CONTROL_PLANE_INDEPENDENT, bool(self.auth_type),
-                  demand, MULTIPOINT, self.detect_mult, 24, self.local_discr,
+                  poll, final, CONTROL_PLANE_INDEPENDENT,
+                  self.auth is not None, demand, MULTIPOINT, self.detect_mult,
+                  length, self.local_discr,
                   self.remote_discr, self.desired_min_tx_interval,
-                  self.required_min_rx_interval, REQUIRED_MIN_ECHO_RX_INTERVAL)
+                  self.required_min_rx_interval,
+                  self.required_min_echo_rx_interval)
+
+        header = bitstring.pack(PACKET_FORMAT, **data).bytes
+        if self.auth is None:
+            return header
+        return self._sign(header)
 
-        return bitstring.pack(PACKET_FORMAT, **data).bytes
+    def _sign(self, header):
+        """Append the Authentication Section to the mandatory section of a
+           packet. The packet is encoded into a buffer that is reused for the
+           next packet."""
+        if self._tx_buffer is None:
+            self._tx_buffer = bytearray(self.auth.length)
+        # The meticulous types MUST increment bfd.XmitAuthSeq for every
+        # packet, the others only need to once the packet contents change
+        if self.auth.meticulous or header != self._tx_signed:
+            self.xmit_auth_seq = (self.xmit_auth_seq + 1) % 4294967296
+            self._tx_signed = header
+        self._tx_buffer[:AUTH_OFFSET] = header
+        self.auth.sign(self._tx_buffer, self.xmit_auth_seq)
+        return self._tx_buffer
 
     def tx_packet(self, final=False):
         """Transmit a single BFD packet to the remote peer"""
         log.debug('Transmitting BFD packet to %s:%s',
-                  self.remote, CONTROL_PORT)
-        self.client.sendto(
-            self.encode_packet(final), (self.remote, CONTROL_PORT))
+                  self.remote, self.port)
+        if self._sock_connected:
+            self.client.sendto(self.encode_packet(final))
+        else:
+            self.client.sendto(self.encode_packet(final), self.remote_addr)
+        if self.pacer is not None:
+            self.pacer.sent()
+
+    def _tx_jitter(self):
+        """Interval until the next packet in seconds, jittered, and the
+           longest it may be"""
+        # The periodic transmission of BFD Control packets MUST be
+        # jittered on a per-packet basis by up to 25%
+        # If bfd.DetectMult is equal to 1, the interval between
+        # transmitted BFD Control packets MUST be no more than 90% of
+        # the negotiated transmission interval, and MUST be no less
+        # than 75% of the negotiated transmission interval.
+        if self.detect_mult == 1:
+            interval = self._async_tx_interval * random.uniform(0.75, 0.90)
+            latest = self._async_tx_interval * 0.90
+        else:
+            interval = self._async_tx_interval * (1 - random.uniform(0, 0.25))
+            latest = self._async_tx_interval
+        return interval/1000000, latest/1000000
 
     async def async_tx_packets(self):
         """Asynchronously transmit control packet"""
         try:
+            if self.pacer is not None and self.pacer.stagger:
+                # Sessions (re)started together, for example by the same
+                # remote or link event, don't all send at once
+                await self._sleep(self.pacer.first(self._tx_jitter()[0]))
             while True:
                 # A system MUST NOT transmit BFD Control packets if
                 # bfd.RemoteDiscr is zero and the system is taking the Passive
@@ -299,30 +930,31 @@ class Session:
                 # (bfd.RemoteDemandMode) is 1, bfd.SessionState is Up, and
                 # bfd.RemoteSessionState is Up) and a Poll Sequence is not
                 # being transmitted.
+                idle = not self.poll_sequence and self.remote_demand_active
                 if not((self.remote_discr == 0 and self.passive) or
-                       (self.remote_min_rx_interval == 0) or
-                       (not self.poll_sequence and
-                        (self.remote_demand_mode == 1 and
-                         self.state == STATE_UP and
-                         self.remote_state == STATE_UP))):
+                       (self.remote_min_rx_interval == 0) or idle):
                     self.tx_packet()
 
-                # The periodic transmission of BFD Control packets MUST be
-                # jittered on a per-packet basis by up to 25%
-                # If bfd.DetectMult is equal to 1, the interval between
-                # transmitted BFD Control packets MUST be no more than 90% of
-                # the negotiated transmission interval, and MUST be no less
-                # than 75% of the negotiated transmission interval.
-                if self.detect_mult == 1:
-                    interval = \
-                        self._async_tx_interval * random.uniform(0.75, 0.90)
-                else:
-                    interval = \
-                        self._async_tx_interval * (1 - random.uniform(0, 0.25))
-                await asyncio.sleep(interval/1000000)
+                # Nothing to send until Demand mode ends or a Poll Sequence
+                # starts, either restarts this coroutine
+                if idle:
+                    await self._sleep(DEMAND_CHECK_INTERVAL)
+                    continue
+
+                interval, latest = self._tx_jitter()
+                if self.pacer is not None:
+                    # Moved to a slot below the ceiling within the bounds
+                    interval = self.pacer.delay(interval, latest)
+                await self._sleep(interval)
         except asyncio.CancelledError:  # pragma: no cover
             log.info('tx_packets() was cancelled ...')
 
+    def _sleep(self, delay):
+        """Sleep on the shared timers, if any"""
+        if self.timer is not None:
+            return self.timer.sleep(delay)
+        return asyncio.sleep(delay)
+
     def _restart_tx_packets(self):
         """Allow other co-routines to request a restart of tx_packets()
            when needed, i.e. due to a timer change"""
@@ -330,7 +962,38 @@ class Session:
         log.info('Attempting to cancel tx_packets() ...')
         self._tx_packets.cancel()
         log.info('Restarting tx_packets()  ...')
-        self._tx_packets = asyncio.ensure_future(self.async_tx_packets())
+        self._tx_packets = self.loop.create_task(self.async_tx_packets())
+
+    def _restart_detect_async_failure(self):
+        """Resume detecting failures right away after idling in Demand
+           mode"""
+        if self._detect_suspended:
+            return
+        self._detect_deadline = None
+        self._detect_async_failure.cancel()
+        self._detect_async_failure = \
+            self.loop.create_task(self.detect_async_failure())
+
+    def suspend_detection(self):
+        """Stop detecting failures while another process receives the
+           packets of the remote, the session keeps transmitting"""
+        self._detect_suspended = True
+        if self._detect_async_failure is not None:
+            self._detect_async_failure.cancel()
+
+    def resume_detection(self):
+        """Detect failures again once the packets of the remote are back,
+           giving the remote a full Detection Time from now"""
+        if not self._detect_suspended:
+            return
+        self._detect_suspended = False
+        now = time.monotonic()
+        if self.last_rx_packet_time is not None:
+            self.last_rx_packet_time = max(self.last_rx_packet_time, now)
+        if self.last_echo_rx_time is not None:
+            self.last_echo_rx_time = max(self.last_echo_rx_time, now)
+        if self._detect_async_failure is not None:
+            self._restart_detect_async_failure()
 
     def rx_packet(self, packet):  # pylint: disable=I0011,R0912,R0915
         """Receive packet"""
@@ -350,8 +1013,17 @@ class Session:
         # If the A bit is set authenticate the packet under the rules of
         # section 6.7.
         if packet.authentication_present:
-            log.critical('Authenticated packet received, not supported!')
-            return
+            # bfd.AuthSeqKnown MUST be set to zero after no packets have been
+            # received on this session for at least twice the Detection Time.
+            if self.auth_seq_known and self._async_detect_time and \
+                    self.last_rx_packet_time is not None and \
+                    (packet.rx_time - self.last_rx_packet_time) > \
+                    2 * self._async_detect_time / 1000000:
+                self.auth_seq_known = False
+            self.rcv_auth_seq = self.auth.verify(
+                packet.data, packet.detect_mult, self.rcv_auth_seq,
+                self.auth_seq_known)
+            self.auth_seq_known = True
 
         # Set bfd.RemoteDiscr to the value of My Discriminator.
         self.remote_discr = packet.my_discr
@@ -368,6 +1040,10 @@ class Session:
         # Non-RFC defined session state that we track anyway
         self.remote_detect_mult = packet.detect_mult
         self.remote_min_tx_interval = packet.desired_min_tx_interval
+        self.remote_min_echo_rx_interval = \
+            packet.required_min_echo_rx_interval
+        if self._echo_active:
+            self._detect_sooner()
 
         # Implementation of the FSM in section 6.8.6
         if self.state == STATE_ADMIN_DOWN:
@@ -389,13 +1065,13 @@ class Session:
                               self.remote)
                 elif packet.state == STATE_INIT:
                     self.state = STATE_UP
-                    self.desired_min_tx_interval = self.tx_interval
+                    self._apply_intervals()
                     log.error('BFD session with %s going to UP state.',
                               self.remote)
             elif self.state == STATE_INIT:
                 if packet.state in (STATE_INIT, STATE_UP):
                     self.state = STATE_UP
-                    self.desired_min_tx_interval = self.tx_interval
+                    self._apply_intervals()
                     log.error('BFD session with %s going to UP state.',
                               self.remote)
             else:
@@ -418,36 +1094,118 @@ class Session:
         if packet.final:
             log.info('Received packet with Final (F) bit set from %s, '
                      'ending Poll Sequence.', self.remote)
-            self.poll_sequence = False
-            if self._final_async_tx_interval:
-                log.info('Increasing Tx Interval from %d to %d now that Poll '
-                         'Sequence has ended.', self._async_tx_interval,
-                         self._final_async_tx_interval)
-                self._async_tx_interval = self._final_async_tx_interval
-                self._final_async_tx_interval = None
-            if self._final_async_detect_time:
-                log.info('Increasing Detect Time from %d to %d now that Poll '
-                         'Sequence has ended.', self._async_detect_time,
-                         self._final_async_detect_time)
-                self._async_detect_time = self._final_async_detect_time
-                self._final_async_detect_time = None
-
-        # Set the time a packet was received to right now
-        self.last_rx_packet_time = time.time()
+            self._end_poll_sequence()
+
+        # The remote may have started or stopped looping back Echo packets,
+        # or entered or left Demand mode
+        self._update_echo()
+        self._update_demand()
+
+        # Liveness is based on when the packet arrived, not on when it got
+        # through the receive queue
+        self.last_rx_packet_time = packet.rx_time
         log.debug('Valid packet received from %s, updating last packet time.',
                   self.remote)
 
+        # The same packet again changes nothing while both ends are Up, but
+        # packets of a Poll Sequence and authenticated packets are processed
+        # in full every time
+        if self._state == STATE_UP and packet.state == STATE_UP and \
+                not (packet.poll or packet.final or
+                     packet.authentication_present):
+            self._rx_header = packet.data
+        else:
+            self._rx_header = None
+
+    def rx_unchanged(self, data, rx_time=None):
+        """Fast path for a packet identical to the last one processed while
+           Up, which only refreshes the liveness of the session. Returns
+           whether the packet was taken, if not it is to be decoded and
+           passed to `rx_packet()`."""
+        if data != self._rx_header or self._state != STATE_UP or \
+                self.auth_type:
+            return False
+        self.last_rx_packet_time = time.monotonic() if rx_time is None \
+            else rx_time
+        return True
+
+    def _end_poll_sequence(self):
+        """Terminate the Poll Sequence once the Final (F) bit is received,
+           applying the timer changes it held back"""
+        self.poll_sequence = False
+        if self._poll_waiter is not None and not self._poll_waiter.done():
+            self._poll_waiter.set_result(None)
+        if self._final_async_tx_interval:
+            log.info('Increasing Tx Interval from %d to %d now that Poll '
+                     'Sequence has ended.', self._async_tx_interval,
+                     self._final_async_tx_interval)
+            self._async_tx_interval = self._final_async_tx_interval
+            self._final_async_tx_interval = None
+        if self._final_async_detect_time:
+            log.info('Increasing Detect Time from %d to %d now that Poll '
+                     'Sequence has ended.', self._async_detect_time,
+                     self._final_async_detect_time)
+            self._async_detect_time = self._final_async_detect_time
+            self._final_async_detect_time = None
+
+    def _detect_expiry(self):
+        """When the Detection Time, or that of the Echo function, expires
+           next on timers that are precise enough, None to check every
+           millisecond instead"""
+        if self.timer is None or self._async_detect_time is None or \
+                self.state not in (STATE_INIT, STATE_UP):
+            return None
+        expiry = self.last_rx_packet_time + self._async_detect_time/1000000
+        if self._echo_active:
+            expiry = min(expiry, self.last_echo_rx_time +
+                         self.detect_mult * self.echo_interval / 1000000)
+        return expiry
+
+    def _detect_delay(self):
+        """Seconds until failures are checked again, every millisecond or
+           right when the Detection Time expires. Packets received meanwhile
+           only postpone the expiry, the check on wakeup sleeps again."""
+        self._detect_deadline = self._detect_expiry()
+        if self._detect_deadline is None:
+            return 1/1000
+        return max(self._detect_deadline - time.monotonic(), 0)
+
+    def _detect_sooner(self):
+        """Check for failures right away if the Detection Time shrank while
+           sleeping until it expires"""
+        if self._detect_deadline is None or \
+                self._detect_async_failure is None:
+            return
+        expiry = self._detect_expiry()
+        if expiry is not None and expiry < self._detect_deadline:
+            self._restart_detect_async_failure()
+
     async def detect_async_failure(self):
         """Detect if a session has failed in asynchronous mode"""
         while True:
-            if not (self.demand_mode or self._async_detect_time is None):
+            if self.demand_active:
+                # If Demand mode is active and a Poll Sequence is being
+                # transmitted, and a period of time equal to the Detection
+                # Time passes without receiving a BFD Control packet from the
+                # remote system with the Final (F) bit set, the session has
+                # gone down.
+                if self.poll_sequence and \
+                    self._poll_start_time is not None and \
+                    ((time.monotonic() - self._poll_start_time) >
+                     (self.demand_detect_time/1000000)):
+                    self.state = STATE_DOWN
+                    self.local_diag = DIAG_CONTROL_DETECTION_EXPIRED
+                    self.desired_min_tx_interval = DESIRED_MIN_TX_INTERVAL
+                    log.critical('BFD remote %s didn\'t answer the Poll '
+                                 'Sequence, going DOWN!', self.remote)
+            elif self._async_detect_time is not None:
                 # If Demand mode is not active, and a period of time equal to
                 # the Detection Time passes without receiving a BFD Control
                 # packet from the remote system, and bfd.SessionState is Init
                 # or Up, the session has gone down -- the local system MUST set
                 # bfd.SessionState to Down and bfd.LocalDiag to 1.
                 if self.state in (STATE_INIT, STATE_UP) and \
-                    ((time.time() - self.last_rx_packet_time) >
+                    ((time.monotonic() - self.last_rx_packet_time) >
                      (self._async_detect_time/1000000)):
                     self.state = STATE_DOWN
                     self.local_diag = DIAG_CONTROL_DETECTION_EXPIRED
@@ -456,6 +1214,28 @@ class Session:
                                  self.remote)
                     log.info('Time since last packet: %d ms; '
                              'Detect Time: %d ms',
-                             (time.time() - self.last_rx_packet_time) * 1000,
+                             (time.monotonic() -
+                              self.last_rx_packet_time) * 1000,
                              self._async_detect_time/1000)
-            await asyncio.sleep(1/1000)
+            if self._echo_active and \
+                    (time.monotonic() - self.last_echo_rx_time) > \
+                    (self.detect_mult * self.echo_interval / 1000000):
+                self.state = STATE_DOWN
+                self.local_diag = DIAG_ECHO_FAILED
+                self.desired_min_tx_interval = DESIRED_MIN_TX_INTERVAL
+                log.critical('Echo packets not looped back by BFD remote %s, '
+                             'going DOWN!', self.remote)
+            if self.demand_active and not self._echo_active:
+                # Nothing to detect until a Poll Sequence starts or Demand
+                # mode ends, either restarts this coroutine. A Poll Sequence
+                # in progress only needs checking once it runs out of time.
+                if self.poll_sequence and self._poll_start_time is None:
+                    await self._sleep(1/1000)
+                elif self.poll_sequence:
+                    await self._sleep(max(
+                        self._poll_start_time - time.monotonic() +
+                        self.demand_detect_time/1000000, 0) + 1/1000)
+                else:
+                    await self._sleep(DEMAND_CHECK_INTERVAL)
+            else:
+                await self._sleep(self._detect_delay())
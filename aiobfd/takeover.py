@@ -0,0 +1,183 @@
+"""aiobfd: Handing sockets and sessions over to a new process"""
+
+import array
+import json
+import os
+import socket
+import struct
+import time
+import logging
+from .session import session_key
+log = logging.getLogger(__name__)  # pylint: disable=I0011,C0103
+
+TAKEOVER_TIMEOUT = 5                # Seconds to wait for the other process
+MAX_FDS = 200                       # Descriptors per message, 253 at most
+MAX_MESSAGE = 1 << 20               # Bytes per message
+
+
+def send_message(conn, data, fds=()):
+    """Send a message with file descriptors attached"""
+    ancillary = []
+    if fds:
+        ancillary = [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                      array.array('i', fds).tobytes())]
+    conn.sendmsg([json.dumps(data).encode()], ancillary)
+
+
+def recv_message(conn):
+    """Receive a message and the file descriptors attached to it as sockets"""
+    fds = array.array('i')
+    msg, ancdata, flags, _ = conn.recvmsg(
+        MAX_MESSAGE, socket.CMSG_SPACE(MAX_FDS * fds.itemsize))
+    for level, kind, cdata in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cdata[:len(cdata) - len(cdata) % fds.itemsize])
+    socks = [socket.socket(fileno=fd) for fd in fds]
+    if not msg:
+        raise ConnectionResetError('Connection closed by the other process.')
+    if flags & (socket.MSG_TRUNC | socket.MSG_CTRUNC):
+        for sock in socks:
+            sock.close()
+        raise IOError('Takeover message truncated.')
+    return json.loads(msg.decode()), socks
+
+
+def check_peer(conn):
+    """Refuse processes of other users, whoever takes over gets every socket
+       and session"""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        raise PermissionError('Unable to check the user of the other '
+                              'process, SO_PEERCRED requires Linux.')
+    _, uid, _ = struct.unpack('3i', conn.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))
+    if uid != os.geteuid():
+        raise PermissionError('Refusing a takeover by user %d.' % uid)
+
+
+def listen_takeover(path):
+    """Listen for a process that wants to take over, only our own user may
+       connect"""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    umask = os.umask(0o177)
+    try:
+        sock.bind(path)
+    except OSError:
+        sock.close()
+        raise
+    finally:
+        os.umask(umask)
+    sock.listen(1)
+    sock.setblocking(False)
+    return sock
+
+
+def handover_messages(server, sessions, now=None, echo=None, multihop=None,
+                      reflector=None, listeners=None):
+    """Messages with the control, Echo, multihop and S-BFD reflector
+       sockets, the sockets of further listeners by device, local address
+       and whether multihop, and the state and source socket of every
+       session for the process taking over"""
+    fds = [server.fileno()]
+    for sock in (echo, multihop, reflector):
+        if sock is not None:
+            fds.append(sock.fileno())
+    listeners = listeners or {}
+    fds.extend(sock.fileno() for sock in listeners.values())
+    messages = [({'time': time.time() if now is None else now,
+                  'echo': echo is not None,
+                  'multihop': multihop is not None,
+                  'reflector': reflector is not None,
+                  'listeners': list(listeners)}, fds)]
+    for i in range(0, len(sessions), MAX_FDS):
+        chunk = sessions[i:i + MAX_FDS]
+        messages.append(({'sessions': [s.snapshot() for s in chunk]},
+                         [s.client.get_extra_info('socket').fileno()
+                          for s in chunk]))
+    messages.append(({'done': True}, []))
+    return messages
+
+
+def hand_over(conn, messages):
+    """Send the messages of `handover_messages()` to the process taking
+       over, blocks until they are sent"""
+    conn.settimeout(TAKEOVER_TIMEOUT)
+    for data, fds in messages:
+        send_message(conn, data, fds)
+
+
+class Handover:
+    """Sockets and session state received from the process taken over"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.time = None
+        self.server = None
+        self.echo = None
+        self.multihop = None
+        self.reflector = None
+        self.listeners = dict()  # By device, local address and multihop
+        self.states = dict()    # By local and remote
+        self.sockets = dict()   # By local and remote
+
+    def close(self):
+        """Close the sockets that were not taken over"""
+        for sock in [self.server, self.echo, self.multihop,
+                     self.reflector] + list(self.listeners.values()) + \
+                list(self.sockets.values()):
+            if sock is not None:
+                sock.close()
+        self.server = None
+        self.echo = None
+        self.multihop = None
+        self.reflector = None
+        self.listeners = dict()
+        self.sockets = dict()
+
+    def finish(self):
+        """Tell the process taken over to exit"""
+        try:
+            send_message(self.conn, {'started': True})
+        finally:
+            self.conn.close()
+            self.close()
+
+
+def connect_takeover(path):
+    """Connect to the running process and receive its sockets and sessions,
+       blocks until the handover is complete"""
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    conn.settimeout(TAKEOVER_TIMEOUT)
+    handover = Handover(conn)
+    try:
+        conn.connect(path)
+        check_peer(conn)
+        send_message(conn, {'takeover': True})
+        data, socks = recv_message(conn)
+        handover.time = data['time']
+        handover.server = socks.pop(0)
+        if data.get('echo'):
+            handover.echo = socks.pop(0)
+        if data.get('multihop'):
+            handover.multihop = socks.pop(0)
+        if data.get('reflector'):
+            handover.reflector = socks.pop(0)
+        for key in data.get('listeners', ()):
+            handover.listeners[tuple(key)] = socks.pop(0)
+        while True:
+            data, socks = recv_message(conn)
+            if data.get('done'):
+                break
+            for state, sock in zip(data['sessions'], socks):
+                key = session_key(state['local'], state['remote'],
+                                  state.get('device'))
+                handover.states[key] = state
+                handover.sockets[key] = sock
+    except Exception:
+        conn.close()
+        handover.close()
+        raise
+    return handover
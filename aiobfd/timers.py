@@ -0,0 +1,138 @@
+"""aiobfd: Timers on a Linux timerfd, for wakeups that don't depend on the
+   resolution of the selector timeout"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import heapq
+import itertools
+import logging
+import os
+import time
+log = logging.getLogger(__name__)  # pylint: disable=I0011,C0103
+
+# Backends that wake up the sleeping sessions
+TIMERS = ('asyncio', 'timerfd')
+
+# Linux timerfd constants, see sys/timerfd.h
+CLOCK_MONOTONIC = 1                 # The clock of time.monotonic()
+TFD_NONBLOCK = os.O_NONBLOCK
+TFD_CLOEXEC = os.O_CLOEXEC
+TFD_TIMER_ABSTIME = 1
+
+_LIBC = []  # Loaded on first use
+
+
+class Timespec(ctypes.Structure):  # pylint: disable=I0011,R0903
+    """struct timespec"""
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+class Itimerspec(ctypes.Structure):  # pylint: disable=I0011,R0903
+    """struct itimerspec"""
+    _fields_ = [('it_interval', Timespec), ('it_value', Timespec)]
+
+
+def _libc():
+    """The C library, for the timerfd calls older Pythons don't expose"""
+    if not _LIBC:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'timerfd_create'):
+            raise OSError('timerfd is not available on this platform')
+        _LIBC.append(libc)
+    return _LIBC[0]
+
+
+def timerfd_create():
+    """Open a non-blocking timerfd on the monotonic clock"""
+    if hasattr(os, 'timerfd_create'):  # Python 3.13
+        return os.timerfd_create(CLOCK_MONOTONIC,
+                                 flags=TFD_NONBLOCK | TFD_CLOEXEC)
+    fd = _libc().timerfd_create(CLOCK_MONOTONIC, TFD_NONBLOCK | TFD_CLOEXEC)
+    if fd < 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+    return fd
+
+
+def timerfd_settime(fd, deadline):
+    """Arm a timerfd to expire once at `deadline` on the monotonic clock, in
+       seconds"""
+    if hasattr(os, 'timerfd_settime_ns'):  # Python 3.13
+        os.timerfd_settime_ns(fd, flags=TFD_TIMER_ABSTIME,
+                              initial=int(deadline * 1000000000))
+        return
+    seconds = int(deadline)
+    value = Itimerspec(Timespec(0, 0),
+                       Timespec(seconds, int((deadline - seconds) * 1e9)))
+    if _libc().timerfd_settime(fd, TFD_TIMER_ABSTIME, ctypes.byref(value),
+                               None) < 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+
+
+class TimerFd:
+    """Wakes up the sleeping tasks of all sessions from a single timerfd,
+       registered with the loop and armed for the earliest deadline. The
+       kernel expires it with nanosecond resolution, while the loop rounds
+       the timeout of its selector up to whole milliseconds."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._fd = None
+        self._timers = []  # Heap of (deadline, sequence, future)
+        self._sequence = itertools.count()
+        self._armed = None
+
+    def start(self):
+        """Open the timerfd and have the loop watch it, raises OSError if
+           timerfd is not available"""
+        self._fd = timerfd_create()
+        self.loop.add_reader(self._fd, self._expired)
+        log.info('Using timerfd timers.')
+
+    def sleep(self, delay):
+        """Awaitable that completes after `delay` seconds"""
+        if delay <= 0 or self._fd is None:
+            return asyncio.sleep(delay)
+        future = self.loop.create_future()
+        deadline = time.monotonic() + delay
+        heapq.heappush(self._timers, (deadline, next(self._sequence), future))
+        if self._armed is None or deadline < self._armed:
+            self._arm(deadline)
+        return future
+
+    def _arm(self, deadline):
+        """Have the timerfd expire at `deadline`"""
+        timerfd_settime(self._fd, deadline)
+        self._armed = deadline
+
+    def _expired(self):
+        """Wake up the tasks whose deadline passed and re-arm for the next"""
+        try:
+            os.read(self._fd, 8)
+        except BlockingIOError:
+            pass
+        self._armed = None
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, future = heapq.heappop(self._timers)
+            if not future.done():  # Skips sleepers that were cancelled
+                future.set_result(None)
+        # Drop the cancelled sleepers up front, as restarts leave them behind
+        while self._timers and self._timers[0][2].done():
+            heapq.heappop(self._timers)
+        if self._timers:
+            self._arm(self._timers[0][0])
+
+    def close(self):
+        """Stop watching and close the timerfd, sleepers are cancelled"""
+        if self._fd is None:
+            return
+        self.loop.remove_reader(self._fd)
+        os.close(self._fd)
+        self._fd = None
+        self._armed = None
+        for _, _, future in self._timers:
+            future.cancel()
+        self._timers = []
@@ -1,46 +1,350 @@
 """aiobfd: BFD IPv4/IPv6 transport"""
 
-import asyncio
+import ctypes
+import errno
 import logging
+import os
+import socket
+import struct
+import sys
+import time
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # pylint: disable=I0011,C0103
 log = logging.getLogger(__name__)  # pylint: disable=I0011,C0103
 
+# Linux socket options not (always) exposed by the socket module
+SO_ATTACH_FILTER = getattr(socket, 'SO_ATTACH_FILTER', 26)
+IP_MINTTL = getattr(socket, 'IP_MINTTL', 21)
+IPV6_MINHOPCOUNT = getattr(socket, 'IPV6_MINHOPCOUNT', 73)
+SIOCGSTAMPNS = 0x8907               # Receive timestamp of the last datagram
+SO_PRIORITY = getattr(socket, 'SO_PRIORITY', 12)
+SO_SNDBUFFORCE = getattr(socket, 'SO_SNDBUFFORCE', 32)
+SO_RCVBUFFORCE = getattr(socket, 'SO_RCVBUFFORCE', 33)
+SO_BUSY_POLL = getattr(socket, 'SO_BUSY_POLL', 46)
+SO_BINDTODEVICE = getattr(socket, 'SO_BINDTODEVICE', 25)
+
+# Options applied to every socket aiobfd opens
+SOCKET_PROFILE = {
+    'tos': 0xc0,                    # DSCP CS6, Network Control (RFC 4594)
+    'priority': 6,                  # Highest SO_PRIORITY without privileges
+    'busy_poll': 0,                 # SO_BUSY_POLL in microseconds, disabled
+    'rcvbuf': None,                 # Bytes, None to size from the sessions
+    'sndbuf': None,                 # Bytes, None to size from the sessions
+    'buffer_time': 0.5              # Seconds of traffic the buffers absorb
+}
+SKB_TRUESIZE = 1024                 # Kernel memory charged per BFD datagram
+
+# Classic BPF opcodes, see linux/filter.h
+BPF_LD_B_ABS = 0x30
+BPF_LD_W_ABS = 0x20
+BPF_LD_W_LEN = 0x80
+BPF_RSH_K = 0x74
+BPF_JA = 0x05
+BPF_JEQ_K = 0x15
+BPF_JGE_K = 0x35
+BPF_JSET_K = 0x45
+BPF_RET_K = 0x06
+SKF_NET_OFF = -0x100000             # Loads relative to the IP header
+
+UDP_HEADER_LEN = 8
+MIN_PACKET_LEN = 24
+MAX_TTL = 255
+
+
+def _net(offset):
+    """Offset of a byte in the IP header, as an unsigned 32 bit value"""
+    return (SKF_NET_OFF + offset) & 0xffffffff
+
+
+# Offsets on a UDP socket are relative to the UDP header, the BFD Control
+# packet starts right after it. A jump to DROP is resolved into a relative
+# offset and MIN_TTL into the lowest TTL accepted by `control_filter()`.
+DROP = 'drop'
+MIN_TTL = 'min_ttl'
+CONTROL_FILTER = (
+    # RFC 5881: TTL (IPv4, offset 8) or Hop Limit (IPv6, offset 7) is 255,
+    # multihop sessions (RFC 5883) accept a configurable number of hops
+    (BPF_LD_B_ABS, 0, 0, _net(0)),
+    (BPF_JGE_K, 0, 2, 0x60),
+    (BPF_LD_B_ABS, 0, 0, _net(7)),
+    (BPF_JA, 0, 0, 1),
+    (BPF_LD_B_ABS, 0, 0, _net(8)),
+    (BPF_JGE_K, 0, DROP, MIN_TTL),
+    # Version is 1
+    (BPF_LD_B_ABS, 0, 0, UDP_HEADER_LEN),
+    (BPF_RSH_K, 0, 0, 5),
+    (BPF_JEQ_K, 0, DROP, 1),
+    # Multipoint (M) bit is clear
+    (BPF_LD_B_ABS, 0, 0, UDP_HEADER_LEN + 1),
+    (BPF_JSET_K, DROP, 0, 0x01),
+    # Length field is at least the minimum packet length
+    (BPF_LD_B_ABS, 0, 0, UDP_HEADER_LEN + 3),
+    (BPF_JGE_K, 0, DROP, MIN_PACKET_LEN),
+    # My Discriminator is nonzero
+    (BPF_LD_W_ABS, 0, 0, UDP_HEADER_LEN + 4),
+    (BPF_JEQ_K, DROP, 0, 0),
+    # The datagram holds at least a minimum length packet
+    (BPF_LD_W_LEN, 0, 0, 0),
+    (BPF_JGE_K, 0, DROP, UDP_HEADER_LEN + MIN_PACKET_LEN),
+    (BPF_RET_K, 0, 0, 0xffffffff),
+    (BPF_RET_K, 0, 0, 0)            # DROP
+)
+
+
+def control_filter(min_ttl=MAX_TTL):
+    """Assemble `CONTROL_FILTER` into a classic BPF program"""
+    drop = len(CONTROL_FILTER) - 1
+    program = b''
+    for index, (code, jump_true, jump_false, k) in enumerate(CONTROL_FILTER):
+        if jump_true == DROP:
+            jump_true = drop - index - 1
+        if jump_false == DROP:
+            jump_false = drop - index - 1
+        if k == MIN_TTL:
+            k = min_ttl
+        program += struct.pack('HBBI', code, jump_true, jump_false, k)
+    return program
+
+
+def attach_filter(sock, program):
+    """Attach a classic BPF program to a socket, the kernel copies it"""
+    buf = ctypes.create_string_buffer(program)
+    fprog = struct.pack('HL', len(program) // 8, ctypes.addressof(buf))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+
+def protect_socket(sock, min_ttl=MAX_TTL):
+    """Have the kernel drop invalid and off-link BFD Control packets before
+       they are copied to userspace, or for multihop sessions those that
+       arrive with a TTL/HL below `min_ttl`"""
+    if not sys.platform.startswith('linux'):
+        log.warning('Kernel packet filtering is only supported on Linux, make '
+                    'sure to drop packets with a TTL/HL below 255.')
+        return
+
+    # Linux only enforces the minimum TTL for TCP, the filter covers UDP
+    if sock.family == socket.AF_INET6:
+        sock.setsockopt(socket.IPPROTO_IPV6, IPV6_MINHOPCOUNT, min_ttl)
+    else:
+        sock.setsockopt(socket.IPPROTO_IP, IP_MINTTL, min_ttl)
+    attach_filter(sock, control_filter(min_ttl))
+
+
+def bind_device(sock, device):
+    """Restrict a socket to an interface or VRF device, before binding it so
+       the same address and port can be bound in every VRF"""
+    sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, device.encode())
+
+
+def set_max_ttl(sock):
+    """Send with the maximum TTL/Hop Limit, so the remote can verify the
+       packets weren't forwarded (RFC 5881 section 5)"""
+    set_ttl(sock, MAX_TTL)
+
+
+def set_ttl(sock, ttl):
+    """Send with the given TTL/Hop Limit"""
+    if sock.family == socket.AF_INET6:
+        # Under Windows the IPv6 socket constant is somehow missing
+        # https://bugs.python.org/issue29515
+        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_UNICAST_HOPS, ttl)
+    else:
+        sock.setsockopt(socket.SOL_IP, socket.IP_TTL, ttl)
+
+
+def socket_drops(sock):
+    """Number of datagrams the kernel dropped for a socket, including those
+       rejected by its filter, or None if unknown"""
+    counters = udp_socket_stats().get(socket_inode(sock))
+    return counters['drops'] if counters else None
+
+
+def socket_inode(sock):
+    """Inode identifying a socket in /proc/net, or None for a closed socket"""
+    try:
+        return os.fstat(sock.fileno()).st_ino
+    except OSError:
+        return None
+
+
+def udp_socket_stats():
+    """Kernel counters of all UDP sockets in bytes and datagrams, by inode"""
+    stats = {}
+    for table in ('/proc/net/udp', '/proc/net/udp6'):
+        try:
+            with open(table) as proc:
+                lines = proc.readlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            try:
+                tx_queue, rx_queue = fields[4].split(':')
+                stats[int(fields[9])] = {'tx_queue': int(tx_queue, 16),
+                                         'rx_queue': int(rx_queue, 16),
+                                         'drops': int(fields[-1])}
+            except (IndexError, ValueError):
+                continue
+    return stats
+
+
+def buffer_size(rate, profile):
+    """Socket buffer size needed to absorb the traffic of a number of packets
+       per second for the profile's buffer time"""
+    return int(rate * profile['buffer_time']) * SKB_TRUESIZE
+
+
+def set_buffer(sock, option, force_option, size):
+    """Grow a socket buffer, beyond the sysctl maximum when permitted"""
+    # The kernel reports back twice the requested size for bookkeeping
+    if size <= sock.getsockopt(socket.SOL_SOCKET, option) // 2:
+        return
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, force_option, size)
+    except OSError:
+        sock.setsockopt(socket.SOL_SOCKET, option, size)
+
+
+def apply_socket_profile(sock, profile, rcvbuf=None, sndbuf=None):
+    """Apply a socket profile, returns the options that could not be set.
+       Buffer sizes in the profile take precedence over the given ones."""
+    options = []
+    if sock.family == socket.AF_INET6:
+        options.append(('tos', socket.IPPROTO_IPV6, socket.IPV6_TCLASS,
+                        profile['tos']))
+    else:
+        options.append(('tos', socket.IPPROTO_IP, socket.IP_TOS,
+                        profile['tos']))
+    if sys.platform.startswith('linux'):
+        options.append(('priority', socket.SOL_SOCKET, SO_PRIORITY,
+                        profile['priority']))
+        if profile['busy_poll']:
+            options.append(('busy_poll', socket.SOL_SOCKET, SO_BUSY_POLL,
+                            profile['busy_poll']))
+
+    failed = []
+    for name, level, option, value in options:
+        try:
+            sock.setsockopt(level, option, value)
+        except OSError:
+            failed.append(name)
+    for name, option, force_option, size in (
+            ('rcvbuf', socket.SO_RCVBUF, SO_RCVBUFFORCE,
+             profile['rcvbuf'] or rcvbuf),
+            ('sndbuf', socket.SO_SNDBUF, SO_SNDBUFFORCE,
+             profile['sndbuf'] or sndbuf)):
+        if not size:
+            continue
+        try:
+            set_buffer(sock, option, force_option, size)
+        except OSError:
+            failed.append(name)
+    return failed
+
+
+def enable_timestamps(sock):
+    """Have the kernel timestamp datagrams on arrival, returns whether
+       `rx_timestamp()` can be used on the socket"""
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return False
+    try:
+        # The first request turns on timestamping for the socket
+        fcntl.ioctl(sock.fileno(), SIOCGSTAMPNS, bytes(16))
+    except OSError as exc:
+        if exc.errno != errno.ENOENT:
+            raise
+    return True
+
+
+def rx_timestamp(sock):
+    """Kernel arrival time of the datagram last read from a socket, moved
+       from the wall clock onto the monotonic clock"""
+    # asyncio reads datagrams with recvfrom(), which discards SO_TIMESTAMPNS
+    # control messages, so the timestamp is fetched with its ioctl instead
+    sec, nsec = struct.unpack(
+        'll', fcntl.ioctl(sock.fileno(), SIOCGSTAMPNS, bytes(16)))
+    now = time.monotonic()
+    return now - max(time.time() - sec - nsec / 1000000000, 0)
+
 
 class Client:
     """BFD Client for sourcing egress datagrams"""
 
-    def __init__(self):
+    def __init__(self, error_callback=None, rx_callback=None):
         self.transport = None
+        self.error_callback = error_callback
+        self.rx_callback = rx_callback
 
     def connection_made(self, transport):
         """Socket setup correctly"""
         self.transport = transport
 
-    @staticmethod
-    def datagram_received(_, addr):
+    def connection_lost(self, _):
+        """Socket closed"""
+        self.transport = None
+
+    def datagram_received(self, data, addr):
         """Received a packet"""
+        if self.rx_callback:
+            self.rx_callback(data, addr)
+            return
         log.info(('Unexpectedly received a packet on a BFD source port '
                   'from %s on port %d'), addr[0], addr[1])
 
-    @staticmethod
-    def error_received(exc):
+    def error_received(self, exc):
         """Error occurred"""
-        log.error('Socket error received: %s', exc)
+        if self.error_callback:
+            self.error_callback(exc)
+        else:
+            log.error('Socket error received: %s', exc)
 
 
 class Server:
     """BFD Server for receiving ingress datagrams """
 
-    def __init__(self, rx_queue):
+    def __init__(self, rx_queue, admit=None, ingress=None):
         self.transport = None
         self.rx_queue = rx_queue
+        self.admit = admit  # Returns None to drop, or whether to prioritize
+        # Key of the listener passed along with every packet, the device,
+        # local address and whether it receives multihop packets
+        self.ingress = ingress
+        self.sock = None
+        self.timestamps = False
 
     def connection_made(self, transport):
         """Socket setup correctly"""
         self.transport = transport
+        if transport is None:
+            return
+        self.sock = transport.get_extra_info('socket')
+        try:
+            self.timestamps = enable_timestamps(self.sock)
+        except OSError as exc:
+            log.warning('Kernel receive timestamps unavailable, using the '
+                        'processing time instead: %s', exc)
+
+    def connection_lost(self, _):
+        """Socket closed"""
+        self.transport = None
 
     def datagram_received(self, data, addr):
         """Received a packet"""
-        asyncio.ensure_future(self.rx_queue.put((data, addr[0])))
+        priority = False
+        if self.admit is not None:
+            priority = self.admit(data, addr[0], self.ingress)
+            if priority is None:
+                return
+        rx_time = time.monotonic()
+        if self.timestamps:
+            try:
+                rx_time = rx_timestamp(self.sock)
+            except OSError:
+                pass
+        self.rx_queue.put_nowait((data, addr[0], rx_time, self.ingress),
+                                 priority)
 
     @staticmethod
     def error_received(exc):
@@ -0,0 +1,108 @@
+"""Benchmark aiobfd idle sessions in asynchronous and Demand mode
+
+Runs sessions that are Up with themselves, first in asynchronous mode and
+then in Demand mode, and reports the packet rate and the CPU time spent
+while they sit idle. In Demand mode the sessions are then verified with a
+Poll Sequence each, reporting how long that takes and how many remotes
+answered.
+
+Needs permission to bind UDP port 3784 and one file descriptor per session,
+the soft limit is raised to the hard limit.
+
+    python benchmarks/demand.py --sessions 10000 --verify-rate 300
+"""
+
+import argparse
+import asyncio
+import resource
+import time
+import aiobfd
+
+MODES = ('async', 'demand')
+
+
+def up_state(session, interval, demand):
+    """State of a session that is Up with itself at the given interval"""
+    state = session.snapshot()
+    state.update({'state': aiobfd.session.STATE_UP,
+                  'remote_state': aiobfd.session.STATE_UP,
+                  'remote_discr': session.local_discr,
+                  'desired_min_tx_interval': interval,
+                  'required_min_rx_interval': interval,
+                  'remote_min_rx_interval': interval,
+                  'remote_min_tx_interval': interval,
+                  'remote_detect_mult': session.detect_mult,
+                  'remote_demand_mode': demand})
+    return state
+
+
+async def measure(loop, local, count, interval, duration, demand, rate):
+    """Run idle sessions for a while, returns the packet rate, the CPU time
+       per second, the number of sessions that went down and, in Demand
+       mode, the time to verify all remotes and how many didn't answer"""
+    control = await aiobfd.Control.create(local, [local] * count,
+                                          demand_mode=demand, loop=loop)
+    for session in control.sessions:
+        session.tx_interval = session.rx_interval = interval
+        session.resume(up_state(session, interval, demand), 0)
+    receiver = loop.create_task(control.rx_packets())
+    # Let the sessions settle, those in Demand mode stop sending
+    await asyncio.sleep(2)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    packets = control.stats()['rx_packets']
+    await asyncio.sleep(duration)
+    packets = control.stats()['rx_packets'] - packets
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (after.ru_utime - usage.ru_utime) + (after.ru_stime - usage.ru_stime)
+
+    verify, failed = None, None
+    if demand:
+        start = time.perf_counter()
+        failed = len(await control.verify(rate=rate))
+        verify = time.perf_counter() - start
+    down = sum(1 for s in control.sessions
+               if s.state != aiobfd.session.STATE_UP)
+
+    receiver.cancel()
+    control.close()
+    await asyncio.sleep(0)
+    return packets / duration, cpu / duration, down, verify, failed
+
+
+def main():
+    """Run the Demand mode benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--local', default='127.0.0.1')
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--interval', type=int, default=300,
+                        help='Tx and Rx interval (ms)')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--verify-rate', type=int,
+                        default=aiobfd.control.RETIME['rate'],
+                        help='Poll Sequences started per second')
+    parser.add_argument('--loop', default='asyncio', choices=aiobfd.LOOPS)
+    args = parser.parse_args()
+
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    print('%8s %10s %10s %6s %10s %8s' % ('mode', 'packets/s', 'cpu',
+                                          'down', 'verify', 'failed'))
+    for mode in MODES:
+        loop = aiobfd.new_event_loop(args.loop)
+        rate, cpu, down, verify, failed = loop.run_until_complete(
+            measure(loop, args.local, args.sessions, args.interval * 1000,
+                    args.duration, mode == 'demand', args.verify_rate))
+        loop.close()
+        if verify is None:
+            print('%8s %10d %9.1f%% %6d %10s %8s' % (
+                mode, rate, cpu * 100, down, '-', '-'))
+        else:
+            print('%8s %10d %9.1f%% %6d %8.2fs %8d' % (
+                mode, rate, cpu * 100, down, verify, failed))
+        time.sleep(0.1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark aiobfd on the asyncio and uvloop event loops
+
+Runs the same synthetic load on each event loop: sessions that are Up with
+themselves, so every packet is sent, received, demultiplexed and processed
+by the same process. Reports the CPU time spent per received packet and
+the accuracy of the loop's timers under that load, measured by a probe
+that asks to be woken up every 10 ms.
+
+Needs permission to bind UDP port 3784 and one file descriptor per session,
+the soft limit is raised to the hard limit.
+
+    python benchmarks/loops.py --sessions 1000 --interval 50 --duration 10
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import resource
+import statistics
+import time
+import aiobfd
+
+PROBE_INTERVAL = 0.01
+
+
+def up_state(session, interval):
+    """State of a session that is Up with itself at the given interval"""
+    state = session.snapshot()
+    state.update({'state': aiobfd.session.STATE_UP,
+                  'remote_state': aiobfd.session.STATE_UP,
+                  'remote_discr': session.local_discr,
+                  'desired_min_tx_interval': interval,
+                  'required_min_rx_interval': interval,
+                  'remote_min_rx_interval': interval,
+                  'remote_min_tx_interval': interval,
+                  'remote_detect_mult': session.detect_mult})
+    return state
+
+
+async def probe(loop, lateness):
+    """Record how late the loop wakes up a sleeping task"""
+    while True:
+        start = loop.time()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lateness.append(loop.time() - start - PROBE_INTERVAL)
+
+
+async def measure(loop, local, count, interval, duration):
+    """Run the load for a while, returns the CPU time per packet and the
+       lateness of the timers"""
+    control = await aiobfd.Control.create(local, [local] * count, loop=loop)
+    for session in control.sessions:
+        session.tx_interval = session.rx_interval = interval
+        session.resume(up_state(session, interval), 0)
+    receiver = loop.create_task(control.rx_packets())
+    await asyncio.sleep(1)
+
+    lateness = []
+    prober = loop.create_task(probe(loop, lateness))
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    packets = control.stats()['rx_packets']
+    await asyncio.sleep(duration)
+    packets = control.stats()['rx_packets'] - packets
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (after.ru_utime - usage.ru_utime) + (after.ru_stime - usage.ru_stime)
+    down = sum(1 for s in control.sessions
+               if s.state != aiobfd.session.STATE_UP)
+
+    prober.cancel()
+    receiver.cancel()
+    control.close()
+    await asyncio.sleep(0)
+    return cpu / max(packets, 1), packets / duration, lateness, down
+
+
+def main():
+    """Run the event loop benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--local', default='127.0.0.1')
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--interval', type=int, default=50,
+                        help='Tx and Rx interval (ms)')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--loops', nargs='+', default=list(aiobfd.LOOPS),
+                        choices=aiobfd.LOOPS)
+    args = parser.parse_args()
+
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    print('%8s %12s %10s %12s %12s %12s %6s' % (
+        'loop', 'cpu/packet', 'packets/s', 'late avg', 'late p99',
+        'late max', 'down'))
+    for name in args.loops:
+        if importlib.util.find_spec(name) is None:
+            print('%8s not installed' % name)
+            continue
+        loop = aiobfd.new_event_loop(name)
+        cpu, rate, lateness, down = loop.run_until_complete(
+            measure(loop, args.local, args.sessions, args.interval * 1000,
+                    args.duration))
+        loop.close()
+        lateness.sort()
+        print('%8s %10.1fus %10d %10.2fms %10.2fms %10.2fms %6d' % (
+            name, cpu * 1000000, rate, statistics.mean(lateness) * 1000,
+            lateness[int(len(lateness) * 0.99)] * 1000,
+            lateness[-1] * 1000, down))
+        time.sleep(0.1)
+
+
+if __name__ == '__main__':
+    main()
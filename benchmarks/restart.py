@@ -0,0 +1,90 @@
+"""Benchmark aiobfd restart-to-first-packet latency with saved session state
+
+Brings up sessions to loopback remotes, marks them Up as if the remotes
+answered, saves their state and tears everything down like a process that
+is being restarted. A new control process is then started from the saved
+state, timing how long it takes until every session sent its first packet
+and how many of them resumed Up. The remotes see no flap as long as this
+stays below their Detection Time.
+
+Needs permission to bind UDP port 3784 and one file descriptor per session,
+the soft limit is raised to the hard limit.
+
+    python benchmarks/restart.py --sessions 100 1000 10000
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import statistics
+import tempfile
+import time
+import aiobfd
+from startup import remotes
+
+
+async def first_packets(local, peers, persist):
+    """Start a control process from the saved state, returns the delay until
+       the first packet of each session and the number of resumed sessions"""
+    first = {}
+    tx_packet = aiobfd.Session.tx_packet
+
+    def record(session, final=False):
+        """Note when a session sends its first packet"""
+        first.setdefault(session.remote, time.perf_counter())
+        tx_packet(session, final)
+
+    aiobfd.Session.tx_packet = record
+    try:
+        start = time.perf_counter()
+        control = await aiobfd.Control.create(local, peers, persist=persist)
+        while len(first) < len(peers):
+            await asyncio.sleep(0.001)
+    finally:
+        aiobfd.Session.tx_packet = tx_packet
+    resumed = control.stats()['resumed_sessions']
+    control.close()
+    await asyncio.sleep(0)
+    return [first[remote] - start for remote in peers], resumed
+
+
+async def measure(local, peers, path):
+    """Save the state of Up sessions and time resuming them"""
+    persist = {'path': path}
+    control = await aiobfd.Control.create(local, peers, persist=persist)
+    for session in control.sessions:
+        session.remote_discr = session.local_discr ^ 0xffffffff
+        session.state = aiobfd.session.STATE_UP
+    await control.save_state()
+    control.close()
+    await asyncio.sleep(0)
+    return await first_packets(local, peers, persist)
+
+
+def main():
+    """Run the restart benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--local', default='127.0.0.1')
+    parser.add_argument('--sessions', type=int, nargs='+',
+                        default=[100, 1000])
+    args = parser.parse_args()
+
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    loop = asyncio.get_event_loop()
+    print('%8s %8s %12s %12s %12s' % ('sessions', 'resumed', 'first',
+                                      'median', 'last'))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'state.json')
+        for count in args.sessions:
+            delays, resumed = loop.run_until_complete(
+                measure(args.local, remotes(count), path))
+            print('%8d %8d %10.1fms %10.1fms %10.1fms' % (
+                count, resumed, min(delays) * 1000,
+                statistics.median(delays) * 1000, max(delays) * 1000))
+
+
+if __name__ == '__main__':
+    main()
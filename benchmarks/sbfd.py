@@ -0,0 +1,144 @@
+"""Benchmark the aiobfd S-BFD reflector
+
+Rewrites a packet in place with `Reflector.reflect()` and, for comparison,
+decodes and re-encodes it with the `Packet` codec. Then runs the reflector
+on a UDP socket and has a load generator in a second process keep a window
+of packets in flight from several source sockets, reporting the packets
+reflected per second and the CPU time the reflector spent per packet.
+
+    python benchmarks/sbfd.py --duration 5 --window 64 --sources 4
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import resource
+import select
+import socket
+import time
+import bitstring
+import aiobfd
+
+REFLECTOR_DISCR = 1
+PACKET = bitstring.pack(
+    aiobfd.packet.PACKET_FORMAT, version=1, diag=0, state=3, poll=False,
+    final=False, control_plane_independent=False,
+    authentication_present=False, demand_mode=False, multipoint=False,
+    detect_mult=3, length=24, my_discr=1234, your_discr=REFLECTOR_DISCR,
+    desired_min_tx_interval=10000, required_min_rx_interval=0,
+    required_min_echo_rx_interval=0).bytes
+
+
+def rate(function, count):
+    """Calls per second of a function"""
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return count / (time.perf_counter() - start)
+
+
+def codec(packet):
+    """Reflect a packet through the `Packet` codec"""
+    received = aiobfd.Packet(packet, '127.0.0.1')
+    return bitstring.pack(
+        aiobfd.packet.PACKET_FORMAT, version=1, diag=0, state=3,
+        poll=False, final=received.poll, control_plane_independent=False,
+        authentication_present=False, demand_mode=False, multipoint=False,
+        detect_mult=received.detect_mult, length=24,
+        my_discr=received.your_discr, your_discr=received.my_discr,
+        desired_min_tx_interval=received.desired_min_tx_interval,
+        required_min_rx_interval=10000,
+        required_min_echo_rx_interval=0).bytes
+
+
+def generate(addr, sources, window, duration, results):
+    """Keep `window` packets in flight from each source socket, counts the
+       replies"""
+    socks = []
+    for _ in range(sources):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        sock.setblocking(False)
+        socks.append(sock)
+    poller = select.epoll()
+    by_fd = {sock.fileno(): sock for sock in socks}
+    for sock in socks:
+        poller.register(sock.fileno(), select.EPOLLIN)
+        for _ in range(window):
+            sock.sendto(PACKET, addr)
+    replies = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        for fd, _ in poller.poll(0.1):
+            sock = by_fd[fd]
+            while True:
+                try:
+                    sock.recv(64)
+                except BlockingIOError:
+                    break
+                replies += 1
+                sock.sendto(PACKET, addr)
+        # Make up for packets lost in the socket buffers
+        if not poller.poll(0):
+            for sock in socks:
+                sock.sendto(PACKET, addr)
+    results.put(replies)
+
+
+async def measure(loop, args):
+    """Packets reflected per second and CPU time per packet"""
+    reflector = aiobfd.sbfd.Reflector(loop, [REFLECTOR_DISCR],
+                                      batch=args.batch)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', args.port))
+    reflector.open(sock)
+    results = multiprocessing.Queue()
+    generator = multiprocessing.Process(
+        target=generate, args=(sock.getsockname(), args.sources, args.window,
+                               args.duration, results))
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    generator.start()
+    while generator.is_alive():
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    reflector.close()
+    reflected = reflector.counters['reflected_packets']
+    cpu = after.ru_utime + after.ru_stime - usage.ru_utime - usage.ru_stime
+    return reflected / elapsed, cpu / max(reflected, 1), results.get(), \
+        reflector.counters
+
+
+def main():
+    """Run the reflector benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--packets', type=int, default=100000)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--window', type=int, default=64)
+    parser.add_argument('--sources', type=int, default=4)
+    parser.add_argument('--batch', type=int,
+                        default=aiobfd.sbfd.REFLECTOR['batch'])
+    parser.add_argument('--port', type=int, default=0)
+    args = parser.parse_args()
+
+    # Reflecting the reply turns it back into a request when both
+    # discriminators are ours, so the same buffer is reused
+    reflector = aiobfd.sbfd.Reflector(None, [REFLECTOR_DISCR, 1234])
+    buffer = bytearray(PACKET)
+    fast = rate(lambda: reflector.reflect(buffer, 24), args.packets)
+    slow = rate(lambda: codec(PACKET), max(args.packets // 50, 1))
+    print('in place: %10d packets/s' % fast)
+    print('codec:    %10d packets/s' % slow)
+
+    loop = asyncio.new_event_loop()
+    pps, cpu, replies, counters = loop.run_until_complete(
+        measure(loop, args))
+    loop.close()
+    print('socket:   %10d packets/s, %.1f us CPU per packet, %d replies '
+          'received, %d send drops' % (pps, cpu * 1000000, replies,
+                                       counters['reflector_tx_drops']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Benchmark aiobfd transmission bursts of many sessions
+
+Starts the sessions of a control process together, then restarts their
+transmission together as a common remote or link event would, without and
+with staggering and a packets per second ceiling. Reports the largest
+number of packets sent back to back in one iteration of the event loop
+after each event and the packets the pacer moved or had to send over the
+ceiling.
+
+Needs permission to bind UDP port 3784 and one file descriptor per session.
+
+    python benchmarks/stagger.py --sessions 1000 --max-pps 2000
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import aiobfd
+
+
+def remotes(count):
+    """Generate remote addresses on the loopback network"""
+    network = ipaddress.ip_network('127.16.0.0/12')
+    return [str(network[i + 1]) for i in range(count)]
+
+
+async def burst(control, duration):
+    """Largest burst sent within `duration` seconds"""
+    control.pacer.burst.update({'last': 0, 'avg': 0.0, 'max': 0})
+    await asyncio.sleep(duration)
+    return control.pacer.burst['max']
+
+
+async def measure(local, peers, pacing, duration):
+    """Largest bursts after startup and after restarting all sessions"""
+    control = await aiobfd.Control.create(local, peers, pacing=pacing)
+    start = await burst(control, duration)
+    for session in control.sessions:
+        session._restart_tx_packets()  # pylint: disable=I0011,W0212
+    restart = await burst(control, duration)
+    stats = control.stats()
+    control.close()
+    await asyncio.sleep(0)
+    return start, restart, stats['tx_deferred'], stats['tx_overruns']
+
+
+def main():
+    """Run the staggering benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--local', default='127.0.0.1')
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--max-pps', type=int, default=2000)
+    parser.add_argument('--duration', type=float, default=1.5)
+    args = parser.parse_args()
+
+    peers = remotes(args.sessions)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    print('%-22s %10s %10s %10s %10s' % ('pacing', 'start', 'restart',
+                                         'deferred', 'overruns'))
+    for name, pacing in (
+            ('none', {}),
+            ('stagger', {'stagger': True}),
+            ('stagger, %d pps' % args.max_pps,
+             {'stagger': True, 'max_pps': args.max_pps})):
+        start, restart, deferred, overruns = loop.run_until_complete(
+            measure(args.local, peers, pacing, args.duration))
+        print('%-22s %10d %10d %10d %10d' % (name, start, restart, deferred,
+                                             overruns))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark aiobfd startup time for large numbers of sessions
+
+Compares bringing the sessions up one at a time with the concurrent
+`Control.create()`. Sessions that are already up keep polling for failures
+while the next one starts, so sequential startup grows much faster than
+linearly and is skipped above --sequential-max sessions.
+
+Needs permission to bind UDP port 3784 and one file descriptor per session,
+the soft limit is raised to the hard limit.
+
+    python benchmarks/startup.py --sessions 1000 10000
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import resource
+import time
+import aiobfd
+
+
+def remotes(count):
+    """Generate remote addresses on the loopback network"""
+    network = ipaddress.ip_network('127.16.0.0/12')
+    return [str(network[i + 1]) for i in range(count)]
+
+
+async def sequential(local, peers):
+    """Bring up the server and every session one after the other"""
+    control = aiobfd.Control(local, [], loop=asyncio.get_event_loop(),
+                             start=False)
+    await control.start_server()
+    for remote in peers:
+        await control.add_session(local, remote, passive=True)
+    return control
+
+
+async def concurrent(local, peers):
+    """Bring up the server and all sessions concurrently"""
+    return await aiobfd.Control.create(local, peers, passive=True)
+
+
+async def measure(method, local, peers):
+    """Time a single startup run and tear it down again"""
+    start = time.perf_counter()
+    control = await method(local, peers)
+    elapsed = time.perf_counter() - start
+    control.close()
+    await asyncio.sleep(0)
+    return elapsed
+
+
+def main():
+    """Run the startup benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--local', default='127.0.0.1')
+    parser.add_argument('--sessions', type=int, nargs='+',
+                        default=[1000, 10000])
+    parser.add_argument('--sequential-max', type=int, default=2000)
+    args = parser.parse_args()
+
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    loop = asyncio.get_event_loop()
+    print('%8s %12s %12s %8s' % ('sessions', 'sequential', 'concurrent',
+                                 'speedup'))
+    for count in args.sessions:
+        peers = remotes(count)
+        con = loop.run_until_complete(measure(concurrent, args.local, peers))
+        if count > args.sequential_max:
+            print('%8d %12s %11.3fs %8s' % (count, '-', con, '-'))
+            continue
+        seq = loop.run_until_complete(measure(sequential, args.local, peers))
+        print('%8d %11.3fs %11.3fs %7.1fx' % (count, seq, con, seq / con))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Benchmark the gap in transmitting and receiving while aiobfd hands over
+
+Brings up sessions to loopback remotes that are Up with themselves at a
+tight interval, so every packet is sent, received on the wildcard address,
+demultiplexed and processed by the same process, and has a second control
+process take them over through the takeover socket, both in this process.
+Records when every session sends and processes a packet and reports the
+longest gaps around the takeover, which the remotes would see as late
+packets. They stay Up as long as the gaps are well below the Detection
+Time, and ideally below the interval.
+
+Needs permission to bind UDP port 3784 and two file descriptors per
+session, the soft limit is raised to the hard limit.
+
+    python benchmarks/takeover.py --sessions 100 1000 --interval 20
+"""
+
+import argparse
+import asyncio
+import collections
+import os
+import resource
+import tempfile
+import time
+import aiobfd
+from startup import remotes
+from timers import up_state
+
+
+def record(times):
+    """Note when each session, by local discriminator, sends and processes
+       a packet, returns a function that restores the originals"""
+    tx_packet = aiobfd.Session.tx_packet
+    rx_packet = aiobfd.Session.rx_packet
+    rx_unchanged = aiobfd.Session.rx_unchanged
+
+    def sent(session, final=False):
+        times['tx', session.local_discr].append(time.monotonic())
+        tx_packet(session, final)
+
+    def received(session, packet):
+        times['rx', session.local_discr].append(time.monotonic())
+        rx_packet(session, packet)
+
+    def unchanged(session, data, rx_time=None):
+        if not rx_unchanged(session, data, rx_time):
+            return False
+        times['rx', session.local_discr].append(time.monotonic())
+        return True
+
+    aiobfd.Session.tx_packet = sent
+    aiobfd.Session.rx_packet = received
+    aiobfd.Session.rx_unchanged = unchanged
+
+    def restore():
+        aiobfd.Session.tx_packet = tx_packet
+        aiobfd.Session.rx_packet = rx_packet
+        aiobfd.Session.rx_unchanged = rx_unchanged
+    return restore
+
+
+def longest_gap(times, start, end):
+    """Longest gap between consecutive times that ends in [start, end]"""
+    return max([b - a for a, b in zip(times, times[1:])
+                if start <= b and a <= end] or [end - start])
+
+
+async def measure(loop, local, count, interval, path):
+    """Hand over Up sessions, returns the duration of the takeover, the
+       longest transmit and receive gaps and the sessions that went down"""
+    peers = remotes(count)
+    old = await aiobfd.Control.create(local, peers, loop=loop,
+                                      takeover_socket=path,
+                                      tx_interval=interval,
+                                      rx_interval=interval)
+    old.finish_takeover()
+    for session in old.sessions:
+        session.resume(up_state(session, interval), 0)
+        # Rather than after the interval the session started out with
+        session._restart_tx_packets()  # pylint: disable=I0011,W0212
+    receivers = [loop.create_task(old.rx_packets())]
+    exited = loop.create_future()
+    old.terminate = lambda drain=True: exited.done() or \
+        exited.set_result(time.monotonic())
+    # Sessions that went down while starting up come back on their own
+    while any(s.state != aiobfd.session.STATE_UP for s in old.sessions):
+        await asyncio.sleep(0.1)
+    await asyncio.sleep(1)
+
+    times = collections.defaultdict(list)
+    restore = record(times)
+    try:
+        start = time.monotonic()
+        new = await aiobfd.Control.create(local, peers, loop=loop,
+                                          takeover_socket=path,
+                                          take_over=True,
+                                          tx_interval=interval,
+                                          rx_interval=interval)
+        receivers.append(loop.create_task(new.rx_packets()))
+        new.finish_takeover()
+        end = await exited
+        old.close()
+        await asyncio.sleep(1)
+    finally:
+        restore()
+    tx_gap = max(longest_gap(times['tx', s.local_discr], start, end)
+                 for s in new.sessions)
+    rx_gap = max(longest_gap(times['rx', s.local_discr], start, end)
+                 for s in new.sessions)
+    down = sum(1 for s in new.sessions
+               if s.state != aiobfd.session.STATE_UP)
+
+    for receiver in receivers:
+        receiver.cancel()
+    new.close()
+    await asyncio.sleep(0)
+    return end - start, tx_gap, rx_gap, down
+
+
+def main():
+    """Run the takeover benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--local', default='0.0.0.0')
+    parser.add_argument('--sessions', type=int, nargs='+',
+                        default=[100, 1000])
+    parser.add_argument('--interval', type=int, default=20,
+                        help='Tx and Rx interval (ms)')
+    args = parser.parse_args()
+
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    print('%8s %10s %12s %12s %12s %6s' % ('sessions', 'interval',
+                                           'takeover', 'tx gap', 'rx gap',
+                                           'down'))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'aiobfd.sock')
+        for count in args.sessions:
+            loop = aiobfd.new_event_loop()
+            duration, tx_gap, rx_gap, down = loop.run_until_complete(
+                measure(loop, args.local, count, args.interval * 1000,
+                        path))
+            loop.close()
+            print('%8d %8dms %10.1fms %10.1fms %10.1fms %6d' % (
+                count, args.interval, duration * 1000, tx_gap * 1000,
+                rx_gap * 1000, down))
+            time.sleep(0.1)
+
+
+if __name__ == '__main__':
+    main()
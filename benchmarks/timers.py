@@ -0,0 +1,110 @@
+"""Benchmark the accuracy of aiobfd's asyncio and timerfd timers
+
+Runs the same synthetic load on each timer backend: sessions that are Up
+with themselves at a tight interval, so every packet is sent, received,
+demultiplexed and processed by the same process. Records how much later
+than asked every session wakes up to transmit and reports the percentiles
+of that timer error.
+
+Needs Linux for the timerfd backend, permission to bind UDP port 3784 and
+one file descriptor per session, the soft limit is raised to the hard limit.
+
+    python benchmarks/timers.py --sessions 500 --interval 20 --duration 10
+"""
+
+import argparse
+import asyncio
+import resource
+import time
+import aiobfd
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def up_state(session, interval):
+    """State of a session that is Up with itself at the given interval"""
+    state = session.snapshot()
+    state.update({'state': aiobfd.session.STATE_UP,
+                  'remote_state': aiobfd.session.STATE_UP,
+                  'remote_discr': session.local_discr,
+                  'desired_min_tx_interval': interval,
+                  'required_min_rx_interval': interval,
+                  'remote_min_rx_interval': interval,
+                  'remote_min_tx_interval': interval,
+                  'remote_detect_mult': session.detect_mult})
+    return state
+
+
+def record(session, shortest, errors):
+    """Have a session record the error of its sleeps of at least `shortest`
+       seconds, the transmit intervals rather than the detection polls"""
+    sleep = session._sleep  # pylint: disable=I0011,W0212
+
+    async def timed(delay):
+        start = time.monotonic()
+        await sleep(delay)
+        if delay >= shortest:
+            errors.append(time.monotonic() - start - delay)
+    session._sleep = timed  # pylint: disable=I0011,W0212
+
+
+async def measure(loop, local, count, interval, duration, timers):
+    """Run the load for a while, returns the timer errors and the number of
+       sessions that went down"""
+    control = await aiobfd.Control.create(local, [local] * count, loop=loop,
+                                          timers=timers)
+    errors = []
+    for session in control.sessions:
+        session.tx_interval = session.rx_interval = interval
+        session.resume(up_state(session, interval), 0)
+        record(session, interval / 2000000, errors)
+    receiver = loop.create_task(control.rx_packets())
+    await asyncio.sleep(1)
+    del errors[:]
+    await asyncio.sleep(duration)
+    down = sum(1 for s in control.sessions
+               if s.state != aiobfd.session.STATE_UP)
+    backend = 'timerfd' if control.timer is not None else 'asyncio'
+
+    receiver.cancel()
+    control.close()
+    await asyncio.sleep(0)
+    return backend, sorted(errors), down
+
+
+def main():
+    """Run the timer benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--local', default='127.0.0.1')
+    parser.add_argument('--sessions', type=int, default=500)
+    parser.add_argument('--interval', type=int, default=20,
+                        help='Tx and Rx interval (ms)')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--timers', nargs='+', default=list(aiobfd.TIMERS),
+                        choices=aiobfd.TIMERS)
+    args = parser.parse_args()
+
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    print('%8s %8s' % ('timers', 'wakeups') +
+          ''.join('%10s' % ('p%s' % p) for p in PERCENTILES) +
+          '%10s %6s' % ('max', 'down'))
+    for name in args.timers:
+        loop = aiobfd.new_event_loop()
+        backend, errors, down = loop.run_until_complete(
+            measure(loop, args.local, args.sessions, args.interval * 1000,
+                    args.duration, name))
+        loop.close()
+        if backend != name:
+            print('%8s not available' % name)
+            continue
+        print('%8s %8d' % (name, len(errors)) +
+              ''.join('%8.0fus' % (errors[int(len(errors) * p / 100)] *
+                                   1000000) for p in PERCENTILES) +
+              '%8.0fus %6d' % (errors[-1] * 1000000, down))
+        time.sleep(0.1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark aiobfd on steady state packets
+
+Feeds the same Control packet over and over to an Up session of a control
+process, as a remote does once the session is Up, first through the
+unchanged packet fast path and then decoding and processing every packet
+in full. Reports the packets per second of `Control.process_packet()` in
+both cases, and of the session alone.
+
+    python benchmarks/unchanged.py --packets 100000
+"""
+
+import argparse
+import asyncio
+import time
+import bitstring
+import aiobfd
+
+
+def rate(function, count):
+    """Calls per second of a function"""
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return count / (time.perf_counter() - start)
+
+
+def steady_packet(session):
+    """The packet an Up remote keeps sending to a session"""
+    return bitstring.pack(
+        aiobfd.packet.PACKET_FORMAT, version=1, diag=0,
+        state=aiobfd.session.STATE_UP, poll=False, final=False,
+        control_plane_independent=False, authentication_present=False,
+        demand_mode=False, multipoint=False, detect_mult=3, length=24,
+        my_discr=1234, your_discr=session.local_discr,
+        desired_min_tx_interval=50000, required_min_rx_interval=50000,
+        required_min_echo_rx_interval=0).bytes
+
+
+def main():
+    """Run the steady state benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--packets', type=int, default=100000)
+    parser.add_argument('--local', default='127.0.0.1')
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    control = loop.run_until_complete(aiobfd.Control.create(
+        args.local, [args.local], loop=loop))
+    session = control.sessions[0]
+    session.state = aiobfd.session.STATE_UP
+    data = steady_packet(session)
+    source = session.remote_addr[0]
+    control.process_packet(data, source, time.monotonic())
+
+    fast = rate(lambda: control.process_packet(data, source, 0.0),
+                args.packets)
+    unchanged = rate(lambda: session.rx_unchanged(data, 0.0), args.packets)
+    count = max(args.packets // 20, 1)
+    session.rx_unchanged = lambda data, rx_time=None: False
+    full = rate(lambda: control.process_packet(data, source, 0.0), count)
+    decode = rate(lambda: session.rx_packet(
+        aiobfd.Packet(data, source, 0.0)), count)
+    assert session.state == aiobfd.session.STATE_UP
+    print('%-10s %12s %12s' % ('path', 'control/s', 'session/s'))
+    print('%-10s %12d %12d' % ('unchanged', fast, unchanged))
+    print('%-10s %12d %12d' % ('full', full, decode))
+    print('speedup    %11.1fx' % (fast / full))
+
+    control.close()
+    loop.run_until_complete(asyncio.sleep(0))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
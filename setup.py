@@ -25,6 +25,8 @@ setup(name='aiobfd',
       url='https://github.com/netedgeplus/aiobfd',
       packages=find_packages(exclude=['contrib', 'docs', 'tests*']),
       install_requires=['bitstring'],
+      extras_require={'yaml': ['PyYAML'], 'uvloop': ['uvloop'],
+                      'toml': ['tomli; python_version < "3.11"']},
       tests_require=['pytest', 'pytest-asyncio', 'pytest-cov', 'pytest-mock',
                      'coverage'],
       python_requires='>=3.5, <4',
@@ -0,0 +1,91 @@
+"""Test aiobfd/auth.py"""
+# pylint: disable=I0011,W0621
+
+import hashlib
+import pytest
+import aiobfd.auth
+
+# Version 1, state Up with the A bit set, Detect Mult 3 and the length
+# filled in when signing
+HEADER = bytes([0x20, 0xc4, 3, 0]) + bytes(range(1, 21))
+
+
+def signed(auth, seq, header=HEADER):
+    """A packet signed by a key chain"""
+    buffer = bytearray(auth.length)
+    buffer[:24] = header[:3] + bytes([auth.length]) + header[4:]
+    auth.sign(buffer, seq)
+    return bytes(buffer)
+
+
+@pytest.mark.parametrize('auth_type', list(aiobfd.auth.AUTH_TYPES))
+def test_sign_verify(auth_type):
+    """Test whether a signed packet verifies and carries the digest of the
+       packet with the key in place of the digest"""
+    auth = aiobfd.auth.Authentication(auth_type, {7: 'secret'})
+    data = signed(auth, 1234)
+    assert data[24:28] == bytes([auth.type, auth.auth_len, 7, 0])
+    algorithm = 'md5' if 'md5' in auth_type else 'sha1'
+    key = b'secret'.ljust(auth.digest_len, b'\0')
+    assert data[32:] == hashlib.new(algorithm, data[:32] + key).digest()
+    assert auth.verify(data, 3, 0, False) == 1234
+
+
+def test_verify_key_chain():
+    """Test whether packets are accepted with any key of the chain"""
+    sender = aiobfd.auth.Authentication('keyed-sha1', {1: 'old', 2: 'new'},
+                                        key_id=1)
+    receiver = aiobfd.auth.Authentication('keyed-sha1', {1: 'old', 2: 'new'})
+    assert receiver.key_id == 2
+    receiver.verify(signed(sender, 1), 3, 0, False)
+    receiver.verify(signed(receiver, 1), 3, 0, False)
+    with pytest.raises(IOError):
+        aiobfd.auth.Authentication('keyed-sha1', {3: 'new'}).verify(
+            signed(sender, 1), 3, 0, False)
+
+
+def test_verify_mismatch():
+    """Test whether packets of another type, key or length are discarded"""
+    auth = aiobfd.auth.Authentication('keyed-md5', {1: 'secret'})
+    sha1 = aiobfd.auth.Authentication('keyed-sha1', {1: 'secret'})
+    with pytest.raises(IOError):
+        auth.verify(signed(sha1, 1), 3, 0, False)
+    other = aiobfd.auth.Authentication('keyed-md5', {1: 'other'})
+    with pytest.raises(IOError):
+        auth.verify(signed(other, 1), 3, 0, False)
+    with pytest.raises(IOError):
+        auth.verify(signed(auth, 1)[:40], 3, 0, False)
+
+
+@pytest.mark.parametrize('auth_type,accepted', [
+    ('keyed-md5', range(0, 10)),
+    ('meticulous-keyed-md5', range(1, 10))])
+def test_verify_window(auth_type, accepted):
+    """Test whether sequence numbers are only accepted within three times
+       the Detect Mult of the last one, across the wrap around"""
+    auth = aiobfd.auth.Authentication(auth_type, {1: 'secret'})
+    for seq in range(-2, 12):
+        data = signed(auth, (100 + seq) % 2**32)
+        if seq in accepted:
+            auth.verify(data, 3, 100, True)
+        else:
+            with pytest.raises(IOError):
+                auth.verify(data, 3, 100, True)
+    # Anything goes until the sequence number is known
+    auth.verify(signed(auth, 50), 3, 100, False)
+    # Wrapping around
+    auth.verify(signed(auth, 5), 3, 2**32 - 2, True)
+
+
+def test_invalid_settings():
+    """Test whether invalid key chains raise an exception"""
+    with pytest.raises(ValueError):
+        aiobfd.auth.Authentication('simple-password', {1: 'secret'})
+    with pytest.raises(ValueError):
+        aiobfd.auth.Authentication('keyed-md5', {})
+    with pytest.raises(ValueError):
+        aiobfd.auth.Authentication('keyed-md5', {256: 'secret'})
+    with pytest.raises(ValueError):
+        aiobfd.auth.Authentication('keyed-md5', {1: 'x' * 17})
+    with pytest.raises(ValueError):
+        aiobfd.auth.Authentication('keyed-md5', {1: 'secret'}, key_id=2)
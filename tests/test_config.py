@@ -0,0 +1,310 @@
+"""Test aiobfd/config.py"""
+# pylint: disable=I0011,W0621
+
+import importlib.util
+import socket
+import pytest
+import aiobfd.config
+
+
+@pytest.fixture()
+def config_data():
+    """Valid sample configuration"""
+    return {
+        'local': '127.0.0.1',
+        'family': 'ipv4',
+        'defaults': {'tx_interval': 300, 'rx_interval': 300},
+        'profiles': {'fast': {'tx_interval': 50, 'detect_mult': 3}},
+        'peers': [
+            {'remote': '127.0.0.2', 'profile': 'fast'},
+            {'remote': '127.0.0.3', 'passive': True, 'local': '127.0.0.4'}
+        ]
+    }
+
+
+def test_parse_config(config_data):
+    """Test whether profiles and defaults are applied to the peers"""
+    local, family, sessions = aiobfd.config.parse_config(config_data)
+    assert local == '127.0.0.1'
+    assert family == socket.AF_INET
+    assert sessions == [
+        {'local': '127.0.0.1', 'remote': '127.0.0.2', 'passive': False,
+         'connected': False, 'multihop': False, 'damping': None,
+         'auth': None, 'demand_mode': False, 'family': socket.AF_INET,
+         'tx_interval': 50000, 'rx_interval': 300000, 'echo_tx_interval': 0,
+         'echo_rx_interval': 0, 'echo_aiobfd': False, 'detect_mult': 3},
+        {'local': '127.0.0.4', 'remote': '127.0.0.3', 'passive': True,
+         'connected': False, 'multihop': False, 'damping': None,
+         'auth': None, 'demand_mode': False, 'family': socket.AF_INET,
+         'tx_interval': 300000, 'rx_interval': 300000, 'echo_tx_interval': 0,
+         'echo_rx_interval': 0, 'echo_aiobfd': False, 'detect_mult': 1}]
+
+
+def test_parse_config_echo(config_data):
+    """Test whether Echo intervals are converted to microseconds"""
+    config_data['profiles']['fast']['echo_tx_interval'] = 10
+    config_data['peers'][0]['echo_rx_interval'] = 20
+    config_data['peers'][0]['echo_aiobfd'] = True
+    _, _, sessions = aiobfd.config.parse_config(config_data)
+    assert sessions[0]['echo_tx_interval'] == 10000
+    assert sessions[0]['echo_rx_interval'] == 20000
+    assert sessions[0]['echo_aiobfd'] is True
+    assert sessions[1]['echo_tx_interval'] == 0
+    assert sessions[1]['echo_aiobfd'] is False
+
+
+def test_parse_config_demand(config_data):
+    """Test whether Demand mode is taken from the profile of a peer"""
+    config_data['profiles']['fast']['demand_mode'] = True
+    _, _, sessions = aiobfd.config.parse_config(config_data)
+    assert sessions[0]['demand_mode'] is True
+    assert sessions[1]['demand_mode'] is False
+
+
+def test_parse_config_auth(config_data):
+    """Test whether key IDs from TOML are converted and invalid key chains
+       raise an exception"""
+    config_data['profiles']['fast']['auth'] = {
+        'type': 'keyed-sha1', 'keys': {'1': 'old', '2': 'new'},
+        'key_id': '1'}
+    _, _, sessions = aiobfd.config.parse_config(config_data)
+    assert sessions[0]['auth'] == {'type': 'keyed-sha1',
+                                   'keys': {1: 'old', 2: 'new'}, 'key_id': 1}
+    assert sessions[1]['auth'] is None
+    config_data['peers'][1]['auth'] = {'type': 'keyed-md5'}
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_config(config_data)
+    config_data['peers'][1]['auth'] = {'type': 'keyed-md5',
+                                       'keys': {'1': 'x' * 17}}
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_config(config_data)
+
+
+def test_parse_config_no_local(config_data):
+    """Test whether a missing local address raises an exception"""
+    del config_data['local']
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_config(config_data)
+
+
+def test_parse_config_unknown_key(config_data):
+    """Test whether a typo in a peer raises an exception"""
+    config_data['peers'][0]['tx_intreval'] = 10
+    with pytest.raises(ValueError) as excinfo:
+        aiobfd.config.parse_config(config_data)
+    assert 'tx_intreval' in str(excinfo.value)
+
+
+def test_parse_config_unknown_profile(config_data):
+    """Test whether referencing an unknown profile raises an exception"""
+    config_data['peers'][0]['profile'] = 'slow'
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_config(config_data)
+
+
+def test_parse_config_duplicate_peer(config_data):
+    """Test whether configuring a peer twice raises an exception"""
+    config_data['peers'].append({'remote': '127.0.0.2'})
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_config(config_data)
+
+
+def test_parse_config_bad_family(config_data):
+    """Test whether an unknown address family raises an exception"""
+    config_data['family'] = 'ipx'
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_config(config_data)
+
+
+def test_parse_damping(config_data):
+    """Test whether damping is enabled per profile and peer"""
+    config_data['profiles']['fast']['damping'] = {'half_life': 30,
+                                                  'slow_interval': 1000}
+    config_data['peers'][1]['damping'] = True
+    _, _, sessions = aiobfd.config.parse_config(config_data)
+    assert sessions[0]['damping'] == {'half_life': 30,
+                                      'slow_interval': 1000000}
+    assert sessions[1]['damping'] == {}
+
+
+def test_parse_damping_invalid(config_data):
+    """Test whether inconsistent damping thresholds raise an exception"""
+    config_data['peers'][0]['damping'] = {'reuse': 3000}
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_config(config_data)
+    config_data['peers'][0]['damping'] = {'halflife': 3}
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_config(config_data)
+
+
+def test_parse_socket_profile(config_data):
+    """Test whether socket options are read from the configuration"""
+    config_data['socket'] = {'tos': 0xb8, 'busy_poll': 50}
+    aiobfd.config.parse_config(config_data)
+    assert aiobfd.config.parse_socket_profile(config_data) == \
+        {'tos': 0xb8, 'busy_poll': 50}
+    config_data['socket']['dscp'] = 46
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_socket_profile(config_data)
+
+
+def test_parse_listen(config_data):
+    """Test whether dynamic sessions use the defaults and their profile"""
+    assert aiobfd.config.parse_listen(config_data) is None
+    config_data['listen'] = {'prefixes': ['192.0.2.0/24'], 'profile': 'fast',
+                             'max_sessions': 10}
+    aiobfd.config.parse_config(config_data)
+    assert aiobfd.config.parse_listen(config_data) == {
+        'prefixes': ['192.0.2.0/24'], 'max_sessions': 10, 'connected': False,
+        'damping': None, 'auth': None, 'demand_mode': False,
+        'detect_mult': 3, 'tx_interval': 50000,
+        'rx_interval': 300000, 'echo_tx_interval': 0, 'echo_rx_interval': 0,
+        'echo_aiobfd': False}
+
+
+def test_parse_listen_invalid(config_data):
+    """Test whether listening without valid prefixes raises an exception"""
+    config_data['listen'] = {'prefixes': []}
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_listen(config_data)
+    config_data['listen'] = {'prefixes': ['192.0.2.300/24']}
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_listen(config_data)
+
+
+def test_parse_drain(config_data):
+    """Test whether the drain settings are read and checked"""
+    assert aiobfd.config.parse_drain(config_data) == {}
+    config_data['drain'] = {'hold': 2, 'batch': 16}
+    aiobfd.config.parse_config(config_data)
+    assert aiobfd.config.parse_drain(config_data) == {'hold': 2, 'batch': 16}
+    config_data['drain']['batch'] = 0
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_drain(config_data)
+
+
+def test_parse_persist(config_data):
+    """Test whether the persist settings are read and checked"""
+    config_data['persist'] = {'path': '/run/aiobfd.json'}
+    aiobfd.config.parse_config(config_data)
+    assert aiobfd.config.parse_persist(config_data) == \
+        {'path': '/run/aiobfd.json'}
+    config_data['persist']['interval'] = 0
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_persist(config_data)
+
+
+def test_parse_multihop(config_data):
+    """Test whether multihop peers and the multihop settings are read and
+       checked"""
+    config_data['peers'][0]['multihop'] = True
+    config_data['multihop'] = {'max_hops': 3}
+    _, _, sessions = aiobfd.config.parse_config(config_data)
+    assert sessions[0]['multihop'] is True
+    assert sessions[1]['multihop'] is False
+    assert aiobfd.config.parse_multihop(config_data) == {'max_hops': 3}
+    config_data['multihop']['max_hops'] = 255
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_multihop(config_data)
+    config_data['multihop'] = {'ttl': 0}
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_multihop(config_data)
+
+
+def test_parse_reflector(config_data):
+    """Test whether S-BFD initiators and the reflector settings are read and
+       checked"""
+    config_data['peers'][0]['reflector_discr'] = '167772161'
+    config_data['reflector'] = {'discriminators': [1, '2'], 'rx_interval': 5}
+    _, _, sessions = aiobfd.config.parse_config(config_data)
+    assert sessions[0]['reflector_discr'] == 167772161
+    assert 'reflector_discr' not in sessions[1]
+    assert aiobfd.config.parse_reflector(config_data) == \
+        {'discriminators': [1, 2], 'rx_interval': 5000}
+    assert aiobfd.config.parse_reflector({}) == {'discriminators': []}
+    config_data['reflector']['discriminators'] = [0]
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_reflector(config_data)
+    config_data['peers'][0]['reflector_discr'] = 2**32
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_config(config_data)
+
+
+def test_parse_bind(config_data):
+    """Test whether additional listeners and the devices of peers are read
+       and checked"""
+    config_data['bind'] = [{'local': '127.0.0.2', 'device': 'vrf-blue'}]
+    assert aiobfd.config.parse_bind(config_data) == \
+        [{'local': '127.0.0.2', 'device': 'vrf-blue'}]
+    assert aiobfd.config.parse_bind({}) == []
+    config_data['bind'] = [{'device': 'vrf-blue'}]
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_bind(config_data)
+    config_data['bind'] = {'local': '127.0.0.2'}
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_bind(config_data)
+
+    # The same remote once for each device
+    config_data['peers'].append(dict(config_data['peers'][0],
+                                     device='vrf-blue'))
+    _, _, sessions = aiobfd.config.parse_config(config_data)
+    assert sessions[-1]['device'] == 'vrf-blue'
+    config_data['peers'].append(dict(config_data['peers'][0],
+                                     device='vrf-blue'))
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_config(config_data)
+
+
+def test_parse_gc(config_data):
+    """Test whether the garbage collection settings are read and checked"""
+    config_data['gc'] = {'freeze': True, 'thresholds': ['10000', 20]}
+    assert aiobfd.config.parse_gc(config_data) == \
+        {'freeze': True, 'thresholds': [10000, 20]}
+    assert aiobfd.config.parse_gc({}) == {}
+    config_data['gc'] = {'thresholds': [1, 2, 3, 4]}
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_gc(config_data)
+    config_data['gc'] = {'max_delay': 0}
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_gc(config_data)
+
+
+def test_parse_pacing(config_data):
+    """Test whether the pacing settings are read and checked"""
+    config_data['pacing'] = {'stagger': 1, 'max_pps': 5000}
+    assert aiobfd.config.parse_pacing(config_data) == \
+        {'stagger': True, 'max_pps': 5000}
+    config_data['pacing'] = {'max_pps': -1}
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_pacing(config_data)
+
+
+def test_parse_resolve_interval(config_data):
+    """Test whether the interval between hostname lookups is read and
+       checked"""
+    assert aiobfd.config.parse_resolve_interval(config_data) == \
+        aiobfd.control.RESOLVE_INTERVAL
+    config_data['resolve_interval'] = 300
+    assert aiobfd.config.parse_resolve_interval(config_data) == 300
+    config_data['resolve_interval'] = 0
+    with pytest.raises(ValueError):
+        aiobfd.config.parse_resolve_interval(config_data)
+
+
+def test_load_config_yaml(tmpdir):
+    """Load a YAML configuration file"""
+    pytest.importorskip('yaml')
+    path = tmpdir.join('aiobfd.yaml')
+    path.write('local: 127.0.0.1\npeers:\n  - remote: 127.0.0.2\n')
+    _, _, sessions = aiobfd.config.load_config(str(path))
+    assert sessions[0]['remote'] == '127.0.0.2'
+
+
+def test_load_config_toml(tmpdir):
+    """Load a TOML configuration file"""
+    if importlib.util.find_spec('tomllib') is None:  # Python 3.11
+        pytest.importorskip('tomli')
+    path = tmpdir.join('aiobfd.toml')
+    path.write('local = "127.0.0.1"\n[[peers]]\nremote = "127.0.0.2"\n')
+    _, _, sessions = aiobfd.config.load_config(str(path))
+    assert sessions[0]['remote'] == '127.0.0.2'
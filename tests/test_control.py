@@ -1,12 +1,18 @@
 """Test aiobfd/control.py"""
 # pylint: disable=I0011,W0621,E1101,W0611
 
+import asyncio
 import platform
 import socket
-from unittest.mock import MagicMock
+import time
+from unittest.mock import MagicMock, patch
 import pytest
 import bitstring
 import aiobfd.control
+import aiobfd.echo
+import aiobfd.sbfd
+import aiobfd.session
+import aiobfd.timers
 from aiobfd.packet import PACKET_FORMAT
 from tests.test_packet import PACKET_FORMAT_TOO_SHORT
 from tests.test_packet import valid_data  # noqa: F401
@@ -38,6 +44,12 @@ class InterruptAfter(object):  # pylint: disable=I0011,R0903
             raise KeyboardInterrupt
 
 
+class AsyncMock(MagicMock):
+    """Make MagicMock Async"""
+    async def __call__(self, *args, **kwargs):
+        return super(AsyncMock, self).__call__(*args, **kwargs)
+
+
 class CallableExhausted(Exception):
     """Exception that gets raised after `limit` calls"""
     pass
@@ -46,13 +58,21 @@ class CallableExhausted(Exception):
 @pytest.fixture()
 def control(event_loop):
     """Create a basic aiobfd control session"""
-    return aiobfd.control.Control('127.0.0.1', ['127.0.0.1'], loop=event_loop)
+    control = aiobfd.control.Control('127.0.0.1', ['127.0.0.1'],
+                                     loop=event_loop)
+    yield control
+    if not control.loop.is_closed():
+        control.close()
+        # Let the transports release their sockets
+        control.loop.run_until_complete(asyncio.sleep(0))
+    elif control.server._sock is not None:  # pylint: disable=I0011,W0212
+        control.server._sock.close()  # pylint: disable=I0011,W0212
 
 
 def test_control_ipv4(mocker):
     """Create a basic IPv4 Control process"""
     mocker.patch('aiobfd.control.log')
-    aiobfd.control.Control('127.0.0.1', ['127.0.0.1'])
+    control = aiobfd.control.Control('127.0.0.1', ['127.0.0.1'])
     aiobfd.control.log.debug.assert_has_calls(
         [mocker.call('Creating BFD session for remote %s.', '127.0.0.1'),
          mocker.call('Setting up UDP server on %s:%s.', '127.0.0.1',
@@ -60,6 +80,15 @@ def test_control_ipv4(mocker):
     aiobfd.control.log.info.assert_called_once_with(
         'Accepting traffic on %s:%s.', '127.0.0.1',
         aiobfd.control.CONTROL_PORT)
+    control.close()
+
+
+def test_control_connected():
+    """Create a Control process with connected source sockets"""
+    control = aiobfd.control.Control('127.0.0.1', ['127.0.0.1'],
+                                     connected=True)
+    assert control.sessions[0].connected
+    control.close()
 
 
 @pytest.mark.skipif(platform.node() == 'carbon',
@@ -67,7 +96,7 @@ def test_control_ipv4(mocker):
 def test_control_ipv6(mocker):
     """Create a basic IPv6 Control process"""
     mocker.patch('aiobfd.control.log')
-    aiobfd.control.Control('::1', ['::1'])
+    control = aiobfd.control.Control('::1', ['::1'])
     aiobfd.control.log.debug.assert_has_calls(
         [mocker.call('Creating BFD session for remote %s.', '::1'),
          mocker.call('Setting up UDP server on %s:%s.', '::1',
@@ -75,12 +104,13 @@ def test_control_ipv6(mocker):
     aiobfd.control.log.info.assert_called_once_with(
         'Accepting traffic on %s:%s.', '::1',
         aiobfd.control.CONTROL_PORT)
+    control.close()
 
 
 def test_control_hostname(mocker):
     """Create a basic IPv4 Control process from hostname"""
     mocker.patch('aiobfd.control.log')
-    aiobfd.control.Control('localhost', ['localhost'])
+    control = aiobfd.control.Control('localhost', ['localhost'])
     aiobfd.control.log.debug.assert_has_calls(
         [mocker.call('Creating BFD session for remote %s.', 'localhost'),
          mocker.call('Setting up UDP server on %s:%s.', 'localhost',
@@ -88,12 +118,14 @@ def test_control_hostname(mocker):
     aiobfd.control.log.info.assert_called_once_with(
         'Accepting traffic on %s:%s.', '127.0.0.1',
         aiobfd.control.CONTROL_PORT)
+    control.close()
 
 
 def test_control_hostname_force_v4(mocker):
     """Create a forced IPv4 Control process from hostname"""
     mocker.patch('aiobfd.control.log')
-    aiobfd.control.Control('localhost', ['localhost'], family=socket.AF_INET)
+    control = aiobfd.control.Control('localhost', ['localhost'],
+                                     family=socket.AF_INET)
     aiobfd.control.log.debug.assert_has_calls(
         [mocker.call('Creating BFD session for remote %s.', 'localhost'),
          mocker.call('Setting up UDP server on %s:%s.', 'localhost',
@@ -101,6 +133,7 @@ def test_control_hostname_force_v4(mocker):
     aiobfd.control.log.info.assert_called_once_with(
         'Accepting traffic on %s:%s.', '127.0.0.1',
         aiobfd.control.CONTROL_PORT)
+    control.close()
 
 
 @pytest.mark.skipif(platform.node() == 'carbon',
@@ -108,7 +141,8 @@ def test_control_hostname_force_v4(mocker):
 def test_control_hostname_force_v6(mocker):
     """Create a forced IPv6 Control process from hostname"""
     mocker.patch('aiobfd.control.log')
-    aiobfd.control.Control('localhost', ['localhost'], family=socket.AF_INET6)
+    control = aiobfd.control.Control('localhost', ['localhost'],
+                                     family=socket.AF_INET6)
     aiobfd.control.log.debug.assert_has_calls(
         [mocker.call('Creating BFD session for remote %s.', 'localhost'),
          mocker.call('Setting up UDP server on %s:%s.', 'localhost',
@@ -116,6 +150,7 @@ def test_control_hostname_force_v6(mocker):
     aiobfd.control.log.info.assert_called_once_with(
         'Accepting traffic on %s:%s.', '::1',
         aiobfd.control.CONTROL_PORT)
+    control.close()
 
 
 def test_process_invalid_packet(control, valid_data, mocker):  # noqa: F811
@@ -139,6 +174,125 @@ def test_process_pkt_unknown_remote(control, valid_data, mocker):  # noqa: F811
     control.sessions[0]._tx_packets.cancel()  # pylint: disable=I0011,W0212
 
 
+def test_admit(control, valid_data):  # noqa: F811
+    """Test whether packets for Up sessions are prioritized"""
+    session = control.sessions[0]
+    valid_data['your_discr'] = session.local_discr
+    data = bitstring.pack(PACKET_FORMAT, **valid_data).bytes
+    assert control.admit(data, '127.0.0.1') is False
+    session.state = aiobfd.session.STATE_UP
+    assert control.admit(data, '127.0.0.1') is True
+
+
+def test_admit_rate_limit(control, valid_data, mocker):  # noqa: F811
+    """Test whether packets matching no session are rate limited"""
+    mocker.patch('aiobfd.control.log')
+    data = bitstring.pack(PACKET_FORMAT, **valid_data).bytes
+    burst = control.intake['unmatched_burst']
+    results = [control.admit(data, '127.0.0.2') for _ in range(burst + 5)]
+    assert results == [False] * burst + [None] * 5
+    assert control.admit(data, '127.0.0.3') is False
+    assert control.stats()['rate_limited_drops'] == 5
+    aiobfd.control.log.info.assert_called_once_with(
+        'Rate limiting packets from %s as they don\'t match any configured '
+        'remote.', '127.0.0.2')
+
+
+def test_drop_log_suppressed(control, valid_data, mocker):  # noqa: F811
+    """Test whether repeated drops are logged once per interval"""
+    mocker.patch('aiobfd.control.log')
+    mocker.patch('aiobfd.control.time')
+    aiobfd.control.time.monotonic.side_effect = [1, 2, 3, 20]
+    packet = bitstring.pack(PACKET_FORMAT_TOO_SHORT, **valid_data)
+    for _ in range(4):
+        control.process_packet(packet, '127.0.0.1')
+    assert control.stats()['invalid_drops'] == 4
+    aiobfd.control.log.info.assert_has_calls([
+        mocker.call('Dropping packet: %s', mocker.ANY),
+        mocker.call('Suppressed %d similar messages in the last %d seconds.',
+                    2, 19),
+        mocker.call('Dropping packet: %s', mocker.ANY)])
+
+
+def test_queue_drops(event_loop, mocker):
+    """Test whether packets dropped from a full receive queue are counted"""
+    control = aiobfd.control.Control('127.0.0.1', [], loop=event_loop,
+                                     start=False, intake={'size': 1})
+    mocker.patch('aiobfd.control.log')
+    control.rx_queue.put_nowait((b'data', '127.0.0.2', None))
+    control.rx_queue.put_nowait((b'data', '127.0.0.3', None))
+    assert control.counters['queue_drops'] == 1
+    aiobfd.control.log.info.assert_called_once_with(
+        'Receive queue full, dropping packet from %s.', '127.0.0.3')
+
+
+def test_control_stats(control, valid_data):  # noqa: F811
+    """Test whether dropped packets are counted"""
+    control.process_packet(bitstring.pack(PACKET_FORMAT_TOO_SHORT,
+                                          **valid_data), '127.0.0.1')
+    control.process_packet(bitstring.pack(PACKET_FORMAT, **valid_data),
+                           '127.0.0.2')
+    stats = control.stats()
+    assert stats['rx_packets'] == 2
+    assert stats['invalid_drops'] == 1
+    assert stats['unmatched_drops'] == 1
+    if platform.system() == 'Linux':
+        assert stats['kernel_drops'] == 0
+
+
+@pytest.mark.asyncio
+async def test_control_socket_profile(event_loop):
+    """Test whether the socket profile is applied to all sockets"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.1'], loop=event_loop,
+        socket_profile={'tos': 0x20})
+    socks = [control.server.get_extra_info('socket'),
+             control.sessions[0].client.get_extra_info('socket')]
+    for sock in socks:
+        assert sock.getsockopt(socket.IPPROTO_IP, socket.IP_TOS) == 0x20
+    control.set_socket_profile({'tos': 0xb8})
+    for sock in socks:
+        assert sock.getsockopt(socket.IPPROTO_IP, socket.IP_TOS) == 0xb8
+    control.close()
+
+
+def test_control_size_buffers(control):
+    """Test whether the receive buffer grows with the sessions"""
+    sock = control.server.get_extra_info('socket')
+    before = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    control.sessions[0].rx_interval = 1000
+    control.size_buffers()
+    assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) > before
+    if platform.system() == 'Linux':
+        assert control.stats()['session_drops'] == 0
+        assert control.stats()['kernel_rx_queue'] >= 0
+
+
+def test_control_rx_delay(control, valid_data):  # noqa: F811
+    """Test whether the kernel to processing delay is measured"""
+    rx_time = time.monotonic() - 0.5
+    control.process_packet(bitstring.pack(PACKET_FORMAT, **valid_data),
+                           '127.0.0.1', rx_time)
+    assert control.sessions[0].last_rx_packet_time == rx_time
+    delay = control.stats()['rx_delay']
+    assert delay['last'] >= 0.5
+    assert delay['max'] == delay['last']
+    assert 0 < delay['avg'] < delay['last']
+
+
+@pytest.mark.asyncio
+async def test_control_filter_failure(event_loop, mocker):
+    """Test whether a failure to filter in the kernel is only logged"""
+    mocker.patch('aiobfd.control.protect_socket', side_effect=OSError)
+    mocker.patch('aiobfd.control.log')
+    control = await aiobfd.control.Control.create('127.0.0.1', [],
+                                                  loop=event_loop)
+    aiobfd.control.log.warning.assert_called_once_with(
+        'Unable to set up kernel packet filtering, make sure to drop '
+        'packets with a TTL/HL below %d: %s', 255, mocker.ANY)
+    control.close()
+
+
 def test_valid_remote_your_discr_0(control, valid_data, mocker):  # noqa: F811
     """Inject a valid packet and monitor the log"""
     packet = bitstring.pack(PACKET_FORMAT, **valid_data)
@@ -162,24 +316,880 @@ def test_valid_remote_your_discr_1(control, valid_data, mocker):  # noqa: F811
     control.sessions[0]._tx_packets.cancel()  # pylint: disable=I0011,W0212
 
 
+def test_auth_drops(control, valid_data, mocker):  # noqa: F811
+    """Test whether packets failing authentication are counted and dropped
+       without stopping the receiver"""
+    mocker.patch('aiobfd.control.log')
+    control.sessions[0].set_auth({'type': 'keyed-md5', 'keys': {1: 'secret'}})
+    control.process_packet(bitstring.pack(PACKET_FORMAT, **valid_data),
+                           '127.0.0.1')
+    assert control.stats()['auth_drops'] == 1
+    aiobfd.control.log.info.assert_called_once_with(
+        'Dropping packet from %s: %s', '127.0.0.1', mocker.ANY)
+    control.sessions[0]._tx_packets.cancel()  # pylint: disable=I0011,W0212
+
+
+def test_unchanged_packets(control, valid_data, mocker):  # noqa: F811
+    """Test whether the same packet of an Up session again is not decoded
+       and only refreshes its liveness"""
+    session = control.sessions[0]
+    session.state = aiobfd.session.STATE_UP
+    valid_data['state'] = aiobfd.session.STATE_UP
+    valid_data['your_discr'] = session.local_discr
+    data = bitstring.pack(PACKET_FORMAT, **valid_data).bytes
+    control.process_packet(data, '127.0.0.1', 1)
+    mocker.patch.object(session, 'rx_packet')
+    decode = mocker.patch('aiobfd.control.Packet',
+                          wraps=aiobfd.control.Packet)
+    control.process_packet(data, '127.0.0.1', 2)
+    assert session.last_rx_packet_time == 2
+    assert control.stats()['unchanged_packets'] == 1
+    # Only for the address of the session
+    control.process_packet(data, '127.0.0.2', 3)
+    assert decode.call_count == 1
+    assert session.rx_packet.call_count == 1
+    assert control.stats()['rx_packets'] == 3
+    session._tx_packets.cancel()  # pylint: disable=I0011,W0212
+
+
+@pytest.mark.asyncio  # noqa: F811
+async def test_valid_remote_hostname(event_loop, valid_data):
+    """Packets from the resolved address of a hostname remote match it"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['localhost'], family=socket.AF_INET, loop=event_loop)
+    session = control.sessions[0]
+    session.rx_packet = MagicMock()
+    control.process_packet(bitstring.pack(PACKET_FORMAT, **valid_data),
+                           '127.0.0.1')
+    assert session.rx_packet.call_count == 1
+    assert session.rx_packet.call_args[0][0].source == '127.0.0.1'
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio  # noqa: F811
+async def test_refresh_remotes(control, mocker):
+    """A remote that resolves to a new address is re-indexed"""
+    session = control.sessions[0]
+    session.remote_numeric = False
+
+    async def moved():
+        session.remote_addr = ('127.0.0.9', aiobfd.control.CONTROL_PORT)
+        return True
+    session.resolve_remote = moved
+    sleep = mocker.patch('asyncio.sleep', new_callable=AsyncMock)
+    sleep.side_effect = ErrorAfter(1)
+    with pytest.raises(CallableExhausted):
+        await control.refresh_remotes()
+    assert control._demux == {  # pylint: disable=I0011,W0212
+        session.local_discr: session,
+        (None, '127.0.0.1', False, '127.0.0.9'): session}
+
+
 @pytest.mark.asyncio  # noqa: F811
 async def test_rx_packets(control, valid_data):
     """Test the Rx Packets loop"""
     control.process_packet = MagicMock(side_effect=ErrorAfter(1))
-    await control.rx_queue.put((valid_data, '127.0.0.1'))
-    await control.rx_queue.put((valid_data, '127.0.0.1'))
+    control.rx_queue.put_nowait((valid_data, '127.0.0.1', None))
+    control.rx_queue.put_nowait((valid_data, '127.0.0.1', None))
     with pytest.raises(CallableExhausted):
         await control.rx_packets()
 
 
 def test_run(control, mocker):  # noqa: F811
-    """Run the control loop"""
+    """Run the control loop until interrupted, draining the sessions"""
     mocker.patch('aiobfd.control.log')
-    mocker.patch.object(control.loop, 'run_forever')
-    control.loop.run_forever.side_effect = InterruptAfter(0)
+    control.drain_settings['hold'] = 0
+
+    def interrupt():
+        """Simulate pressing Ctrl-C"""
+        raise KeyboardInterrupt
+    control.loop.call_soon(interrupt)
     control.run()
+    aiobfd.control.log.warning.assert_any_call('BFD Daemon fully configured.')
+    aiobfd.control.log.info.assert_any_call('Keyboard interrupt detected.')
+    aiobfd.control.log.warning.assert_any_call('Drained %d BFD sessions.', 1)
+    assert not control.sessions
+    assert control.loop.is_closed()
+
+
+def session_config(remote, **kwargs):
+    """Session configuration as produced by aiobfd.config"""
+    config = {'local': '127.0.0.1', 'remote': remote, 'passive': False,
+              'family': socket.AF_UNSPEC, 'tx_interval': 1000000,
+              'rx_interval': 1000000, 'detect_mult': 3}
+    config.update(kwargs)
+    return config
+
+
+@pytest.mark.asyncio  # noqa: F811
+async def test_reconfigure_unchanged(control, mocker):
+    """Reapplying the running configuration leaves the session alone"""
+    session = control.sessions[0]
+    mocker.patch.object(session, 'retime')
+    await control.reconfigure([session_config('127.0.0.1')])
+    assert control.sessions == [session]
+    session.retime.assert_not_called()
+
+
+@pytest.mark.asyncio  # noqa: F811
+async def test_reconfigure_retime(control, mocker):
+    """Changed timers retime the running session in place"""
+    session = control.sessions[0]
+    mocker.patch.object(session, 'retime')
+    await control.reconfigure([session_config('127.0.0.1', tx_interval=50000)])
+    assert control.sessions == [session]
+    session.retime.assert_called_once_with(50000, 1000000, 3)
+
+
+@pytest.mark.asyncio  # noqa: F811
+async def test_reconfigure_add_remove(control, mocker):
+    """New peers are created and removed peers are torn down"""
+    session = control.sessions[0]
+    mocker.patch.object(session, 'shutdown')
+    await control.reconfigure([session_config('127.0.0.2')])
+    session.shutdown.assert_called_once_with()
+    assert len(control.sessions) == 1
+    assert control.sessions[0].remote == '127.0.0.2'
+
+
+@pytest.mark.asyncio  # noqa: F811
+async def test_reconfigure_family(control, mocker):
+    """A changed address family recreates the session"""
+    session = control.sessions[0]
+    mocker.patch.object(session, 'shutdown')
+    await control.reconfigure(
+        [session_config('127.0.0.1', family=socket.AF_INET)])
+    session.shutdown.assert_called_once_with()
+    assert control.sessions[0] is not session
+    assert control.sessions[0].family == socket.AF_INET
+
+
+@pytest.mark.asyncio
+async def test_control_create(event_loop):
+    """Create a Control process from within a running loop"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.2', '127.0.0.3'], loop=event_loop)
+    assert sorted(s.remote for s in control.sessions) == \
+        ['127.0.0.2', '127.0.0.3']
+    assert control.server.get_extra_info('sockname')[1] == \
+        aiobfd.control.CONTROL_PORT
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.fixture()
+def dynamic_packet(valid_data):  # noqa: F811
+    """Packet from a remote in the Down state that has no session yet"""
+    valid_data['state'] = aiobfd.session.STATE_DOWN
+    return bitstring.pack(PACKET_FORMAT, **valid_data)
+
+
+def test_listening(event_loop):
+    """Test which remotes may bring up a session on demand"""
+    control = aiobfd.control.Control(
+        '127.0.0.1', [], loop=event_loop, start=False,
+        listen={'prefixes': ['127.0.0.0/30', '2001:db8::/32']})
+    assert control.listening('127.0.0.2')
+    assert control.listening('::ffff:127.0.0.2')
+    assert control.listening('2001:db8::1')
+    assert not control.listening('127.0.0.5')
+    assert not control.listening('not an address')
+    control.set_listen(None)
+    assert not control.listening('127.0.0.2')
+
+
+@pytest.mark.asyncio
+async def test_dynamic_session(event_loop, dynamic_packet):
+    """Test whether a packet from an allowed remote creates a session"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', [], loop=event_loop,
+        listen={'prefixes': ['127.0.0.0/8'], 'detect_mult': 5})
+    control.process_packet(dynamic_packet, '127.0.0.5')
+    control.process_packet(dynamic_packet, '127.0.0.5')
+    await asyncio.sleep(0.01)
+    assert len(control.sessions) == 1
+    session = control.sessions[0]
+    assert (session.remote, session.passive, session.detect_mult) == \
+        ('127.0.0.5', True, 5)
+    assert session.state == aiobfd.session.STATE_INIT
+    assert control.stats()['dynamic_sessions'] == 1
+    control.process_packet(dynamic_packet, '10.0.0.1')
+    await asyncio.sleep(0.01)
+    assert len(control.sessions) == 1
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_dynamic_session_evict(event_loop, dynamic_packet):
+    """Test whether a full table makes room by evicting sessions that are
+       not Up, least recently active first"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', [], loop=event_loop,
+        listen={'prefixes': ['127.0.0.0/8'], 'max_sessions': 2})
+    for source in ('127.0.0.5', '127.0.0.6', '127.0.0.5'):
+        control.process_packet(dynamic_packet, source)
+        await asyncio.sleep(0.01)
+    control.process_packet(dynamic_packet, '127.0.0.7')
+    await asyncio.sleep(0.01)
+    assert sorted(s.remote for s in control.sessions) == \
+        ['127.0.0.5', '127.0.0.7']
+
+    for session in control.sessions:
+        session.state = aiobfd.session.STATE_UP
+    control.process_packet(dynamic_packet, '127.0.0.8')
+    await asyncio.sleep(0.01)
+    assert len(control.sessions) == 2
+    assert control.stats()['table_full_drops'] == 1
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_dynamic_session_rate(event_loop, dynamic_packet):
+    """Test whether new sessions are admitted at a bounded rate"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', [], loop=event_loop,
+        listen={'prefixes': ['127.0.0.0/8'], 'rate': 1})
+    control.process_packet(dynamic_packet, '127.0.0.5')
+    control.process_packet(dynamic_packet, '127.0.0.6')
+    await asyncio.sleep(0.01)
+    assert len(control.sessions) == 1
+    assert control.stats()['admission_drops'] == 1
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_dynamic_session_churn(event_loop, dynamic_packet):
+    """Test whether evicted sessions release all their resources"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', [], loop=event_loop,
+        listen={'prefixes': ['127.0.0.0/8'], 'max_sessions': 10,
+                'rate': 1000})
+    tasks = len(asyncio.all_tasks())
+    for i in range(100):
+        control.process_packet(dynamic_packet, '127.0.1.%d' % i)
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.01)
+    assert len(control.sessions) == 10
+    assert len(control._demux) == 2 * 10  # pylint: disable=W0212
+    assert len(asyncio.all_tasks()) == tasks + 2 * 10
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_expire_dynamic(event_loop, dynamic_packet, mocker):
+    """Test whether idle dynamic sessions that are not Up expire"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', [], loop=event_loop,
+        listen={'prefixes': ['127.0.0.0/8'], 'idle_time': 0})
+    for source in ('127.0.0.5', '127.0.0.6'):
+        control.process_packet(dynamic_packet, source)
+    await asyncio.sleep(0.01)
+    control.sessions[0].state = aiobfd.session.STATE_UP
+    up = control.sessions[0]
+    sleep = mocker.patch('aiobfd.control.asyncio.sleep',
+                         new_callable=AsyncMock)
+    sleep.side_effect = ErrorAfter(1)
+    with pytest.raises(CallableExhausted):
+        await control.expire_dynamic()
+    assert control.sessions == [up]
+    control.close()
+
+
+@pytest.mark.asyncio
+async def test_reconfigure_dynamic(event_loop, dynamic_packet):
+    """Test whether configured peers take over dynamic sessions, which are
+       otherwise left alone"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', [], loop=event_loop,
+        listen={'prefixes': ['127.0.0.0/8']})
+    for source in ('127.0.0.5', '127.0.0.6'):
+        control.process_packet(dynamic_packet, source)
+    await asyncio.sleep(0.01)
+    await control.reconfigure([session_config('127.0.0.5')])
+    assert sorted(s.remote for s in control.sessions) == \
+        ['127.0.0.5', '127.0.0.6']
+    assert control.stats()['dynamic_sessions'] == 1
+    control.set_listen({'prefixes': ['127.0.0.4/32']})
+    assert [s.remote for s in control.sessions] == ['127.0.0.5']
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_control_listeners_damping(event_loop, mocker):
+    """Test whether listeners and damping are set up for new sessions"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', [], loop=event_loop)
+    listener = mocker.Mock()
+    control.listeners.append(listener)
+    await control.reconfigure([session_config('127.0.0.2', damping={})])
+    session = control.sessions[0]
+    session.state = aiobfd.session.STATE_INIT
+    listener.assert_called_once_with(session, aiobfd.session.STATE_INIT)
+    for _ in range(3):
+        session.state = aiobfd.session.STATE_UP
+        session.state = aiobfd.session.STATE_DOWN
+    assert control.stats()['suppressed_sessions'] == 1
+    assert control.damping_state()['127.0.0.2']['flaps'] == 3
+
+    await control.reconfigure([session_config('127.0.0.2', damping=None)])
+    assert control.damping_state() == {}
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_drain(event_loop, mocker):
+    """Test whether drained sessions go AdminDown and repeat that in
+       batches, skipping passive sessions that never heard from the remote"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', [], loop=event_loop,
+        drain={'hold': 0.05, 'interval': 0.01, 'batch': 1})
+    await control.reconfigure([session_config('127.0.0.2'),
+                               session_config('127.0.0.3', passive=True),
+                               session_config('127.0.0.4')])
+    for session in control.sessions:
+        mocker.patch.object(session, 'tx_packet')
+    await control.drain(['127.0.0.2', '127.0.0.3'])
+    first, passive, other = control.sessions
+    assert first.state == aiobfd.session.STATE_ADMIN_DOWN
+    assert first.local_diag == aiobfd.session.DIAG_ADMIN_DOWN
+    assert first.tx_packet.call_count >= 3
+    assert passive.state == aiobfd.session.STATE_ADMIN_DOWN
+    passive.tx_packet.assert_not_called()
+    assert other.state == aiobfd.session.STATE_DOWN
+    assert control.stats()['drained_sessions'] == 2
+
+    control.undrain(['127.0.0.2'])
+    assert first.state == aiobfd.session.STATE_DOWN
+    control.undrain()
+    assert control.stats()['drained_sessions'] == 0
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_drain_remote_converges(event_loop):
+    """Test whether a remote goes Down on the first AdminDown packet"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', [], loop=event_loop, drain={'hold': 0})
+    await control.reconfigure([session_config('127.0.0.2')])
+    local = control.sessions[0]
+    remote = aiobfd.session.Session('127.0.0.1', '127.0.0.2', start=False)
+    remote._state = aiobfd.session.STATE_UP  # pylint: disable=I0011,W0212
+    sent = []
+    local.tx_packet = lambda final=False: sent.append(
+        local.encode_packet(final))
+    await control.drain()
+    packet = aiobfd.packet.Packet(sent[0], '127.0.0.1')
+    remote.rx_packet(packet)
+    assert remote.state == aiobfd.session.STATE_DOWN
+    assert remote.local_diag == aiobfd.session.DIAG_NEIGHBOR_SIGNAL_DOWN
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_terminate(event_loop, mocker):
+    """Test whether terminating drains once and then stops the loop"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', [], loop=event_loop, drain={'hold': 0})
+    mocker.patch.object(control, 'drain', AsyncMock())
+    # The test itself needs a working loop.stop() once it is done
+    with patch.object(control.loop, 'stop') as stop:
+        control.terminate()
+        control.terminate()
+        await asyncio.sleep(0.01)
+    control.drain.assert_called_once_with()
+    stop.assert_called_once_with()
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_persist_resume(event_loop, tmpdir, mocker):
+    """Test whether sessions saved by one process are resumed by the next,
+       and found by their old discriminator"""
+    persist = {'path': str(tmpdir.join('state.json'))}
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.2', '127.0.0.3'], loop=event_loop,
+        persist=persist)
+    session = control.sessions[0]
+    session.remote_discr = 1234
+    session.state = aiobfd.session.STATE_UP
+    await control.save_state()
+    control.close()
+    await asyncio.sleep(0)
+
+    mocker.patch('aiobfd.control.log')
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.2', '127.0.0.3'], loop=event_loop,
+        persist=persist)
+    resumed, fresh = control.sessions
+    assert resumed.state == aiobfd.session.STATE_UP
+    assert resumed.local_discr == session.local_discr
+    assert resumed.remote_discr == 1234
+    assert fresh.state == aiobfd.session.STATE_DOWN
+    assert control.stats()['resumed_sessions'] == 1
+    packet = bitstring.pack(PACKET_FORMAT, version=1, diag=0, state=3,
+                            poll=0, final=0, control_plane_independent=0,
+                            authentication_present=0, demand_mode=0,
+                            multipoint=0, detect_mult=3, length=24,
+                            my_discr=1234, your_discr=session.local_discr,
+                            desired_min_tx_interval=1000000,
+                            required_min_rx_interval=1000000,
+                            required_min_echo_rx_interval=0).bytes
+    assert control.admit(packet, '127.0.0.2') is True
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_persist_periodic(event_loop, tmpdir):
+    """Test whether the state is saved periodically"""
+    path = tmpdir.join('state.json')
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.2'], loop=event_loop,
+        persist={'path': str(path), 'interval': 0.01})
+    await asyncio.sleep(0.1)
+    assert path.check()
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_takeover(event_loop, tmpdir, mocker):
+    """Test whether a new process takes over the sockets and sessions and
+       the old one exits only once the new one is transmitting"""
+    path = str(tmpdir.join('aiobfd.sock'))
+    old = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.2', '127.0.0.3'], loop=event_loop,
+        bind=[{'local': '127.0.0.5'}], takeover_socket=path)
+    old.finish_takeover()
+    session = old.sessions[0]
+    session.remote_discr = 1234
+    session.state = aiobfd.session.STATE_UP
+    source = session.client.get_extra_info('sockname')
+
+    mocker.patch.object(old, 'terminate')
+    new = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.2', '127.0.0.4'], loop=event_loop,
+        bind=[{'local': '127.0.0.5'}], takeover_socket=path, take_over=True)
+    taken, fresh = new.sessions
+    assert taken.state == aiobfd.session.STATE_UP
+    assert taken.local_discr == session.local_discr
+    assert taken.client.get_extra_info('sockname') == source
+    assert fresh.state == aiobfd.session.STATE_DOWN
+    assert new.server.get_extra_info('sockname')[1] == 3784
+    assert new.echo.sock.getsockname()[1] == aiobfd.echo.ECHO_PORT
+    # Taken over as well, the old process still has it bound
+    assert new.stats()['listeners'] == 2
+    old.terminate.assert_not_called()
+    # Packets wait for the new process, the old one stopped receiving
+    assert not old.server.is_reading()
+    assert session._detect_async_failure.cancelled()
+
+    new.finish_takeover()
+    await asyncio.sleep(0.01)
+    old.terminate.assert_called_once_with(drain=False)
+    for control in (old, new):
+        control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_takeover_aborted(event_loop, tmpdir, mocker):
+    """Test whether the old process carries on if the new one goes away"""
+    path = str(tmpdir.join('aiobfd.sock'))
+    old = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.2'], loop=event_loop, takeover_socket=path)
+    old.finish_takeover()
+    mocker.patch.object(old, 'terminate')
+    mocker.patch('aiobfd.control.log')
+    handover = await event_loop.run_in_executor(
+        None, aiobfd.takeover.connect_takeover, path)
+    handover.conn.close()
+    handover.close()
+    await asyncio.sleep(0.01)
+    old.terminate.assert_not_called()
+    aiobfd.control.log.error.assert_called_once_with(
+        'Takeover by a new process failed: %s', mocker.ANY)
+    assert old.server.is_reading()
+    assert not old.sessions[0]._detect_async_failure.done()
+    old.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_apply_timers(event_loop, mocker):
+    """Test whether new timers are applied at the given rate and sessions
+       that don't confirm them are reported"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.2', '127.0.0.3', '127.0.0.4'],
+        loop=event_loop)
+    first, second, unchanged = control.sessions
+    unchanged.retime(300000, 300000, 3)
+    mocker.patch.object(unchanged, 'retime')
+    task = asyncio.ensure_future(control.apply_timers(
+        300000, 300000, 3, rate=20, timeout=0.2))
+    await asyncio.sleep(0.01)
+    assert first.required_min_rx_interval == 300000
+    assert second.required_min_rx_interval == 1000000
+    final = bitstring.pack(PACKET_FORMAT, version=1, diag=0, state=1,
+                           poll=0, final=1, control_plane_independent=0,
+                           authentication_present=0, demand_mode=0,
+                           multipoint=0, detect_mult=3, length=24,
+                           my_discr=1234, your_discr=first.local_discr,
+                           desired_min_tx_interval=1000000,
+                           required_min_rx_interval=1000000,
+                           required_min_echo_rx_interval=0).bytes
+    first.rx_packet(aiobfd.packet.Packet(final, '127.0.0.2'))
+    assert await task == ['127.0.0.3']
+    assert second.required_min_rx_interval == 300000
+    unchanged.retime.assert_not_called()
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_verify(event_loop):
+    """Test whether the remotes of Up sessions are verified with a Poll
+       Sequence and those that don't answer are reported"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.2', '127.0.0.3', '127.0.0.4'],
+        demand_mode=True, loop=event_loop)
+    first, second, down = control.sessions
+    for session in (first, second):
+        session.desired_min_tx_interval = 10000
+        session.remote_state = aiobfd.session.STATE_UP
+        session.state = aiobfd.session.STATE_UP
+        session.poll_sequence = False
+    assert control.stats()['demand_sessions'] == 2
+    task = asyncio.ensure_future(control.verify(rate=1000))
+    while not (first.poll_sequence and second.poll_sequence):
+        await asyncio.sleep(0.001)
+    assert not down.poll_sequence
+    final = bitstring.pack(PACKET_FORMAT, version=1, diag=0, state=3,
+                           poll=0, final=1, control_plane_independent=0,
+                           authentication_present=0, demand_mode=0,
+                           multipoint=0, detect_mult=3, length=24,
+                           my_discr=1234, your_discr=first.local_discr,
+                           desired_min_tx_interval=10000,
+                           required_min_rx_interval=10000,
+                           required_min_echo_rx_interval=0).bytes
+    first.rx_packet(aiobfd.packet.Packet(final, '127.0.0.2'))
+    assert await task == ['127.0.0.3']
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_retime_rate(event_loop, mocker):
+    """Test whether a rate that can't pace the Poll Sequences is refused
+       before any session is touched"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.2'], loop=event_loop)
+    mocker.patch.object(control, '_select')
+    for rate in (0, -1):
+        with pytest.raises(ValueError):
+            await control.apply_timers(300000, 300000, 3, rate=rate)
+        with pytest.raises(ValueError):
+            await control.verify(rate=rate)
+    control._select.assert_not_called()  # pylint: disable=I0011,W0212
+    control.close()
+    await asyncio.sleep(0)
+
+
+def test_new_event_loop():
+    """Test whether the event loop of the given implementation is
+       installed"""
+    loop = aiobfd.control.new_event_loop('asyncio')
+    try:
+        assert isinstance(loop, asyncio.AbstractEventLoop)
+        assert asyncio.get_event_loop() is loop
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def test_new_event_loop_invalid():
+    """Test whether an unknown event loop is rejected"""
+    with pytest.raises(ValueError):
+        aiobfd.control.new_event_loop('trio')
+
+
+def test_new_event_loop_uvloop():
+    """Test whether uvloop is installed when requested"""
+    uvloop = pytest.importorskip('uvloop')
+    loop = aiobfd.control.new_event_loop('uvloop')
+    try:
+        assert isinstance(loop, uvloop.Loop)
+    finally:
+        asyncio.set_event_loop(None)
+        asyncio.set_event_loop_policy(None)
+        loop.close()
+
+
+@pytest.mark.asyncio
+async def test_control_loop(event_loop):
+    """Test whether the control process and its sessions run on the loop
+       they were given"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.2'], loop=event_loop)
+    assert control.loop is event_loop
+    assert control.sessions[0].loop is event_loop
+    assert control.rx_queue.loop is event_loop
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_echo(event_loop):
+    """Test whether Echo packets looped back are matched to their session
+       and their round trip time is reported"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.1'], loop=event_loop,
+        echo_tx_interval=10000, echo_rx_interval=10000, echo_aiobfd=True)
+    session = control.sessions[0]
+    # Up with itself, so its own Echo socket loops back the Echo packets
+    session.remote_discr = session.local_discr
+    session.remote_min_echo_rx_interval = 10000
+    session.remote_state = aiobfd.session.STATE_UP
+    session.state = aiobfd.session.STATE_UP
+    assert session.echo_active
+    await asyncio.sleep(0.05)
+    stats = control.stats()
+    assert stats['echo_sessions'] == 1
+    assert stats['echo_tx_packets'] >= 3
+    assert stats['echo_rx_packets'] >= 3
+    assert 0 < control.echo_rtt()['127.0.0.1']['max'] < 0.05
+    assert session.state == aiobfd.session.STATE_UP
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_echo_reflect(event_loop):
+    """Test whether Echo packets of an Up remote are looped back to it"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.2'], loop=event_loop, echo_rx_interval=10000,
+        echo_aiobfd=True)
+    remote = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    remote.bind(('127.0.0.2', 0))
+    remote.settimeout(0.01)
+    remote.sendto(b'Echo', ('127.0.0.1', aiobfd.echo.ECHO_PORT))
+    await asyncio.sleep(0.01)
+    with pytest.raises(socket.timeout):
+        remote.recv(64)
+
+    control.sessions[0].state = aiobfd.session.STATE_UP
+    remote.sendto(b'Echo', ('127.0.0.1', aiobfd.echo.ECHO_PORT))
+    await asyncio.sleep(0.01)
+    assert remote.recv(64) == b'Echo'
+    assert control.stats()['echo_reflected_packets'] == 1
+    remote.close()
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_multihop(event_loop):
+    """Test whether packets of multihop sessions are received on their own
+       port and matched by the local and remote address pair"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.1'], loop=event_loop, multihop=True,
+        multihop_settings={'max_hops': 5})
+    session = control.sessions[0]
+    assert control.multihop_server.get_extra_info('sockname')[1] == \
+        aiobfd.session.MULTIHOP_PORT
+    # Its own first packet, sent to itself
+    data, source, rx_time, ingress = await asyncio.wait_for(
+        control.rx_queue.get(), 1)
+    assert (source, ingress) == ('127.0.0.1', (None, '127.0.0.1', True))
+    control.process_packet(data, source, rx_time)
+    assert control.stats()['unmatched_drops'] == 1
+    control.process_packet(data, source, rx_time, ingress)
+    assert session.remote_discr == session.local_discr
+    assert control.stats()['multihop_sessions'] == 1
+    control.remove_session(session)
+    assert not control._demux  # pylint: disable=I0011,W0212
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_gc_freeze(event_loop, mocker):
+    """Test whether objects are frozen after startup and configuration
+       loads, and pauses are reported"""
+    freeze = mocker.patch('aiobfd.pauses.gc.freeze', create=True)
+    mocker.patch('aiobfd.pauses.gc.get_freeze_count', create=True,
+                 return_value=100)
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', [], loop=event_loop, gc={'freeze': True})
+    assert freeze.call_count == 1
+    await control.reconfigure([])
+    assert freeze.call_count == 2
+    stats = control.stats()
+    assert stats['gc_pause']['frozen'] == 100
+    assert set(stats['loop_lag']) == {'last', 'avg', 'max'}
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_pacing(event_loop):
+    """Test whether sessions share the pacer and their packets are counted
+       as bursts"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.2', '127.0.0.3'], loop=event_loop,
+        pacing={'stagger': True})
+    assert control.sessions[0].pacer is control.pacer
+    assert control.sessions[1].pacer is control.pacer
+    control.set_pacing({'max_pps': 1000})
+    assert (control.pacer.stagger, control.pacer.max_pps) == (False, 1000)
+    await asyncio.sleep(0)
+    control.sessions[0].tx_packet()
+    control.sessions[1].tx_packet()
+    await asyncio.sleep(0)
+    assert control.stats()['tx_burst']['last'] == 2
+    control.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_timers(event_loop, mocker):
+    """Test whether sessions share the timerfd, and asyncio's timers are
+       used where it is not available"""
+    with pytest.raises(ValueError):
+        aiobfd.control.Control('127.0.0.1', [], loop=event_loop, start=False,
+                               timers='select')
+    mocker.patch('aiobfd.control.log')
+    mocker.patch('aiobfd.timers.timerfd_create',
+                 side_effect=OSError('timerfd is not available'))
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.2'], loop=event_loop, timers='timerfd')
+    assert control.timer is None
+    assert control.sessions[0].timer is None
     aiobfd.control.log.warning.assert_called_once_with(
-        'BFD Daemon fully configured.')
-    aiobfd.control.log.info.assert_called_once_with(
-        'Keyboard interrupt detected.')
-    control.sessions[0]._tx_packets.cancel()  # pylint: disable=I0011,W0212
+        'Unable to use timerfd timers, falling back to asyncio: %s',
+        mocker.ANY)
+    control.close()
+    await asyncio.sleep(0)
+    if platform.system() != 'Linux':
+        return
+
+    mocker.stopall()
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.2'], loop=event_loop, timers='timerfd')
+    assert isinstance(control.timer, aiobfd.timers.TimerFd)
+    assert control.sessions[0].timer is control.timer
+    timer = control.timer
+    control.close()
+    assert control.timer is None
+    assert timer._fd is None  # pylint: disable=I0011,W0212
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_listeners(event_loop, valid_data):  # noqa: F811
+    """Test whether sessions on other local addresses and devices get their
+       own listener and only accept packets received on it"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.1'], loop=event_loop, tx_interval=10000,
+        bind=[{'local': '127.0.0.3'}])
+    assert control.stats()['listeners'] == 2
+    session = await control.add_session('127.0.0.2', '127.0.0.2',
+                                        tx_interval=10000)
+    assert session.ingress == (None, '127.0.0.2', False)
+    assert session.echo is None
+    assert control.stats()['listeners'] == 3
+    await asyncio.sleep(0.05)
+    while not control.rx_queue.empty():
+        control.process_packet(*control.rx_queue.get_nowait())
+    for each in control.sessions:
+        assert each.remote_discr == each.local_discr
+
+    # Packets for the session arriving on the listener of `local`
+    unmatched = control.stats()['unmatched_drops']
+    valid_data['your_discr'] = session.local_discr
+    control.process_packet(bitstring.pack(PACKET_FORMAT, **valid_data),
+                           '127.0.0.2')
+    valid_data['your_discr'] = 0
+    control.process_packet(bitstring.pack(PACKET_FORMAT, **valid_data),
+                           '127.0.0.2')
+    assert control.stats()['unmatched_drops'] == unmatched + 2
+
+    try:
+        session = await control.add_session('127.0.0.4', '127.0.0.4',
+                                            device='lo')
+    except PermissionError:
+        pytest.skip('Binding to a device requires CAP_NET_RAW')
+    finally:
+        control.close()
+        await asyncio.sleep(0)
+    assert session.ingress == ('lo', '127.0.0.4', False)
+    assert control.stats()['listeners'] == 4
+
+
+@pytest.mark.asyncio
+async def test_wildcard_duplicate(event_loop, mocker):
+    """Test whether a second multihop session to a remote from another
+       address under a wildcard `local` is refused, as its packets can't be
+       told apart"""
+    control = await aiobfd.control.Control.create(
+        '0.0.0.0', [], loop=event_loop)
+    mocker.patch('aiobfd.control.log')
+    try:
+        first = await control.add_session('127.0.0.1', '127.0.0.2',
+                                          multihop=True)
+        second = await control.add_session('127.0.0.3', '127.0.0.2',
+                                           multihop=True)
+        other = await control.add_session('127.0.0.3', '127.0.0.4',
+                                          multihop=True)
+    finally:
+        control.close()
+        await asyncio.sleep(0)
+    assert second is None
+    assert first.ingress == other.ingress == (None, '0.0.0.0', True)
+    aiobfd.control.log.error.assert_called_once_with(
+        'Not creating a BFD session for %s from %s, its packets arrive on '
+        'the same socket as those of the session from %s.', '127.0.0.2',
+        '127.0.0.3', '127.0.0.1')
+
+
+@pytest.mark.asyncio
+async def test_sbfd(event_loop):
+    """Test whether an S-BFD initiator comes Up through the reflector of its
+       own control process, and goes down when it is drained"""
+    control = await aiobfd.control.Control.create(
+        '127.0.0.1', ['127.0.0.1'], loop=event_loop, tx_interval=10000,
+        rx_interval=10000, reflector_discr=1,
+        reflector={'discriminators': [1]})
+    session = control.sessions[0]
+    assert isinstance(session, aiobfd.sbfd.Initiator)
+    # Not demultiplexed by the control socket
+    assert not control._demux  # pylint: disable=I0011,W0212
+    await asyncio.sleep(0.05)
+    assert session.state == aiobfd.session.STATE_UP
+    stats = control.stats()
+    assert stats['sbfd_sessions'] == 1
+    assert stats['reflected_packets'] >= 2
+    assert stats['rx_packets'] == 0
+    await control.drain(hold=0)
+    assert control.reflector.state == aiobfd.session.STATE_ADMIN_DOWN
+    control.undrain()
+    assert control.reflector.state == aiobfd.session.STATE_UP
+
+    await control.reconfigure([{'local': '127.0.0.1', 'remote': '127.0.0.1',
+                                'family': socket.AF_UNSPEC, 'passive': False,
+                                'tx_interval': 10000, 'rx_interval': 10000,
+                                'detect_mult': 3}])
+    assert not isinstance(control.sessions[0], aiobfd.sbfd.Initiator)
+    control.close()
+    assert not control.reflector.running
+    await asyncio.sleep(0)
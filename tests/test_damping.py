@@ -0,0 +1,61 @@
+"""Test aiobfd/damping.py"""
+# pylint: disable=I0011,W0621
+
+import pytest
+import aiobfd.damping
+
+
+@pytest.fixture()
+def damping():
+    """Damping with the default settings, starting at time 0"""
+    damping = aiobfd.damping.Damping()
+    damping._updated = 0  # pylint: disable=I0011,W0212
+    return damping
+
+
+def test_damping_decay(damping):
+    """Test whether the penalty halves every half-life"""
+    damping.flap(0)
+    assert damping.penalty(0) == 1000
+    assert damping.penalty(15) == pytest.approx(500)
+    assert damping.penalty(30) == pytest.approx(250)
+
+
+def test_damping_suppress(damping):
+    """Test whether repeated flaps suppress until the penalty decays below
+       the reuse threshold"""
+    assert not damping.flap(0)
+    assert not damping.flap(0)
+    assert damping.flap(0)
+    assert damping.suppressed
+    assert not damping.flap(1)
+    assert damping.flaps == 4
+    reuse_in = damping.reuse_in(1)
+    assert damping.penalty(1 + reuse_in) == pytest.approx(750)
+    assert not damping.update(reuse_in)
+    assert damping.update(1 + reuse_in + 0.01)
+    assert not damping.suppressed
+
+
+def test_damping_ceiling(damping):
+    """Test whether a session is never suppressed beyond max_suppress"""
+    for _ in range(100):
+        damping.flap(0)
+    assert damping.reuse_in(0) == pytest.approx(60)
+
+
+def test_damping_state(damping):
+    """Test the exported damping state"""
+    for _ in range(3):
+        damping.flap(0)
+    assert damping.state(0) == {'penalty': 3000, 'flaps': 3,
+                                'suppressed': True,
+                                'reuse_in': pytest.approx(30)}
+
+
+def test_damping_invalid():
+    """Test whether inconsistent settings raise an exception"""
+    with pytest.raises(ValueError):
+        aiobfd.damping.Damping(suppress=500, reuse=750)
+    with pytest.raises(ValueError):
+        aiobfd.damping.Damping(half_life=0)
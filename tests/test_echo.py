@@ -0,0 +1,110 @@
+"""Test aiobfd/echo.py"""
+# pylint: disable=I0011,W0621,W0212
+
+import asyncio
+import struct
+import pytest
+import aiobfd.echo
+
+
+@pytest.fixture()
+def echo(event_loop, mocker):
+    """Echo function with a mocked transport and no sessions"""
+    echo = aiobfd.echo.Echo(event_loop, mocker.Mock(return_value=None),
+                            mocker.Mock(return_value=False))
+    echo.transport = mocker.Mock()
+    yield echo
+    echo.close()
+
+
+class EchoSession:  # pylint: disable=I0011,R0903
+    """Session that has the Echo function active"""
+    def __init__(self, discr, interval=10000):
+        self.echo_active = True
+        self.echo_interval = interval
+        self.local_discr = discr
+        self.remote_addr = ('127.0.0.2', 3784)
+
+
+@pytest.mark.asyncio
+async def test_echo_schedule(echo):
+    """Test whether Echo packets are sent at the session's interval, and
+       stop once the Echo function is no longer active"""
+    session = EchoSession(1, 20000)
+    echo.schedule(session)
+    echo.schedule(session)
+    await asyncio.sleep(0.001)
+    assert echo.transport.sendto.call_count == 1
+    data, addr = echo.transport.sendto.call_args[0]
+    assert addr == ('127.0.0.2', aiobfd.echo.ECHO_PORT)
+    magic, token, discr, _ = struct.unpack(aiobfd.echo.ECHO_FORMAT, data)
+    assert (magic, token, discr) == (aiobfd.echo.ECHO_MAGIC, echo.token, 1)
+    await asyncio.sleep(0.05)
+    assert 2 <= echo.transport.sendto.call_count <= 4
+    session.echo_active = False
+    await asyncio.sleep(0.03)
+    sent = echo.transport.sendto.call_count
+    await asyncio.sleep(0.03)
+    assert echo.transport.sendto.call_count == sent
+    assert session not in echo._scheduled
+
+
+@pytest.mark.asyncio
+async def test_echo_batched(echo, mocker, event_loop):
+    """Test whether sessions that are due together share a wakeup"""
+    sessions = [EchoSession(discr) for discr in range(1, 101)]
+    for session in sessions:
+        echo.schedule(session)
+    timers = mocker.spy(event_loop, 'call_at')
+    await asyncio.sleep(0.025)
+    assert echo.counters['echo_tx_packets'] >= 200
+    assert timers.call_count <= 5
+
+
+@pytest.mark.asyncio
+async def test_echo_unschedule(echo):
+    """Test whether a session can be stopped and started again without
+       sending twice as many Echo packets"""
+    session = EchoSession(1, 20000)
+    echo.schedule(session)
+    echo.unschedule(session)
+    echo.schedule(session)
+    await asyncio.sleep(0.05)
+    assert 2 <= echo.transport.sendto.call_count <= 4
+    echo.unschedule(session)
+    sent = echo.transport.sendto.call_count
+    await asyncio.sleep(0.03)
+    assert echo.transport.sendto.call_count == sent
+
+
+@pytest.mark.asyncio
+async def test_echo_received(echo, mocker):
+    """Test whether our Echo packets coming back reach their session"""
+    session = mocker.Mock()
+    echo.lookup.side_effect = {7: session}.get
+    data = struct.pack(aiobfd.echo.ECHO_FORMAT, aiobfd.echo.ECHO_MAGIC,
+                       echo.token, 7, 1000000000)
+    echo.datagram_received(data, ('127.0.0.2', 3785))
+    session.echo_received.assert_called_once_with(1.0, mocker.ANY)
+    echo.transport.sendto.assert_not_called()
+    assert echo.counters['echo_rx_packets'] == 1
+
+    data = struct.pack(aiobfd.echo.ECHO_FORMAT, aiobfd.echo.ECHO_MAGIC,
+                       echo.token, 8, 1000000000)
+    echo.datagram_received(data, ('127.0.0.2', 3785))
+    assert echo.counters['echo_unmatched_drops'] == 1
+
+
+@pytest.mark.asyncio
+async def test_echo_reflect(echo):
+    """Test whether Echo packets of remotes are looped back, only to remotes
+       that may send them"""
+    data = b'Echo packet of another implementation'
+    echo.datagram_received(data, ('127.0.0.2', 49152))
+    echo.transport.sendto.assert_not_called()
+    echo.reflect.return_value = True
+    echo.datagram_received(data, ('127.0.0.2', 49152))
+    echo.transport.sendto.assert_called_once_with(data, ('127.0.0.2', 49152))
+    echo.reflect.assert_called_with('127.0.0.2')
+    assert echo.counters['echo_reflected_packets'] == 1
+    assert echo.counters['echo_unmatched_drops'] == 1
@@ -0,0 +1,77 @@
+"""Test aiobfd/pacing.py"""
+# pylint: disable=I0011,W0621
+
+from unittest.mock import MagicMock
+import pytest
+import aiobfd.pacing
+
+
+@pytest.fixture()
+def loop():
+    """Event loop whose time is set by the test"""
+    loop = MagicMock()
+    loop.time.return_value = 100.0
+    return loop
+
+
+def test_unlimited(loop):
+    """Test whether packets keep their jittered interval without a
+       ceiling"""
+    pacer = aiobfd.pacing.Pacer(loop)
+    assert pacer.first(0.5) == 0
+    for _ in range(100):
+        assert pacer.delay(0.04, 0.05) == 0.04
+    assert pacer.stats()['tx_deferred'] == 0
+
+
+def test_stagger(loop, mocker):
+    """Test whether the first packet goes out within the interval"""
+    pacer = aiobfd.pacing.Pacer(loop, stagger=True)
+    mocker.patch('aiobfd.pacing.random.uniform', return_value=0.3)
+    assert pacer.first(0.5) == 0.3
+
+
+def test_ceiling(loop):
+    """Test whether packets are spread over slots below the ceiling, but
+       never later than they may be sent"""
+    pacer = aiobfd.pacing.Pacer(loop, max_pps=2000)
+    assert (pacer.capacity, pacer.slot) == (2, 0.001)
+    # Six slots of two packets
+    delays = [pacer.delay(0.0404, 0.0454) for _ in range(12)]
+    assert delays[:2] == [0.0404, 0.0404]
+    for delay in delays[2:]:
+        assert 0.0404 < delay <= 0.0454
+    assert sorted(delays) == delays
+    assert max(delays.count(delay) for delay in delays) == 2
+    stats = pacer.stats()
+    assert stats['tx_deferred'] == 10
+    assert stats['tx_overruns'] == 0
+
+    # The window is full
+    assert pacer.delay(0.0404, 0.0454) == 0.0404
+    assert pacer.delay(0.0404, 0.0454) == 0.0404
+    assert pacer.stats()['tx_overruns'] == 2
+
+
+def test_slow_ceiling(loop):
+    """Test whether ceilings below one packet per millisecond get longer
+       slots"""
+    pacer = aiobfd.pacing.Pacer(loop, max_pps=10)
+    assert (pacer.capacity, pacer.slot) == (1, 0.1)
+    pacer.max_pps = 0
+    assert pacer.capacity is None
+
+
+def test_burst(loop):
+    """Test whether packets sent in the same loop iteration are counted as
+       a burst"""
+    pacer = aiobfd.pacing.Pacer(loop)
+    for _ in range(5):
+        pacer.sent()
+    loop.call_soon.assert_called_once_with(pacer._end_burst)
+    pacer._end_burst()  # pylint: disable=I0011,W0212
+    pacer.sent()
+    pacer._end_burst()  # pylint: disable=I0011,W0212
+    burst = pacer.stats()['tx_burst']
+    assert burst['last'] == 1
+    assert burst['max'] == 5
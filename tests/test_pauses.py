@@ -0,0 +1,106 @@
+"""Test aiobfd/pauses.py"""
+# pylint: disable=I0011,W0621,W0212
+
+import asyncio
+import gc
+import pytest
+import aiobfd.pauses
+
+
+@pytest.fixture()
+def pauses(event_loop):
+    """Pause measurement, restoring the collection settings afterwards"""
+    pauses = aiobfd.pauses.Pauses(event_loop)
+    yield pauses
+    pauses.close()
+
+
+@pytest.mark.asyncio
+async def test_gc_pause(pauses):
+    """Test whether every collection's pause is measured"""
+    pauses.start()
+    await asyncio.sleep(0)
+    gc.collect(1)
+    gc.collect()
+    _, gc_pause = pauses.stats()
+    assert gc_pause['collections'][1] >= 1
+    assert gc_pause['collections'][2] >= 1
+    assert 0 < gc_pause['last'] <= gc_pause['max'] <= gc_pause['total']
+    pauses.close()
+    assert pauses._gc_callback not in gc.callbacks
+    gc.collect()
+    assert pauses.stats()[1] == gc_pause
+
+
+@pytest.mark.asyncio
+async def test_thresholds(pauses):
+    """Test whether the thresholds are applied and restored"""
+    saved = gc.get_threshold()
+    pauses.thresholds = (50000, 20, 100)
+    pauses.start()
+    await asyncio.sleep(0)
+    assert gc.get_threshold() == (50000, 20, 100)
+    pauses.close()
+    assert gc.get_threshold() == saved
+
+
+def test_freeze(pauses, mocker):
+    """Test whether objects are only frozen when enabled"""
+    if not hasattr(gc, 'freeze'):
+        pytest.skip('gc.freeze() requires Python 3.7')
+    freeze = mocker.patch('aiobfd.pauses.gc.freeze')
+    pauses.freeze()
+    freeze.assert_not_called()
+    pauses.freeze_objects = True
+    pauses.freeze()
+    freeze.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+async def test_measure_lag(pauses, mocker):
+    """Test whether a late wakeup is reported as loop lag"""
+    mocker.patch('aiobfd.pauses.LAG_INTERVAL', 0.01)
+    pauses.start()
+    await asyncio.sleep(0.005)
+    aiobfd.pauses.time.sleep(0.02)
+    await asyncio.sleep(0.01)
+    loop_lag, _ = pauses.stats()
+    assert loop_lag['max'] >= 0.01
+
+
+@pytest.mark.asyncio
+async def test_collect_idle(pauses, mocker):
+    """Test whether due collections wait for an idle loop, up to
+       `max_delay`"""
+    busy = [True]
+    pauses.idle = True
+    pauses.interval = 0.001
+    pauses.max_delay = 1.0
+    pauses.busy = lambda: busy[0]
+    mocker.patch.object(pauses, '_due_generation', return_value=0)
+    collect = mocker.patch('aiobfd.pauses.gc.collect')
+    pauses.start()
+    clock = mocker.patch.object(pauses, 'loop')
+    clock.time.return_value = 100.0
+    clock._scheduled = []
+    assert not gc.isenabled()
+    await asyncio.sleep(0.02)
+    collect.assert_not_called()
+    clock.time.return_value = 101.0
+    await asyncio.sleep(0.02)
+    collect.assert_called_with(0)
+    collect.reset_mock()
+    busy[0] = False
+    await asyncio.sleep(0.02)
+    collect.assert_called_with(0)
+    pauses.close()
+    assert gc.isenabled()
+
+
+def test_due_generation(mocker):
+    """Test whether the oldest generation over its threshold is due"""
+    mocker.patch('aiobfd.pauses.gc.get_threshold', return_value=(700, 10, 10))
+    mocker.patch('aiobfd.pauses.gc.get_count', return_value=(100, 3, 1))
+    assert aiobfd.pauses.Pauses._due_generation() is None
+    mocker.patch('aiobfd.pauses.gc.get_count', return_value=(701, 11, 1))
+    assert aiobfd.pauses.Pauses._due_generation() == 1
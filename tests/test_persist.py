@@ -0,0 +1,78 @@
+"""Test aiobfd/persist.py"""
+# pylint: disable=I0011,W0621
+
+import json
+import os
+import aiobfd.persist
+
+STATES = [{'local': '127.0.0.1', 'remote': '127.0.0.2', 'device': None,
+           'local_discr': 1, 'remote_discr': 2, 'state': 3,
+           'remote_state': 3, 'local_diag': 0, 'detect_mult': 3,
+           'desired_min_tx_interval': 300000,
+           'required_min_rx_interval': 300000,
+           'remote_min_rx_interval': 300000,
+           'remote_min_tx_interval': None, 'remote_detect_mult': None,
+           'remote_demand_mode': False, 'remote_min_echo_rx_interval': 0,
+           'rcv_auth_seq': 0, 'xmit_auth_seq': 0, 'auth_seq_known': False}]
+
+
+def test_snapshot_roundtrip(tmpdir):
+    """Test whether a snapshot is read back with its age"""
+    path = str(tmpdir.join('state.json'))
+    aiobfd.persist.write_snapshot(path, STATES, now=100)
+    age, states = aiobfd.persist.read_snapshot(path, now=100.25)
+    assert age == 0.25
+    assert states == {('127.0.0.1', '127.0.0.2'): STATES[0]}
+    assert os.listdir(str(tmpdir)) == ['state.json']
+
+
+def test_snapshot_replace_failure(tmpdir, mocker):
+    """Test whether a failed write leaves the previous snapshot intact"""
+    path = str(tmpdir.join('state.json'))
+    aiobfd.persist.write_snapshot(path, STATES, now=100)
+    mocker.patch('os.replace', side_effect=OSError('Read-only'))
+    try:
+        aiobfd.persist.write_snapshot(path, [], now=200)
+    except OSError:
+        pass
+    assert aiobfd.persist.read_snapshot(path, now=100)[1]
+    assert os.listdir(str(tmpdir)) == ['state.json']
+
+
+def test_snapshot_missing(tmpdir):
+    """Test whether a missing snapshot is silently ignored"""
+    path = str(tmpdir.join('state.json'))
+    assert aiobfd.persist.read_snapshot(path) is None
+
+
+def test_snapshot_invalid(tmpdir, mocker):
+    """Test whether corrupt or unknown snapshots are ignored"""
+    mocker.patch('aiobfd.persist.log')
+    path = tmpdir.join('state.json')
+    path.write('{"version": 1, "sess')
+    assert aiobfd.persist.read_snapshot(str(path)) is None
+    path.write('{"version": 0}')
+    assert aiobfd.persist.read_snapshot(str(path)) is None
+    assert aiobfd.persist.log.warning.call_count == 2
+
+
+def test_snapshot_malformed(tmpdir, mocker):
+    """Test whether snapshots that parse but lack fields are ignored"""
+    mocker.patch('aiobfd.persist.log')
+    path = tmpdir.join('state.json')
+    state = STATES[0]
+    aiobfd.persist.write_snapshot(str(path), [state], now=100)
+    assert aiobfd.persist.read_snapshot(str(path), now=101)[0] == 1
+    for data in ({'version': 1},
+                 {'version': 1, 'time': 100},
+                 {'version': 1, 'time': 'then', 'sessions': []},
+                 {'version': 1, 'time': 100, 'sessions': 1},
+                 {'version': 1, 'time': 100, 'sessions': [None]},
+                 {'version': 1, 'time': 100,
+                  'sessions': [dict(state, state='up')]},
+                 {'version': 1, 'time': 100,
+                  'sessions': [{key: value for key, value in state.items()
+                                if key != 'local_discr'}]}):
+        path.write(json.dumps(data))
+        assert aiobfd.persist.read_snapshot(str(path), now=101) is None
+    assert aiobfd.persist.log.warning.call_count == 7
@@ -0,0 +1,107 @@
+"""Test aiobfd/rxqueue.py"""
+# pylint: disable=I0011,W0621
+
+import asyncio
+import pytest
+import aiobfd.rxqueue
+
+
+def test_token_bucket():
+    """Test whether a token bucket allows a burst and then refills"""
+    bucket = aiobfd.rxqueue.TokenBucket(10, 2, 0)
+    assert bucket.consume(0)
+    assert bucket.consume(0)
+    assert not bucket.consume(0)
+    assert not bucket.consume(0.05)
+    assert bucket.consume(0.1)
+    assert bucket.consume(10)
+    assert bucket.consume(10)
+    assert not bucket.consume(10)
+
+
+def test_source_limiter():
+    """Test whether sources are limited independently"""
+    limiter = aiobfd.rxqueue.SourceLimiter(1, 1, 100, 10)
+    assert limiter.allow('192.0.2.1', 0)
+    assert not limiter.allow('192.0.2.1', 0)
+    assert limiter.allow('192.0.2.2', 0)
+
+
+def test_source_limiter_total():
+    """Test whether all sources together are limited"""
+    limiter = aiobfd.rxqueue.SourceLimiter(1, 1, 2, 10)
+    assert limiter.allow('192.0.2.1', 0)
+    assert limiter.allow('192.0.2.2', 0)
+    assert not limiter.allow('192.0.2.3', 0)
+
+
+def test_source_limiter_max_sources():
+    """Test whether the least recently seen source is forgotten"""
+    limiter = aiobfd.rxqueue.SourceLimiter(1, 1, 100, 2)
+    limiter.allow('192.0.2.1', 0)
+    limiter.allow('192.0.2.2', 0)
+    limiter.allow('192.0.2.1', 0)
+    limiter.allow('192.0.2.3', 0)
+    assert list(limiter.buckets) == ['192.0.2.1', '192.0.2.3']
+
+
+def test_rx_queue_priority():
+    """Test whether priority packets are taken first"""
+    queue = aiobfd.rxqueue.RxQueue()
+    queue.put_nowait('normal')
+    queue.put_nowait('priority', priority=True)
+    assert queue.qsize() == 2
+    assert queue.get_nowait() == 'priority'
+    assert queue.get_nowait() == 'normal'
+    with pytest.raises(asyncio.QueueEmpty):
+        queue.get_nowait()
+
+
+def test_rx_queue_drop_tail(mocker):
+    """Test whether arriving packets are dropped when full"""
+    on_drop = mocker.Mock()
+    queue = aiobfd.rxqueue.RxQueue(2, on_drop=on_drop)
+    assert queue.put_nowait(1)
+    assert queue.put_nowait(2)
+    assert not queue.put_nowait(3)
+    on_drop.assert_called_once_with(3)
+    assert queue.drops == 1
+    assert [queue.get_nowait(), queue.get_nowait()] == [1, 2]
+
+
+def test_rx_queue_drop_head():
+    """Test whether the oldest packets are dropped when full"""
+    queue = aiobfd.rxqueue.RxQueue(2, aiobfd.rxqueue.DROP_HEAD)
+    for item in (1, 2, 3):
+        assert queue.put_nowait(item)
+    assert queue.drops == 1
+    assert [queue.get_nowait(), queue.get_nowait()] == [2, 3]
+
+
+def test_rx_queue_priority_full():
+    """Test whether priority packets push out normal ones, never the
+       other way around"""
+    queue = aiobfd.rxqueue.RxQueue(2, aiobfd.rxqueue.DROP_HEAD)
+    queue.put_nowait('normal')
+    queue.put_nowait('priority 1', priority=True)
+    assert queue.put_nowait('priority 2', priority=True)
+    assert not queue.put_nowait('normal')
+    assert [queue.get_nowait(), queue.get_nowait()] == ['priority 1',
+                                                        'priority 2']
+
+
+def test_rx_queue_bad_policy():
+    """Test whether an unknown drop policy raises an exception"""
+    with pytest.raises(ValueError):
+        aiobfd.rxqueue.RxQueue(policy='random')
+
+
+@pytest.mark.asyncio
+async def test_rx_queue_get():
+    """Test whether get() waits for a packet"""
+    queue = aiobfd.rxqueue.RxQueue()
+    getter = asyncio.ensure_future(queue.get())
+    await asyncio.sleep(0)
+    assert not getter.done()
+    queue.put_nowait('packet')
+    assert await getter == 'packet'
@@ -0,0 +1,168 @@
+"""Test aiobfd/sbfd.py"""
+# pylint: disable=I0011,W0621
+
+import asyncio
+import socket
+import pytest
+import bitstring
+import aiobfd.sbfd
+import aiobfd.session
+from aiobfd.packet import PACKET_FORMAT, Packet
+
+REFLECTOR_DISCR = 0x0a000001
+
+
+def initiator_packet(**fields):
+    """Packet of an initiator with a Poll Sequence in progress"""
+    data = {'version': 1, 'diag': 0, 'state': aiobfd.session.STATE_UP,
+            'poll': True, 'final': False, 'control_plane_independent': False,
+            'authentication_present': False, 'demand_mode': True,
+            'multipoint': False, 'detect_mult': 3, 'length': 24,
+            'my_discr': 1234, 'your_discr': REFLECTOR_DISCR,
+            'desired_min_tx_interval': 50000,
+            'required_min_rx_interval': 0,
+            'required_min_echo_rx_interval': 1000}
+    data.update(fields)
+    return bytearray(bitstring.pack(PACKET_FORMAT, **data).bytes)
+
+
+async def wait_for(condition, timeout=5):
+    """Wait until the condition holds, rather than for a fixed time that a
+       loaded machine may overrun"""
+    deadline = asyncio.get_event_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_event_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture()
+def reflector(event_loop):
+    """Reflector without a socket"""
+    return aiobfd.sbfd.Reflector(event_loop, [REFLECTOR_DISCR], 20000)
+
+
+def test_reflect(reflector):
+    """Test whether a packet is turned into the reply in place"""
+    buffer = initiator_packet() + bytes(8)
+    assert reflector.reflect(buffer, 24)
+    reply = Packet(bytes(buffer[:24]), '127.0.0.1')
+    assert reply.state == aiobfd.session.STATE_UP
+    assert (reply.poll, reply.final, reply.demand_mode) == \
+        (False, True, False)
+    assert (reply.my_discr, reply.your_discr) == (REFLECTOR_DISCR, 1234)
+    assert (reply.detect_mult, reply.desired_min_tx_interval) == (3, 50000)
+    assert reply.required_min_rx_interval == 20000
+    assert reply.required_min_echo_rx_interval == 0
+    assert reply.length == 24
+
+    buffer = initiator_packet(poll=False)
+    reflector.admin_down()
+    assert reflector.reflect(buffer, 24)
+    reply = Packet(bytes(buffer), '127.0.0.1')
+    assert reply.state == aiobfd.session.STATE_ADMIN_DOWN
+    assert not reply.final
+
+
+@pytest.mark.parametrize('fields,size,counter', [
+    ({}, 23, 'reflector_invalid_drops'),
+    ({'version': 0}, 24, 'reflector_invalid_drops'),
+    ({'authentication_present': True}, 24, 'reflector_invalid_drops'),
+    ({'multipoint': True}, 24, 'reflector_invalid_drops'),
+    ({'length': 48}, 24, 'reflector_invalid_drops'),
+    ({'my_discr': 0}, 24, 'reflector_invalid_drops'),
+    ({'your_discr': 1}, 24, 'reflector_unmatched_drops')])
+def test_reflect_drops(reflector, fields, size, counter):
+    """Test whether invalid packets and packets for other discriminators
+       are left alone"""
+    buffer = initiator_packet(**fields)
+    original = bytes(buffer)
+    assert not reflector.reflect(buffer, size)
+    assert bytes(buffer) == original
+    assert reflector.counters[counter] == 1
+
+
+@pytest.mark.asyncio
+async def test_reflect_socket(event_loop):
+    """Test whether the reply sent back on the socket is a valid packet
+       answering the initiator"""
+    reflector = aiobfd.sbfd.Reflector(event_loop, [REFLECTOR_DISCR], 20000)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    reflector.open(sock)
+    initiator = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    initiator.bind(('127.0.0.1', 0))
+    initiator.settimeout(1)
+    try:
+        initiator.sendto(bytes(initiator_packet(diag=3)), sock.getsockname())
+        await asyncio.sleep(0.01)
+        data, source = initiator.recvfrom(256)
+        assert source == sock.getsockname()
+    finally:
+        initiator.close()
+        reflector.close()
+    reply = Packet(data, source[0])
+    assert (reply.version, reply.diag, reply.length) == (1, 0, len(data))
+    assert reply.state == aiobfd.session.STATE_UP
+    assert (reply.poll, reply.final) == (False, True)
+    assert (reply.authentication_present, reply.multipoint) == \
+        (False, False)
+    assert (reply.my_discr, reply.your_discr) == (REFLECTOR_DISCR, 1234)
+    assert (reply.detect_mult, reply.desired_min_tx_interval) == (3, 50000)
+    assert (reply.required_min_rx_interval,
+            reply.required_min_echo_rx_interval) == (20000, 0)
+    assert reflector.counters['reflected_packets'] == 1
+
+
+@pytest.mark.asyncio
+async def test_initiator(event_loop, mocker):
+    """Test whether an initiator comes Up through a reflector, goes down
+       when it is taken out of service and detects it going away"""
+    reflector = aiobfd.sbfd.Reflector(event_loop, [REFLECTOR_DISCR], 10000)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    reflector.open(sock)
+    mocker.patch('aiobfd.sbfd.SBFD_PORT', sock.getsockname()[1])
+    initiator = await aiobfd.sbfd.Initiator.create(
+        '127.0.0.1', '127.0.0.1', REFLECTOR_DISCR, tx_interval=10000,
+        rx_interval=10000, loop=event_loop)
+    assert initiator.remote_addr == sock.getsockname()
+    assert initiator.remote_discr == REFLECTOR_DISCR
+    await wait_for(lambda: initiator.state == aiobfd.session.STATE_UP and
+                   not initiator.poll_sequence)
+    assert initiator.remote_min_rx_interval == 10000
+    # The Poll Sequence of the faster interval was answered
+    assert initiator.desired_min_tx_interval == 10000
+
+    reflector.admin_down()
+    await wait_for(lambda: initiator.state == aiobfd.session.STATE_DOWN)
+    assert initiator.local_diag == \
+        aiobfd.session.DIAG_NEIGHBOR_SIGNAL_DOWN
+
+    # Down, the initiator transmits once a second
+    reflector.admin_up()
+    await wait_for(lambda: initiator.state == aiobfd.session.STATE_UP)
+    reflector.close()
+    await wait_for(lambda: initiator.state == aiobfd.session.STATE_DOWN)
+    assert initiator.local_diag == \
+        aiobfd.session.DIAG_CONTROL_DETECTION_EXPIRED
+    assert reflector.counters['reflected_packets'] >= 3
+    initiator.shutdown()
+    await asyncio.sleep(0)
+
+
+def test_initiator_drops(event_loop):
+    """Test whether packets that don't belong to the initiator are
+       dropped"""
+    initiator = aiobfd.sbfd.Initiator('127.0.0.1', '127.0.0.1',
+                                      REFLECTOR_DISCR, loop=event_loop,
+                                      start=False)
+    initiator.datagram_received(b'short', ('127.0.0.1', 7784))
+    reply = initiator_packet(my_discr=REFLECTOR_DISCR,
+                             your_discr=initiator.local_discr + 1)
+    initiator.datagram_received(bytes(reply), ('127.0.0.1', 7784))
+    assert initiator.rx_drops == 2
+    assert initiator.state == aiobfd.session.STATE_DOWN
+    with pytest.raises(ValueError):
+        aiobfd.sbfd.Initiator('127.0.0.1', '127.0.0.1', REFLECTOR_DISCR,
+                              auth={'type': 'keyed-md5', 'keys': {1: 'x'}},
+                              loop=event_loop, start=False)
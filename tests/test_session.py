@@ -2,6 +2,7 @@
 # pylint: disable=I0011,W0621,E1101,W0611,W0212
 
 import asyncio
+import errno
 import platform
 import socket
 import time
@@ -122,6 +123,21 @@ def test_session_hostname(mocker):
         pass
 
 
+def test_session_multihop(mocker):
+    """Create a multihop Session, sending to the multihop port with the
+       configured TTL and without the Echo function"""
+    mocker.patch.object(aiobfd.session.Session, 'async_tx_packets',
+                        new_callable=AsyncMock)
+    session = aiobfd.session.Session('127.0.0.1', '127.0.0.2', multihop=True,
+                                     ttl=64, echo=MagicMock())
+    assert session.remote_addr == ('127.0.0.2', aiobfd.session.MULTIHOP_PORT)
+    sock = session.client.get_extra_info('socket')
+    assert sock.getsockopt(socket.SOL_IP, socket.IP_TTL) == 64
+    assert session.echo is None
+    assert session.required_min_echo_rx_interval == 0
+    session.shutdown()
+
+
 def test_session_host_force_ipv4(mocker):
     """Create a forced IPv4 Session process from hostname"""
     mocker.patch('aiobfd.session.log')
@@ -162,6 +178,37 @@ def test_session_host_force_ipv6(mocker):
         pass
 
 
+@pytest.mark.asyncio
+async def test_session_create(mocker):
+    """Create a Session from within a running loop"""
+    mocker.patch.object(aiobfd.session.Session, 'async_tx_packets',
+                        new_callable=AsyncMock)
+    session = await aiobfd.session.Session.create('127.0.0.1', '127.0.0.2')
+    assert session.client.get_extra_info('sockname')[0] == '127.0.0.1'
+    session.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_resolve_numeric(event_loop, mocker):
+    """Numeric addresses are resolved without the loop's resolver"""
+    mocker.patch.object(event_loop, 'getaddrinfo')
+    fam, addr = await aiobfd.session.resolve(event_loop, '::1', 3784)
+    assert fam == socket.AF_INET6
+    assert addr[:2] == ('::1', 3784)
+    event_loop.getaddrinfo.assert_not_called()
+
+
+def test_bind_source_port_retry():
+    """A source port that is already taken is retried with another one"""
+    sock = MagicMock()
+    sock.bind.side_effect = [OSError(errno.EADDRINUSE, 'in use'), None]
+    aiobfd.session.Session._bind_source_port(sock, ('127.0.0.1', 0))
+    assert sock.bind.call_count == 2
+    port = sock.bind.call_args[0][0][1]
+    assert aiobfd.session.SOURCE_PORT_MIN <= port <= \
+        aiobfd.session.SOURCE_PORT_MAX
+
+
 def test_sess_tx_interval_get(session):
     """Attempt to get the Desired Min Tx Interval"""
     assert session.desired_min_tx_interval == \
@@ -549,6 +596,113 @@ def test_tx_packet(session, mocker):
         aiobfd.session.CONTROL_PORT)
 
 
+def test_tx_packet_hostname(mocker):
+    """Hostname remotes are sent to their resolved address"""
+    session = aiobfd.session.Session('localhost', 'localhost',
+                                     family=socket.AF_INET)
+    mocker.patch.object(session, 'client')
+    session.tx_packet()
+    session.client.sendto.assert_called_once_with(
+        mocker.ANY, ('127.0.0.1', aiobfd.session.CONTROL_PORT))
+    assert not session.remote_numeric
+
+
+@pytest.mark.asyncio  # noqa: F811
+async def test_resolve_remote_changed(session, mocker):
+    """Re-resolving reports whether the remote address changed"""
+    assert not await session.resolve_remote()
+    mocker.patch('aiobfd.session.resolve', new_callable=AsyncMock)
+    aiobfd.session.resolve.return_value = (
+        socket.AF_INET, ('127.0.0.2', aiobfd.session.CONTROL_PORT))
+    assert await session.resolve_remote()
+    assert session.remote_addr == ('127.0.0.2', aiobfd.session.CONTROL_PORT)
+
+
+def test_tx_packet_connected(mocker):
+    """Connected sessions send without a destination address"""
+    session = aiobfd.session.Session('127.0.0.1', '127.0.0.1', connected=True)
+    assert session._sock.getpeername() == \
+        ('127.0.0.1', aiobfd.session.CONTROL_PORT)
+    mocker.patch.object(session, 'client')
+    session.tx_packet()
+    session.client.sendto.assert_called_once_with(mocker.ANY)
+    session.shutdown()
+
+
+@pytest.mark.asyncio  # noqa: F811
+async def test_connected_icmp_error(mocker):
+    """ICMP port unreachables are reported to the connected session"""
+    mocker.patch('aiobfd.session.log')
+    session = await aiobfd.session.Session.create('127.0.0.1', '127.0.0.77',
+                                                  connected=True)
+    session.state = aiobfd.session.STATE_UP
+    session.tx_packet()
+    for _ in range(100):
+        await asyncio.sleep(0.001)
+        if session.socket_errors:
+            break
+    assert session.socket_errors
+    assert session.state == aiobfd.session.STATE_DOWN
+    assert session.local_diag == aiobfd.session.DIAG_PATH_DOWN
+    session.shutdown()
+
+
+def test_error_received_unroutable(mocker):
+    """Test whether the session goes down even if the route to the remote
+       is gone, and sends to its address until it can connect again"""
+    mocker.patch('aiobfd.session.log')
+    session = aiobfd.session.Session('127.0.0.1', '127.0.0.1', connected=True)
+    session.state = aiobfd.session.STATE_UP
+    mocker.patch.object(session, '_sock')
+    session._sock.connect.side_effect = OSError(errno.ENETUNREACH,
+                                                'unreachable')
+    session.error_received(OSError(errno.ENETUNREACH, 'unreachable'))
+    assert session.state == aiobfd.session.STATE_DOWN
+    assert session.local_diag == aiobfd.session.DIAG_PATH_DOWN
+    aiobfd.session.log.warning.assert_called_once()
+    mocker.patch.object(session, 'client')
+    session.tx_packet()
+    session.client.sendto.assert_called_once_with(
+        mocker.ANY, ('127.0.0.1', aiobfd.session.CONTROL_PORT))
+
+    session._sock.connect.side_effect = None
+    session.error_received(OSError(errno.ENETUNREACH, 'unreachable'))
+    session.tx_packet()
+    session.client.sendto.assert_called_with(mocker.ANY)
+    session.shutdown()
+
+
+@pytest.mark.asyncio  # noqa: F811
+async def test_resolve_remote_unroutable(mocker):
+    """Test whether a remote that can't be connected to is still resolved
+       and sent to by address"""
+    mocker.patch('aiobfd.session.log')
+    mocker.patch('socket.socket.connect',
+                 side_effect=OSError(errno.ENETUNREACH, 'unreachable'))
+    session = await aiobfd.session.Session.create('127.0.0.1', '127.0.0.1',
+                                                  connected=True)
+    assert session.remote_addr == ('127.0.0.1', aiobfd.session.CONTROL_PORT)
+    aiobfd.session.log.warning.assert_called_once_with(
+        'Unable to connect the socket for %s, sending to its address until '
+        'it resolves again: %s', '127.0.0.1', mocker.ANY)
+    mocker.patch.object(session, 'client')
+    session.tx_packet()
+    session.client.sendto.assert_called_once_with(
+        mocker.ANY, ('127.0.0.1', aiobfd.session.CONTROL_PORT))
+    session.shutdown()
+
+
+def test_error_received_other(session, mocker):
+    """Errors that don't signal a broken path are only logged"""
+    mocker.patch('aiobfd.session.log')
+    session.state = aiobfd.session.STATE_UP
+    session.error_received(OSError(errno.EPERM, 'not permitted'))
+    assert session.state == aiobfd.session.STATE_UP
+    assert session.socket_errors == 1
+    aiobfd.session.log.error.assert_called_once_with(
+        'Socket error received for %s: %s', '127.0.0.1', mocker.ANY)
+
+
 def test_restart_tx_packets(session, mocker):
     """Test the restart_tx_packet() procedure"""
     mocker.patch('aiobfd.session.log')
@@ -564,7 +718,7 @@ async def test_detect_down(session, mocker):
     session.required_min_rx_interval = 4000
     session.remote_detect_mult = 3
     session.remote_min_tx_interval = 2000
-    session.last_rx_packet_time = time.time()
+    session.last_rx_packet_time = time.monotonic()
     session.state = aiobfd.session.STATE_UP
     await asyncio.sleep(((3 * 4000) + 1000)/1000000)
     mocker.patch.object(asyncio, 'sleep',
@@ -590,7 +744,7 @@ async def test_detect_up(session, mocker):
     session.required_min_rx_interval = 4000
     session.remote_detect_mult = 3
     session.remote_min_tx_interval = 2000
-    session.last_rx_packet_time = time.time()
+    session.last_rx_packet_time = time.monotonic()
     session.state = aiobfd.session.STATE_UP
     await asyncio.sleep(((4000))/1000000)
     mocker.patch.object(asyncio, 'sleep',
@@ -609,7 +763,7 @@ async def test_detect_demand_mode(session, mocker):
     session.required_min_rx_interval = 4000
     session.remote_detect_mult = 3
     session.remote_min_tx_interval = 2000
-    session.last_rx_packet_time = time.time()
+    session.last_rx_packet_time = time.monotonic()
     session.state = aiobfd.session.STATE_UP
     session.demand_mode = True
     await asyncio.sleep(((3 * 4000) + 1000)/1000000)
@@ -629,7 +783,7 @@ async def test_detect_no_detect_time(session, mocker):
     session.required_min_rx_interval = 4000
     session.remote_detect_mult = 3
     session.remote_min_tx_interval = 2000
-    session.last_rx_packet_time = time.time()
+    session.last_rx_packet_time = time.monotonic()
     session.state = aiobfd.session.STATE_UP
     session._async_detect_time = None
     await asyncio.sleep(((3 * 4000) + 1000)/1000000)
@@ -649,7 +803,7 @@ async def test_detect_state_init(session, mocker):
     session.required_min_rx_interval = 4000
     session.remote_detect_mult = 3
     session.remote_min_tx_interval = 2000
-    session.last_rx_packet_time = time.time()
+    session.last_rx_packet_time = time.monotonic()
     session.state = aiobfd.session.STATE_INIT
     await asyncio.sleep(((3 * 4000) + 1000)/1000000)
     mocker.patch.object(asyncio, 'sleep',
@@ -675,7 +829,7 @@ async def test_detect_state_admin_down(session, mocker):
     session.required_min_rx_interval = 4000
     session.remote_detect_mult = 3
     session.remote_min_tx_interval = 2000
-    session.last_rx_packet_time = time.time()
+    session.last_rx_packet_time = time.monotonic()
     session.state = aiobfd.session.STATE_ADMIN_DOWN
     await asyncio.sleep(((3 * 4000) + 1000)/1000000)
     mocker.patch.object(asyncio, 'sleep',
@@ -694,7 +848,7 @@ async def test_detect_state_down(session, mocker):
     session.required_min_rx_interval = 4000
     session.remote_detect_mult = 3
     session.remote_min_tx_interval = 2000
-    session.last_rx_packet_time = time.time()
+    session.last_rx_packet_time = time.monotonic()
     session.state = aiobfd.session.STATE_DOWN
     await asyncio.sleep(((3 * 4000) + 1000)/1000000)
     mocker.patch.object(asyncio, 'sleep',
@@ -727,14 +881,58 @@ def test_rx_packet_auth_sess(session, valid_packet, mocker):
            'authentication is configured locally.' in str(excinfo.value)
 
 
-def test_rx_packet_auth_both(session, valid_packet, mocker):
-    """Authentication configured but not implemented !?"""
-    mocker.patch('aiobfd.session.log')
-    session.auth_type = 1
-    valid_packet.authentication_present = True
-    session.rx_packet(valid_packet)
-    aiobfd.session.log.critical.assert_called_once_with(
-        'Authenticated packet received, not supported!')
+AUTH = {'type': 'meticulous-keyed-sha1', 'keys': {1: 'secret'}}
+
+
+def test_rx_packet_auth_both(session):
+    """Test whether authenticated packets are verified and their sequence
+       number is tracked"""
+    session.set_auth(AUTH)
+    remote = aiobfd.session.Session('127.0.0.1', '127.0.0.1', auth=AUTH)
+    remote.remote_discr = session.local_discr
+    data = bytes(remote.encode_packet())
+    session.rx_packet(Packet(data, '127.0.0.1'))
+    assert session.auth_seq_known
+    assert session.rcv_auth_seq == remote.xmit_auth_seq
+    assert session.remote_discr == remote.local_discr
+    # A replayed packet is out of the sequence number window
+    with pytest.raises(IOError) as excinfo:
+        session.rx_packet(Packet(data, '127.0.0.1'))
+    assert 'out of window' in str(excinfo.value)
+    session.rx_packet(Packet(remote.encode_packet(), '127.0.0.1'))
+    remote.shutdown()
+
+
+def test_rx_packet_auth_wrong_key(session):
+    """Test whether packets signed with another key are discarded"""
+    session.set_auth(AUTH)
+    remote = aiobfd.session.Session(
+        '127.0.0.1', '127.0.0.1',
+        auth={'type': 'meticulous-keyed-sha1', 'keys': {1: 'other'}})
+    remote.remote_discr = session.local_discr
+    with pytest.raises(IOError) as excinfo:
+        session.rx_packet(Packet(remote.encode_packet(), '127.0.0.1'))
+    assert 'digest mismatch' in str(excinfo.value)
+    assert not session.auth_seq_known
+    remote.shutdown()
+
+
+def test_auth_xmit_seq(session):
+    """Test whether the transmit sequence number only changes with the
+       packet contents, unless the type is meticulous"""
+    session.set_auth({'type': 'keyed-md5', 'keys': {1: 'secret'}})
+    session.encode_packet()
+    seq = session.xmit_auth_seq
+    session.encode_packet()
+    assert session.xmit_auth_seq == seq
+    session.local_diag = aiobfd.session.DIAG_ADMIN_DOWN
+    packet = Packet(session.encode_packet(), '127.0.0.1')
+    assert packet.length == 48
+    assert session.xmit_auth_seq == (seq + 1) % 4294967296
+    session.set_auth(AUTH)
+    session.encode_packet()
+    session.encode_packet()
+    assert session.xmit_auth_seq == (seq + 3) % 4294967296
 
 
 def test_rx_packet_remote_update(session, valid_packet, mocker):
@@ -891,3 +1089,478 @@ def test_rx_pkt_fsm_init_up(session, valid_packet, mocker):
         'BFD session with %s going to UP state.', '127.0.0.1')
     assert session.state == aiobfd.session.STATE_UP
     assert session.desired_min_tx_interval == 5000
+
+
+def test_state_listeners(session, mocker):
+    """Test whether listeners are told about state changes"""
+    listener = mocker.Mock()
+    session.listeners.append(listener)
+    session.state = aiobfd.session.STATE_INIT
+    session.state = aiobfd.session.STATE_INIT
+    session.state = aiobfd.session.STATE_UP
+    assert listener.call_args_list == [
+        mocker.call(session, aiobfd.session.STATE_INIT),
+        mocker.call(session, aiobfd.session.STATE_UP)]
+    session.shutdown()
+
+
+def flap(session, times):
+    """Take a session Up and Down a number of times"""
+    for _ in range(times):
+        session.state = aiobfd.session.STATE_UP
+        session.state = aiobfd.session.STATE_DOWN
+
+
+def test_damping_hold_up(session, mocker):
+    """Test whether Up is held back from listeners while suppressed"""
+    session.set_damping({})
+    listener = mocker.Mock()
+    session.listeners.append(listener)
+    mocker.patch('aiobfd.session.log')
+    flap(session, 3)
+    assert session.damping.suppressed
+    aiobfd.session.log.warning.assert_called_once_with(
+        'Suppressing flapping BFD session with %s for %d seconds.',
+        '127.0.0.1', mocker.ANY)
+    listener.reset_mock()
+
+    session.state = aiobfd.session.STATE_UP
+    assert session.reported_state == aiobfd.session.STATE_DOWN
+    listener.assert_not_called()
+
+    session.damping._penalty = 0  # pylint: disable=I0011,W0212
+    session._damping_reuse()  # pylint: disable=I0011,W0212
+    assert not session.damping.suppressed
+    listener.assert_called_once_with(session, aiobfd.session.STATE_UP)
+    session.shutdown()
+
+
+def test_damping_slow_interval(session):
+    """Test whether a suppressed session runs at the slow interval"""
+    session.set_damping({'slow_interval': 5000000})
+    flap(session, 3)
+    assert session.required_min_rx_interval == 5000000
+    session.state = aiobfd.session.STATE_UP
+    session._apply_intervals()  # pylint: disable=I0011,W0212
+    assert session.desired_min_tx_interval == 5000000
+    session.damping._penalty = 0  # pylint: disable=I0011,W0212
+    session._damping_reuse()  # pylint: disable=I0011,W0212
+    assert session.required_min_rx_interval == 1000000
+    assert session.desired_min_tx_interval == 1000000
+    session.shutdown()
+
+
+def test_damping_reuse_rescheduled(session, mocker):
+    """Test whether suppression continues if the penalty grew meanwhile"""
+    session.set_damping({})
+    flap(session, 3)
+    mocker.patch.object(session.loop, 'call_later')
+    session._damping_reuse()  # pylint: disable=I0011,W0212
+    assert session.damping.suppressed
+    session.loop.call_later.assert_called_once_with(
+        mocker.ANY, session._damping_reuse)  # pylint: disable=I0011,W0212
+    session.shutdown()
+
+
+def test_set_damping(session):
+    """Test whether damping can be changed and disabled"""
+    session.set_damping({'half_life': 30})
+    damping = session.damping
+    session.set_damping({'half_life': 30})
+    assert session.damping is damping
+    session.set_damping({'half_life': 60})
+    assert session.damping.half_life == 60
+    # Settings no longer given go back to their defaults
+    session.set_damping({})
+    assert session.damping.half_life == aiobfd.damping.DAMPING['half_life']
+    flap(session, 3)
+    session.set_damping(None)
+    assert session.damping is None
+    session.shutdown()
+
+
+def test_admin_down(session, mocker):
+    """Test whether a session goes AdminDown without counting as a flap"""
+    session.set_damping({})
+    listener = mocker.Mock()
+    session.listeners.append(listener)
+    session.state = aiobfd.session.STATE_UP
+    session.admin_down()
+    assert session.state == aiobfd.session.STATE_ADMIN_DOWN
+    assert session.local_diag == aiobfd.session.DIAG_ADMIN_DOWN
+    assert session.desired_min_tx_interval == 1000000
+    assert session.damping.flaps == 0
+    listener.assert_called_with(session, aiobfd.session.STATE_ADMIN_DOWN)
+    session.admin_up()
+    assert session.state == aiobfd.session.STATE_DOWN
+    session.admin_up()
+    assert session.state == aiobfd.session.STATE_DOWN
+    session.shutdown()
+
+
+def up_state(session):
+    """Saved state of a session that is Up with 300 ms timers"""
+    state = session.snapshot()
+    state.update({'state': aiobfd.session.STATE_UP, 'remote_discr': 1234,
+                  'remote_state': aiobfd.session.STATE_UP,
+                  'desired_min_tx_interval': 300000,
+                  'required_min_rx_interval': 300000,
+                  'remote_min_rx_interval': 300000,
+                  'remote_min_tx_interval': 300000, 'remote_detect_mult': 3,
+                  'xmit_auth_seq': 4294967295})
+    return state
+
+
+def test_resume(session):
+    """Test whether a session resumes Up without a Poll Sequence"""
+    state = up_state(session)
+    state['local_discr'] = 42
+    session.retime(300000, 300000, 3)
+    session.poll_sequence = False
+    assert session.resume(state, 0.5)
+    assert session.state == aiobfd.session.STATE_UP
+    assert session.local_discr == 42
+    assert session.remote_discr == 1234
+    assert not session.poll_sequence
+    assert session._async_detect_time == 900000  # pylint: disable=I0011,W0212
+    assert 0.49 < time.monotonic() - session.last_rx_packet_time < 0.6
+    # Skipping the packet that may have been sent since wraps around
+    assert session.xmit_auth_seq == 1
+    assert session.snapshot()['local_discr'] == 42
+    session.shutdown()
+
+
+def test_resume_retimed(session):
+    """Test whether timers changed since the state was saved get applied"""
+    session.retime(50000, 50000, 3)
+    session.poll_sequence = False
+    assert session.resume(up_state(session), 0)
+    assert session.desired_min_tx_interval == 50000
+    assert session.poll_sequence
+    session.shutdown()
+
+
+def test_resume_too_old(session):
+    """Test whether sessions are not resumed past the remote's Detection Time
+       or when they weren't up"""
+    discr = session.local_discr
+    state = up_state(session)
+    assert not session.resume(state, 0.9)
+    assert not session.resume(state, -1)
+    state['state'] = aiobfd.session.STATE_DOWN
+    assert not session.resume(state, 0)
+    assert session.state == aiobfd.session.STATE_DOWN
+    assert session.local_discr == discr
+    session.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_wait_poll(mocker):
+    """Test whether waiting for a Poll Sequence ends with the Final bit"""
+    session = await aiobfd.session.Session.create('127.0.0.1', '127.0.0.1')
+    assert session.wait_poll().done()
+    session.required_min_rx_interval = 300000
+    waiter = session.wait_poll()
+    assert not waiter.done()
+    packet = mocker.Mock(authentication_present=False, state=1, poll=False,
+                         final=True, my_discr=1, required_min_rx_interval=1,
+                         desired_min_tx_interval=1, detect_mult=3,
+                         demand_mode=False, rx_time=0)
+    session.rx_packet(packet)
+    assert waiter.done()
+    session.shutdown()
+
+
+def echo_session(session, mocker):
+    """Let a session use a mocked Echo function and bring it Up with an
+       aiobfd remote that loops back Echo packets"""
+    session.echo = mocker.Mock(running=True)
+    session.echo_aiobfd = True
+    session.rx_interval = 300000
+    session.echo_tx_interval = 20000
+    session.echo_rx_interval = 30000
+    session.remote_min_echo_rx_interval = 10000
+    session.remote_state = aiobfd.session.STATE_UP
+    session.state = aiobfd.session.STATE_UP
+    return session
+
+
+def test_echo_active(session, mocker):
+    """Test whether the Echo function runs only while Up and slows down the
+       Control packets it takes over from"""
+    assert not session.echo_active
+    assert session.required_min_echo_rx_interval == 0
+    echo_session(session, mocker)
+    assert session.echo_active
+    assert session.echo_interval == 20000
+    assert session.required_min_echo_rx_interval == 30000
+    session.echo.schedule.assert_called_once_with(session)
+    assert session.required_min_rx_interval == \
+        aiobfd.session.ECHO_CONTROL_RX_INTERVAL
+
+    session.state = aiobfd.session.STATE_DOWN
+    assert not session.echo_active
+    session.echo.unschedule.assert_called_once_with(session)
+    assert session.required_min_rx_interval == 300000
+    session.shutdown()
+
+
+def test_echo_not_aiobfd(session, mocker):
+    """Test whether the Echo function stays off with remotes that don't run
+       aiobfd, which wouldn't loop back our Echo packets"""
+    echo_session(session, mocker)
+    session.set_echo(20000, 30000)
+    assert not session.echo_active
+    assert session.required_min_echo_rx_interval == 0
+    session.echo.unschedule.assert_called_once_with(session)
+    session.set_echo(20000, 30000, echo_aiobfd=True)
+    assert session.echo_active
+    session.shutdown()
+
+
+def test_echo_remote_stops(session, mocker, valid_packet):
+    """Test whether the Echo function stops once the remote no longer loops
+       back Echo packets"""
+    echo_session(session, mocker)
+    valid_packet.state = aiobfd.session.STATE_UP
+    valid_packet.your_discr = session.local_discr
+    valid_packet.required_min_echo_rx_interval = 50000
+    session.rx_packet(valid_packet)
+    assert session.echo_active
+    assert session.echo_interval == 50000
+    valid_packet.required_min_echo_rx_interval = 0
+    session.rx_packet(valid_packet)
+    assert not session.echo_active
+    session.shutdown()
+
+
+def test_echo_encode(session, mocker):
+    """Test whether the Echo interval is advertised to the remote"""
+    echo_session(session, mocker)
+    session.remote_discr = 1234
+    packet = Packet(session.encode_packet(), '127.0.0.1')
+    assert packet.required_min_echo_rx_interval == 30000
+    session.echo.running = False
+    packet = Packet(session.encode_packet(), '127.0.0.1')
+    assert packet.required_min_echo_rx_interval == 0
+    session.shutdown()
+
+
+def test_echo_rtt(session, mocker):
+    """Test whether the round trip time of Echo packets is tracked"""
+    session.echo_received(1.0, 1.5)
+    assert session.echo_rtt['last'] is None
+    echo_session(session, mocker)
+    session.echo_received(1.0, 1.004)
+    session.echo_received(2.0, 2.012)
+    assert session.last_echo_rx_time == 2.012
+    assert session.echo_rtt['last'] == pytest.approx(0.012)
+    assert session.echo_rtt['avg'] == pytest.approx(0.005)
+    assert session.echo_rtt['min'] == pytest.approx(0.004)
+    assert session.echo_rtt['max'] == pytest.approx(0.012)
+    session.shutdown()
+
+
+@pytest.mark.asyncio  # noqa: F811
+async def test_detect_echo_failed(session, mocker):
+    """Test whether the session goes down once Echo packets are no longer
+       looped back, well before the Control Detection Time"""
+    session.remote_detect_mult = 3
+    session.remote_min_tx_interval = 1000000
+    session.last_rx_packet_time = time.monotonic()
+    echo_session(session, mocker)
+    session.last_echo_rx_time = time.monotonic() - 0.1
+    mocker.patch.object(asyncio, 'sleep',
+                        new_callable=AsyncMock)
+    asyncio.sleep.side_effect = ErrorAfter(1)
+    mocker.patch('aiobfd.session.log')
+    with pytest.raises(CallableExhausted):
+        await session.detect_async_failure()
+    assert session.state == aiobfd.session.STATE_DOWN
+    assert session.local_diag == aiobfd.session.DIAG_ECHO_FAILED
+    assert not session.echo_active
+    aiobfd.session.log.critical.assert_called_once_with(
+        'Echo packets not looped back by BFD remote %s, going DOWN!',
+        '127.0.0.1')
+
+
+def test_demand_active(session):
+    """Test whether Demand mode is only active once both sides are Up and
+       whether changing it while Up starts a Poll Sequence"""
+    session.demand_mode = True
+    assert not session.demand_active
+    session.remote_discr = 1234
+    assert not Packet(session.encode_packet(), '127.0.0.1').demand_mode
+    session.remote_state = aiobfd.session.STATE_UP
+    session.state = aiobfd.session.STATE_UP
+    assert session.demand_active
+    assert Packet(session.encode_packet(), '127.0.0.1').demand_mode
+    assert not session.poll_sequence
+    session.demand_mode = False
+    assert not session.demand_active
+    assert session.poll_sequence
+
+
+@pytest.mark.asyncio  # noqa: F811
+async def test_detect_demand_active(session, mocker):
+    """Test whether the Detection Time doesn't apply while Demand mode is
+       active"""
+    session.required_min_rx_interval = 4000
+    session.remote_detect_mult = 3
+    session.remote_min_tx_interval = 2000
+    session.last_rx_packet_time = time.monotonic() - 1
+    session.demand_mode = True
+    session.remote_state = aiobfd.session.STATE_UP
+    session.state = aiobfd.session.STATE_UP
+    session.poll_sequence = False
+    mocker.patch.object(asyncio, 'sleep',
+                        new_callable=AsyncMock)
+    asyncio.sleep.side_effect = ErrorAfter(1)
+    mocker.patch('aiobfd.session.log')
+    with pytest.raises(CallableExhausted):
+        await session.detect_async_failure()
+    assert session.state == aiobfd.session.STATE_UP
+    aiobfd.session.log.critical.assert_not_called()
+    asyncio.sleep.assert_called_with(aiobfd.session.DEMAND_CHECK_INTERVAL)
+
+
+@pytest.mark.asyncio  # noqa: F811
+async def test_detect_demand_poll(session, mocker):
+    """Test whether the session goes down when the remote doesn't answer a
+       Poll Sequence in Demand mode"""
+    session.demand_mode = True
+    session.remote_state = aiobfd.session.STATE_UP
+    session.state = aiobfd.session.STATE_UP
+    session.poll_sequence = True
+    session._poll_start_time = time.monotonic() - 10
+    mocker.patch.object(asyncio, 'sleep',
+                        new_callable=AsyncMock)
+    asyncio.sleep.side_effect = ErrorAfter(1)
+    mocker.patch('aiobfd.session.log')
+    with pytest.raises(CallableExhausted):
+        await session.detect_async_failure()
+    assert session.state == aiobfd.session.STATE_DOWN
+    assert session.local_diag == \
+        aiobfd.session.DIAG_CONTROL_DETECTION_EXPIRED
+    aiobfd.session.log.critical.assert_called_once_with(
+        'BFD remote %s didn\'t answer the Poll Sequence, going DOWN!',
+        '127.0.0.1')
+
+
+@pytest.mark.asyncio
+async def test_verify(mocker):
+    """Test whether verifying a remote waits for the Final bit"""
+    session = await aiobfd.session.Session.create('127.0.0.1', '127.0.0.1')
+    session.desired_min_tx_interval = 1000
+    session.detect_mult = 1
+    assert not await session.verify()
+    waiter = session.loop.create_task(session.verify())
+    await asyncio.sleep(0)
+    packet = mocker.Mock(authentication_present=False, state=1, poll=False,
+                         final=True, my_discr=1, required_min_rx_interval=1,
+                         desired_min_tx_interval=1, detect_mult=3,
+                         demand_mode=False, rx_time=0)
+    session.rx_packet(packet)
+    assert await waiter
+    session.shutdown()
+
+
+def test_demand_restarts_tx(session, mocker):
+    """Test whether transmission resumes once the remote leaves Demand
+       mode"""
+    mocker.patch.object(session, '_restart_tx_packets')
+    session._tx_packets = mocker.Mock()
+    session.remote_demand_mode = True
+    session.remote_state = aiobfd.session.STATE_UP
+    session.state = aiobfd.session.STATE_UP
+    session._restart_tx_packets.assert_not_called()
+    session.remote_demand_mode = False
+    session._update_demand()
+    session._restart_tx_packets.assert_called_once_with()
+
+
+def test_rx_unchanged(session, valid_packet, mocker):
+    """Test whether the same packet while Up only refreshes the liveness
+       of the session"""
+    mocker.patch('aiobfd.session.log')
+    assert not session.rx_unchanged(valid_packet.data, 1)
+    session.state = aiobfd.session.STATE_UP
+    valid_packet.state = aiobfd.session.STATE_UP
+    session.rx_packet(valid_packet)
+    assert session.rx_unchanged(valid_packet.data, 1)
+    assert session.last_rx_packet_time == 1
+    assert not session.rx_unchanged(bytes(24), 2)
+
+    # Not while the remote is polling, or we are no longer Up
+    valid_packet.poll = True
+    session.rx_packet(valid_packet)
+    assert not session.rx_unchanged(valid_packet.data, 3)
+    valid_packet.poll = False
+    session.rx_packet(valid_packet)
+    session.state = aiobfd.session.STATE_DOWN
+    assert not session.rx_unchanged(valid_packet.data, 3)
+    assert session.last_rx_packet_time == valid_packet.rx_time
+
+
+@pytest.mark.asyncio  # noqa: F811
+async def test_async_tx_pkts_paced(session, mocker):
+    """Test whether the first packet is staggered and the next one paced
+       within the jitter bounds"""
+    mocker.patch.object(asyncio, 'sleep', new_callable=AsyncMock)
+    asyncio.sleep.side_effect = ErrorAfter(1)
+    mocker.patch('aiobfd.session.log')
+    mocker.patch.object(session, 'tx_packet')
+    session.detect_mult = 1
+    session.pacer = mocker.Mock(stagger=True)
+    session.pacer.first.return_value = 0.1
+    session.pacer.delay.return_value = 0.2
+    with pytest.raises(CallableExhausted):
+        await session.async_tx_packets()
+    assert 0.75 <= session.pacer.first.call_args[0][0] <= 0.9
+    interval, latest = session.pacer.delay.call_args[0]
+    assert 0.75 <= interval <= latest == 0.9
+    asyncio.sleep.assert_has_calls([mocker.call(0.1), mocker.call(0.2)])
+    session.tx_packet.assert_called_once_with()
+
+
+def test_detect_delay(session, mocker):
+    """Test whether failures are checked right at the Detection Time on
+       timerfd timers, and every millisecond otherwise"""
+    mocker.patch('aiobfd.session.time.monotonic', return_value=10.0)
+    session.state = aiobfd.session.STATE_UP
+    session._async_detect_time = 3000
+    session.last_rx_packet_time = 9.9975
+    assert session._detect_delay() == 1/1000
+    session.timer = mocker.Mock()
+    assert session._detect_delay() == pytest.approx(0.0005)
+    session.last_rx_packet_time = 9.99
+    assert session._detect_delay() == 0
+    session.last_rx_packet_time = 10.0
+    assert session._detect_delay() == pytest.approx(0.003)
+    # The Echo function may expire first
+    session._echo_active = True
+    session.last_echo_rx_time = 9.999
+    session.echo_tx_interval = 500
+    assert session._detect_delay() == pytest.approx(0.0005)
+    session._echo_active = False
+    session.state = aiobfd.session.STATE_DOWN
+    assert session._detect_delay() == 1/1000
+
+
+def test_detect_sooner(session, mocker):
+    """Test whether failures are checked again right away when the
+       Detection Time shrinks while sleeping until it expires"""
+    mocker.patch('aiobfd.session.time.monotonic', return_value=10.0)
+    mocker.patch.object(session, '_restart_detect_async_failure')
+    session._detect_async_failure = mocker.Mock()
+    session.timer = mocker.Mock()
+    session.state = aiobfd.session.STATE_UP
+    session.required_min_rx_interval = 1000000
+    session.remote_min_tx_interval = 1000000
+    session.remote_detect_mult = 3
+    session.last_rx_packet_time = 10.0
+    assert session._detect_delay() == pytest.approx(3)
+    session.remote_detect_mult = 5
+    session._restart_detect_async_failure.assert_not_called()
+    session.remote_detect_mult = 2
+    session._restart_detect_async_failure.assert_called_once_with()
@@ -0,0 +1,69 @@
+"""Test aiobfd/takeover.py"""
+# pylint: disable=I0011,W0621
+
+import os
+import socket
+import stat
+import pytest
+import aiobfd.takeover
+
+
+@pytest.fixture()
+def pair():
+    """Connected pair of Unix sockets"""
+    left, right = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    yield left, right
+    left.close()
+    right.close()
+
+
+def test_message_fds(pair):
+    """Test whether file descriptors are passed along with a message"""
+    left, right = pair
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.bind(('127.0.0.1', 0))
+    aiobfd.takeover.send_message(left, {'time': 1}, [udp.fileno()])
+    data, socks = aiobfd.takeover.recv_message(right)
+    assert data == {'time': 1}
+    assert socks[0].fileno() != udp.fileno()
+    assert socks[0].getsockname() == udp.getsockname()
+    assert socks[0].type == socket.SOCK_DGRAM
+    socks[0].close()
+    udp.close()
+
+
+def test_message_closed(pair):
+    """Test whether the other process going away raises an exception"""
+    left, right = pair
+    left.close()
+    with pytest.raises(ConnectionResetError):
+        aiobfd.takeover.recv_message(right)
+
+
+def test_listen_takeover(tmpdir):
+    """Test whether a stale socket file is replaced and only our own user
+       may connect"""
+    path = str(tmpdir.join('aiobfd.sock'))
+    first = aiobfd.takeover.listen_takeover(path)
+    second = aiobfd.takeover.listen_takeover(path)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    conn.connect(path)
+    assert second.accept()
+    for sock in (conn, first, second):
+        sock.close()
+
+
+def test_connect_takeover_refused(tmpdir):
+    """Test whether taking over without a running process fails"""
+    with pytest.raises(OSError):
+        aiobfd.takeover.connect_takeover(str(tmpdir.join('aiobfd.sock')))
+
+
+def test_check_peer(pair, mocker):
+    """Test whether processes of other users are refused"""
+    left, _ = pair
+    aiobfd.takeover.check_peer(left)
+    mocker.patch('aiobfd.takeover.os.geteuid', return_value=os.geteuid() + 1)
+    with pytest.raises(PermissionError):
+        aiobfd.takeover.check_peer(left)
@@ -0,0 +1,55 @@
+"""Test aiobfd/timers.py"""
+# pylint: disable=I0011,W0621,W0212
+
+import asyncio
+import sys
+import time
+import pytest
+import aiobfd.timers
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'),
+                                reason='timerfd requires Linux')
+
+
+@pytest.fixture()
+def timer(event_loop):
+    """Started timerfd timers"""
+    timer = aiobfd.timers.TimerFd(event_loop)
+    timer.start()
+    yield timer
+    timer.close()
+
+
+@pytest.mark.asyncio
+async def test_sleep(timer):
+    """Test whether sleepers wake up after their delay, in order of their
+       deadline"""
+    woken = []
+
+    async def sleeper(delay):
+        start = time.monotonic()
+        await timer.sleep(delay)
+        assert time.monotonic() - start >= delay
+        woken.append(delay)
+
+    await asyncio.gather(sleeper(0.03), sleeper(0.01), sleeper(0.02))
+    assert woken == [0.01, 0.02, 0.03]
+    assert timer._armed is None
+    assert timer._timers == []
+
+
+@pytest.mark.asyncio
+async def test_cancelled(timer):
+    """Test whether cancelled sleepers are skipped and the timerfd re-armed
+       for the next one"""
+    cancelled = timer.sleep(0.01)
+    later = timer.sleep(0.02)
+    cancelled.cancel()
+    await later
+    assert timer._timers == []
+    pending = timer.sleep(1)
+    assert timer._armed is not None
+    timer.close()
+    assert pending.cancelled()
+    # Closed timers fall back to the loop's
+    await timer.sleep(0.001)
@@ -2,8 +2,14 @@
 # pylint: disable=I0011,W0621,E1101
 
 import asyncio
+import socket
+import time
 import pytest
+import bitstring
+import aiobfd.rxqueue
 import aiobfd.transport
+from aiobfd.packet import PACKET_FORMAT
+from tests.test_packet import valid_data  # noqa: F401
 
 
 @pytest.fixture(scope='session')
@@ -15,7 +21,7 @@ def client():
 @pytest.fixture(scope='session')
 def server():
     """Create an aoibfd server"""
-    rx_queue = asyncio.Queue()
+    rx_queue = aiobfd.rxqueue.RxQueue()
     return aiobfd.transport.Server(rx_queue)
 
 
@@ -41,6 +47,15 @@ def test_client_error_received(client, mocker):
         'Socket error received: %s', 'test error')
 
 
+def test_client_error_callback(mocker):
+    """Test whether errors are handed to the session when requested"""
+    callback = mocker.Mock()
+    mocker.patch('aiobfd.transport.log')
+    aiobfd.transport.Client(callback).error_received('test error')
+    callback.assert_called_once_with('test error')
+    aiobfd.transport.log.error.assert_not_called()
+
+
 def test_server_connection_made(server):
     """Test whether we can establish a server connections"""
     server.connection_made(None)
@@ -49,6 +64,19 @@ def test_server_connection_made(server):
 def test_server_datagram_received(server):
     """Test whether receiving packets on the server queues them"""
     server.datagram_received('data', ('127.0.0.1', 12345))
+    data, source, _, ingress = server.rx_queue.get_nowait()
+    assert (data, source, ingress) == ('data', '127.0.0.1', None)
+
+
+def test_server_admit(mocker):
+    """Test whether the admission check drops and prioritizes packets"""
+    admit = mocker.Mock(side_effect=[None, False, True])
+    server = aiobfd.transport.Server(aiobfd.rxqueue.RxQueue(), admit)
+    for data in (b'drop', b'normal', b'priority'):
+        server.datagram_received(data, ('127.0.0.1', 12345))
+    assert server.rx_queue.qsize() == 2
+    assert server.rx_queue.get_nowait()[0] == b'priority'
+    assert server.rx_queue.get_nowait()[0] == b'normal'
 
 
 def test_server_error_received(server, mocker):
@@ -57,3 +85,174 @@ def test_server_error_received(server, mocker):
     server.error_received('test error')
     aiobfd.transport.log.error.assert_called_once_with(
         'Socket error received: %s', 'test error')
+
+
+def test_protect_socket(valid_data):  # noqa: F811
+    """Test whether the kernel drops invalid and off-link packets"""
+    if not aiobfd.transport.sys.platform.startswith('linux'):
+        pytest.skip('Kernel packet filtering requires Linux')
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    server.settimeout(0.2)
+    aiobfd.transport.protect_socket(server)
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, 255)
+
+    valid = bitstring.pack(PACKET_FORMAT, **valid_data).bytes
+    invalid = []
+    for field, value in (('version', 0), ('multipoint', 1), ('length', 20),
+                         ('my_discr', 0)):
+        data = dict(valid_data)
+        data[field] = value
+        invalid.append(bitstring.pack(PACKET_FORMAT, **data).bytes)
+    invalid.append(valid[:20])
+    for data in invalid:
+        client.sendto(data, server.getsockname())
+    client.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, 64)
+    client.sendto(valid, server.getsockname())
+    client.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, 255)
+    client.sendto(valid, server.getsockname())
+
+    assert server.recv(1024) == valid
+    with pytest.raises(socket.timeout):
+        server.recv(1024)
+    assert aiobfd.transport.socket_drops(server) == len(invalid) + 1
+    client.close()
+    server.close()
+
+
+def test_protect_socket_multihop(valid_data):  # noqa: F811
+    """Test whether packets of multihop sessions are accepted up to the
+       minimum TTL"""
+    if not aiobfd.transport.sys.platform.startswith('linux'):
+        pytest.skip('Kernel packet filtering requires Linux')
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    server.settimeout(0.2)
+    aiobfd.transport.protect_socket(server, min_ttl=250)
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    valid = bitstring.pack(PACKET_FORMAT, **valid_data).bytes
+    for ttl in (249, 250):
+        aiobfd.transport.set_ttl(client, ttl)
+        client.sendto(valid, server.getsockname())
+    assert server.recv(1024) == valid
+    with pytest.raises(socket.timeout):
+        server.recv(1024)
+    assert aiobfd.transport.socket_drops(server) == 1
+    client.close()
+    server.close()
+
+
+def test_protect_socket_not_linux(mocker):
+    """Test whether filtering is skipped with a warning on other platforms"""
+    mocker.patch('aiobfd.transport.sys.platform', 'freebsd12')
+    mocker.patch('aiobfd.transport.log')
+    sock = mocker.Mock()
+    aiobfd.transport.protect_socket(sock)
+    sock.setsockopt.assert_not_called()
+    aiobfd.transport.log.warning.assert_called_once_with(
+        'Kernel packet filtering is only supported on Linux, make sure to '
+        'drop packets with a TTL/HL below 255.')
+
+
+def test_bind_device():
+    """Test whether a socket is restricted to a device"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        aiobfd.transport.bind_device(sock, 'lo')
+    except PermissionError:
+        sock.close()
+        pytest.skip('Binding to a device requires CAP_NET_RAW')
+    assert sock.getsockopt(socket.SOL_SOCKET,
+                           aiobfd.transport.SO_BINDTODEVICE, 16) == b'lo\x00'
+    sock.close()
+
+
+def test_socket_drops_unknown():
+    """Test whether unknown drop counters are reported as such"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.close()
+    assert aiobfd.transport.socket_drops(sock) is None
+
+
+@pytest.mark.asyncio
+async def test_server_rx_timestamp(mocker):
+    """Test whether queued packets carry their kernel arrival time"""
+    if not aiobfd.transport.sys.platform.startswith('linux'):
+        pytest.skip('Kernel receive timestamps require Linux')
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    transport = mocker.Mock()
+    transport.get_extra_info.return_value = sock
+    server = aiobfd.transport.Server(aiobfd.rxqueue.RxQueue())
+    server.connection_made(transport)
+    assert server.timestamps
+    # The kernel switches timestamping on from a workqueue
+    await asyncio.sleep(0.05)
+
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.sendto(b'data', sock.getsockname())
+    await asyncio.sleep(0.05)
+    server.datagram_received(*sock.recvfrom(1024))
+    data, source, rx_time, _ = await server.rx_queue.get()
+    assert (data, source) == (b'data', '127.0.0.1')
+    assert 0.04 < time.monotonic() - rx_time < 1
+    client.close()
+    sock.close()
+
+
+def test_server_no_timestamps(mocker):
+    """Test whether failing to enable timestamps only logs a warning"""
+    mocker.patch('aiobfd.transport.enable_timestamps', side_effect=OSError)
+    mocker.patch('aiobfd.transport.log')
+    server = aiobfd.transport.Server(aiobfd.rxqueue.RxQueue())
+    server.connection_made(mocker.Mock())
+    assert not server.timestamps
+    aiobfd.transport.log.warning.assert_called_once_with(
+        'Kernel receive timestamps unavailable, using the processing time '
+        'instead: %s', mocker.ANY)
+
+
+def test_apply_socket_profile():
+    """Test whether the socket profile is applied"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    profile = aiobfd.transport.SOCKET_PROFILE
+    assert aiobfd.transport.apply_socket_profile(sock, profile) == []
+    assert sock.getsockopt(socket.IPPROTO_IP, socket.IP_TOS) == 0xc0
+    if aiobfd.transport.sys.platform.startswith('linux'):
+        assert sock.getsockopt(socket.SOL_SOCKET,
+                               aiobfd.transport.SO_PRIORITY) == 6
+    sock.close()
+
+
+def test_apply_socket_profile_buffers():
+    """Test whether socket buffers only ever grow"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    profile = aiobfd.transport.SOCKET_PROFILE
+    default = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    aiobfd.transport.apply_socket_profile(sock, profile, rcvbuf=1024)
+    assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) == default
+    aiobfd.transport.apply_socket_profile(sock, profile, rcvbuf=default * 2)
+    assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) > default
+    sock.close()
+
+
+def test_buffer_size():
+    """Test whether buffers are sized for the configured buffer time"""
+    profile = dict(aiobfd.transport.SOCKET_PROFILE, buffer_time=0.5)
+    assert aiobfd.transport.buffer_size(1000, profile) == \
+        500 * aiobfd.transport.SKB_TRUESIZE
+
+
+def test_udp_socket_stats():
+    """Test whether the kernel socket counters are read"""
+    if not aiobfd.transport.sys.platform.startswith('linux'):
+        pytest.skip('Kernel socket counters require Linux')
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.sendto(b'data', sock.getsockname())
+    stats = aiobfd.transport.udp_socket_stats()[
+        aiobfd.transport.socket_inode(sock)]
+    assert stats['drops'] == 0
+    assert stats['rx_queue'] > 0
+    sock.close()